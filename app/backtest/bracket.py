@@ -0,0 +1,326 @@
+# app/backtest/bracket.py
+from __future__ import annotations
+
+import os
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from app.backtest.engine import BAR_MINUTES, SignalRun
+from app.data.bar_file import BarColumns, _parse_ns
+
+# Simulador de brackets TP/SL con la semántica de trades.log (ORDER_SENT):
+#   entrada market -> fill_price; tp_price = fill ± tp_points, sl_price = fill ∓ sl_points
+#   (LONG: TP arriba / SL abajo; SHORT al revés). TP es limit, SL es stop.
+# - Cada entrada se simula sola (el trader no cancela brackets por señales nuevas).
+# - Si la vela abre más allá de un nivel (gap) se llena a la apertura: mejor precio para el
+#   limit del TP, peor para el stop del SL.
+# - Vela ambigua (ambos niveles dentro del rango): se resuelve con velas más finas si se
+#   pasan; si no (o si también empatan), con la regla BRACKET_AMBIGUOUS.
+# - Sin salida dentro de BRACKET_MAX_HOLD_BARS: queda OPEN y se valúa al cierre de la última vela.
+
+NS = 1_000_000_000
+
+TP, SL, OPEN = 1, -1, 0
+OUTCOME_NAMES = {TP: "TP", SL: "SL", OPEN: "OPEN"}
+
+# sl_first: pesimista (default) | tp_first: optimista | nearest: primero el nivel más cercano a la apertura
+AMBIGUOUS_RULES = ("sl_first", "tp_first", "nearest")
+BRACKET_AMBIGUOUS: str = os.getenv("BRACKET_AMBIGUOUS", "sl_first").lower()
+BRACKET_MAX_HOLD_BARS: int = int(os.getenv("BRACKET_MAX_HOLD_BARS", "384"))   # 4 días de velas de 15m
+
+# USD por punto (contrato) para pasar puntos a dinero; POINT_VALUE_<SYM> lo pisa
+POINT_VALUE: Dict[str, float] = {"MNQ": 2.0, "NQ": 20.0, "MES": 5.0, "ES": 50.0}
+
+
+def _env_num(*names: str) -> Optional[float]:
+    for name in names:
+        raw = os.getenv(name, "").split("#")[0].strip()
+        if raw:
+            try:
+                return float(raw)
+            except ValueError:
+                pass
+    return None
+
+
+@dataclass(frozen=True)
+class BracketSpec:
+    tp_points: float
+    sl_points: float
+    qty: int = 1
+    point_value: float = 1.0
+
+
+def bracket_spec(symbol: str) -> BracketSpec:
+    """TP/SL/tamaño por símbolo desde el .env del trader (TP_POINTS_<SYM>, SL_POINTS_<SYM>, ORDER_SIZE_<SYM>)."""
+    sym = symbol.upper()
+    tp = _env_num(f"TP_POINTS_{sym}", f"TP_{sym}")
+    sl = _env_num(f"SL_POINTS_{sym}", f"SL_{sym}")
+    if tp is None or sl is None:
+        raise ValueError(f"faltan TP_POINTS_{sym} / SL_POINTS_{sym} en el entorno")
+    qty = _env_num(f"ORDER_SIZE_{sym}", f"QTY_{sym}", "ORDER_SIZE") or 1
+    pv = _env_num(f"POINT_VALUE_{sym}")
+    return BracketSpec(tp, sl, int(qty), POINT_VALUE.get(sym, 1.0) if pv is None else pv)
+
+
+def bracket_prices(fill: Union[float, np.ndarray], side: Union[int, np.ndarray],
+                   tp_points: Union[float, np.ndarray], sl_points: Union[float, np.ndarray]):
+    """(tp_price, sl_price) como los registra el trader en trades.log."""
+    return fill + side * tp_points, fill - side * sl_points
+
+
+# ------------- Entradas -------------
+
+@dataclass
+class Entries:
+    bar: np.ndarray            # int64: índice (en las velas) de la vela donde se llena la entrada
+    side: np.ndarray           # int8: 1 LONG, -1 SHORT
+    fill: np.ndarray           # float64: fill_price
+    t: np.ndarray              # int64 epoch-ns del fill (para recortar velas finas en la vela de entrada)
+
+    def __len__(self) -> int:
+        return int(self.bar.shape[0])
+
+
+def entries_from_signals(run: SignalRun, cols: BarColumns, bar_minutes: int = BAR_MINUTES) -> Entries:
+    """
+    Señal al cierre de la vela -> market en la apertura de la vela siguiente de `cols`
+    (como el trader en vivo). `cols` es la serie completa, sin filtro de sesión: con
+    CHART_SESSION=RTH la señal sale de velas RTH pero el bracket vive también fuera de hora.
+    """
+    idx = run.entries()
+    close_t = run.t[idx] + int(bar_minutes) * 60 * NS
+    bar = np.searchsorted(cols.t, close_t, side="left")
+    ok = bar < len(cols)
+    bar = bar[ok]
+    return Entries(bar=bar.astype("int64"), side=run.signal[idx[ok]].astype("int8"),
+                   fill=cols.o[bar].astype("float64"), t=cols.t[bar].astype("int64"))
+
+
+def load_trades(path: str = "trades.log", symbol: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Eventos ORDER_SENT de trades.log (JSONL), opcionalmente de un símbolo."""
+    out: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ev = json.loads(line)
+            except ValueError:
+                continue
+            if ev.get("event") != "ORDER_SENT" or ev.get("fill_price") is None:
+                continue
+            if symbol and str(ev.get("symbol", "")).upper() != symbol.upper():
+                continue
+            out.append(ev)
+    return out
+
+
+def entries_from_trades(trades: Sequence[Dict[str, Any]], cols: BarColumns) -> Entries:
+    """Entradas reales del log: vela que contiene `ts` del envío, fill_price registrado."""
+    ts = np.asarray([_parse_ns(tr["ts"]) for tr in trades], dtype="int64")
+    bar = np.searchsorted(cols.t, ts, side="right") - 1
+    ok = bar >= 0
+    side = np.asarray([1 if tr["signal"] == "LONG" else -1 for tr in trades], dtype="int8")
+    fill = np.asarray([float(tr["fill_price"]) for tr in trades], dtype="float64")
+    return Entries(bar=bar[ok].astype("int64"), side=side[ok], fill=fill[ok], t=ts[ok])
+
+
+# ------------- Simulación -------------
+
+@dataclass
+class BracketResult:
+    """Resultado por (entrada, tp, sl): arrays de shape (E, T, S)."""
+    entries: Entries
+    tp_points: np.ndarray      # (T,)
+    sl_points: np.ndarray      # (S,)
+    outcome: np.ndarray        # int8: TP / SL / OPEN
+    exit_bar: np.ndarray       # int32: índice de la vela de salida
+    exit_price: np.ndarray
+    pnl_points: np.ndarray     # por contrato, ya con el signo del lado
+    ambiguous: int = 0         # celdas resueltas por regla (ni la vela ni las finas alcanzaron)
+
+    def total_points(self) -> np.ndarray:
+        return self.pnl_points.sum(axis=0)
+
+    def win_rate(self) -> np.ndarray:
+        n = max(len(self.entries), 1)
+        return (self.outcome == TP).sum(axis=0) / n
+
+    def to_frame(self, cols: BarColumns, ti: int = 0, si: int = 0) -> pd.DataFrame:
+        """Trades de una combinación (tp_points[ti], sl_points[si])."""
+        e = self.entries
+        tp_px, sl_px = bracket_prices(e.fill, e.side, self.tp_points[ti], self.sl_points[si])
+        return pd.DataFrame({
+            "entry_time": pd.to_datetime(e.t, utc=True),
+            "side": np.where(e.side > 0, "LONG", "SHORT"),
+            "fill_price": e.fill,
+            "tp_price": tp_px,
+            "sl_price": sl_px,
+            "exit_time": pd.to_datetime(cols.t[self.exit_bar[:, ti, si]], utc=True),
+            "exit_price": self.exit_price[:, ti, si],
+            "outcome": [OUTCOME_NAMES[int(o)] for o in self.outcome[:, ti, si]],
+            "pnl_points": self.pnl_points[:, ti, si],
+        })
+
+
+def _first_hits(curve: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    # curve: (E, H) excursión acumulada (monótona no decreciente por fila) -> primer k con curve >= level
+    out = np.empty((curve.shape[0], levels.shape[0]), dtype="int32")
+    for i in range(curve.shape[0]):
+        out[i] = np.searchsorted(curve[i], levels, side="left")
+    return out
+
+
+def simulate(cols: BarColumns, entries: Entries,
+             tp_points: Union[float, Sequence[float]], sl_points: Union[float, Sequence[float]],
+             ambiguous: Optional[str] = None, fine: Optional[BarColumns] = None,
+             max_hold_bars: Optional[int] = None) -> BracketResult:
+    """
+    Resuelve cada entrada para todas las combinaciones tp_points × sl_points de una vez.
+    - Las excursiones a favor/en contra (máximo/mínimo acumulado desde la entrada) se
+      calculan una vez por entrada; cada nivel es un searchsorted sobre esa curva.
+    - `fine`: velas más finas (p.ej. 1m) para desempatar las velas ambiguas.
+    """
+    rule = (ambiguous or BRACKET_AMBIGUOUS).lower()
+    if rule not in AMBIGUOUS_RULES:
+        raise ValueError(f"regla de vela ambigua inválida: {rule} (opciones: {AMBIGUOUS_RULES})")
+    H = max(1, int(max_hold_bars or BRACKET_MAX_HOLD_BARS))
+    tps = np.atleast_1d(np.asarray(tp_points, dtype="float64"))
+    sls = np.atleast_1d(np.asarray(sl_points, dtype="float64"))
+    n = len(cols)
+
+    # ventanas (E, H) desde la vela de entrada; fuera de la serie no toca ningún nivel
+    idx = entries.bar[:, None] + np.arange(H)[None, :]
+    valid = idx < n
+    idx_c = np.minimum(idx, max(n - 1, 0))
+    fill = entries.fill[:, None]
+    side = entries.side.astype("float64")[:, None]
+    up = np.maximum.accumulate(np.where(valid, cols.h[idx_c], -np.inf), axis=1) - fill
+    down = fill - np.minimum.accumulate(np.where(valid, cols.l[idx_c], np.inf), axis=1)
+    fav = np.where(side > 0, up, down)
+    adv = np.where(side > 0, down, up)
+
+    k_tp = _first_hits(fav, tps)[:, :, None]                               # (E, T, 1)
+    k_sl = _first_hits(adv, sls)[:, None, :]                               # (E, 1, S)
+    k_tp, k_sl = np.broadcast_arrays(k_tp, k_sl)
+
+    s3 = side[:, :, None]
+    f3 = fill[:, :, None]
+    tp_px, sl_px = bracket_prices(f3, s3, tps[None, :, None], sls[None, None, :])
+
+    k = np.minimum(k_tp, k_sl)
+    hit = k < H
+    bar = np.where(hit, entries.bar[:, None, None] + k, 0)
+    # apertura de la vela de salida; en la vela de entrada el precio de partida es el fill
+    open_k = np.where(k == 0, f3, cols.o[np.minimum(bar, max(n - 1, 0))])
+    tp_gap = hit & (s3 * (open_k - f3) >= tps[None, :, None])
+    sl_gap = hit & (s3 * (f3 - open_k) >= sls[None, None, :])
+
+    tp_first = k_tp < k_sl
+    amb = hit & (k_tp == k_sl) & ~tp_gap & ~sl_gap
+    n_amb = 0
+    if amb.any():
+        first, n_amb = _resolve_ambiguous(amb, cols, entries, fine, rule, tps, sls, k_tp, open_k, tp_px, sl_px)
+        tp_first |= amb & first
+    tp_first |= tp_gap & (k_tp == k_sl)
+
+    outcome = np.where(~hit, OPEN, np.where(tp_first, TP, SL)).astype("int8")
+    last = np.minimum(entries.bar + H - 1, n - 1)[:, None, None]
+    exit_bar = np.where(hit, bar, last).astype("int32")
+    exit_price = np.where(outcome == TP, np.where(tp_gap, open_k, tp_px),
+                          np.where(outcome == SL, np.where(sl_gap, open_k, sl_px),
+                                   cols.c[exit_bar]))
+    pnl = s3 * (exit_price - f3)
+    return BracketResult(entries=entries, tp_points=tps, sl_points=sls, outcome=outcome,
+                         exit_bar=exit_bar, exit_price=exit_price, pnl_points=pnl, ambiguous=n_amb)
+
+
+def _resolve_ambiguous(amb: np.ndarray, cols: BarColumns, entries: Entries, fine: Optional[BarColumns],
+                       rule: str, tps: np.ndarray, sls: np.ndarray, k_tp: np.ndarray,
+                       open_k: np.ndarray, tp_px: np.ndarray, sl_px: np.ndarray) -> Tuple[np.ndarray, int]:
+    """True donde el TP se toca primero en las celdas ambiguas (velas finas, si no la regla) y cuántas decidió la regla."""
+    tp_px, sl_px = np.broadcast_arrays(tp_px, sl_px)
+    ei, ti, si = np.nonzero(amb)
+    # regla por defecto para todas; las velas finas la pisan donde deciden
+    if rule == "tp_first":
+        first = np.ones(ei.shape[0], dtype=bool)
+    elif rule == "nearest":
+        o = open_k[ei, ti, si]
+        first = np.abs(tp_px[ei, ti, si] - o) <= np.abs(sl_px[ei, ti, si] - o)
+    else:
+        first = np.zeros(ei.shape[0], dtype=bool)
+
+    by_rule = np.ones(ei.shape[0], dtype=bool)
+    if fine is not None and len(fine):
+        bar_ns = int(np.median(np.diff(cols.t))) if len(cols) > 1 else 0
+        # agrupar las celdas por (entrada, vela): las finas de esa vela se recorren una vez
+        cells = np.stack([ei, k_tp[ei, ti, si]], axis=1)
+        uniq, inv = np.unique(cells, axis=0, return_inverse=True)
+        order = np.argsort(inv.reshape(-1), kind="stable")
+        bounds = np.searchsorted(inv.reshape(-1)[order], np.arange(len(uniq) + 1))
+        for u, (e, k) in enumerate(uniq):
+            t0 = int(cols.t[entries.bar[e] + k])
+            # en la vela de entrada sólo cuentan las finas desde la que contiene el fill
+            start = int(entries.t[e]) if k == 0 else t0
+            lo = max(int(np.searchsorted(fine.t, start, side="right")) - 1,
+                     int(np.searchsorted(fine.t, t0, side="left")))
+            hi = int(np.searchsorted(fine.t, t0 + bar_ns, side="left"))
+            if hi <= lo:
+                continue
+            f = entries.fill[e]
+            up = np.maximum.accumulate(fine.h[lo:hi]) - f
+            dn = f - np.minimum.accumulate(fine.l[lo:hi])
+            fav, adv = (up, dn) if entries.side[e] > 0 else (dn, up)
+            sel = order[bounds[u]:bounds[u + 1]]
+            a = np.searchsorted(fav, tps[ti[sel]], side="left")
+            b = np.searchsorted(adv, sls[si[sel]], side="left")
+            decided = a != b
+            first[sel[decided]] = a[decided] < b[decided]
+            by_rule[sel[decided]] = False
+    out = np.zeros(amb.shape, dtype=bool)
+    out[ei, ti, si] = first
+    return out, int(by_rule.sum())
+
+
+def main() -> None:
+    import argparse
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    from app.backtest.engine import load_history, run_signals
+
+    ap = argparse.ArgumentParser(description="Simula los brackets TP/SL sobre el histórico cacheado")
+    ap.add_argument("symbol", help="MNQ | ES (TP_POINTS_<SYM> / SL_POINTS_<SYM>)")
+    ap.add_argument("contract_id", help="contractId con histórico en BAR_CACHE_DIR")
+    ap.add_argument("--root", default=None)
+    ap.add_argument("--fine-minutes", type=int, default=0, help="velas finas cacheadas para desempatar (p.ej. 1)")
+    ap.add_argument("--rule", default=None, help=f"vela ambigua: {' | '.join(AMBIGUOUS_RULES)}")
+    ap.add_argument("--trades", default=None, help="simular las entradas de trades.log en vez de las señales")
+    args = ap.parse_args()
+
+    spec = bracket_spec(args.symbol)
+    cols = load_history(args.contract_id, args.root)
+    fine = load_history(args.contract_id, args.root, args.fine_minutes) if args.fine_minutes else None
+    if args.trades:
+        entries = entries_from_trades(load_trades(args.trades, args.symbol), cols)
+    else:
+        entries = entries_from_signals(run_signals(cols), cols)
+    res = simulate(cols, entries, spec.tp_points, spec.sl_points, args.rule, fine)
+    df = res.to_frame(cols)
+    usd = df["pnl_points"].sum() * spec.point_value * spec.qty
+    print(df.to_string(index=False))
+    print(f"[Bracket] {args.symbol} tp={spec.tp_points} sl={spec.sl_points}: {len(df)} trades, "
+          f"win={float(res.win_rate()[0, 0]) * 100:.1f}% pts={df['pnl_points'].sum():.2f} "
+          f"usd={usd:.2f} (ambiguas por regla: {res.ambiguous})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# app/backtest/engine.py
+from __future__ import annotations
+
+import os
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.data.bar_file import BarColumns, open_bars
+from app.services import strategy
+from app.services.market_monitor import (
+    BAR_MINUTES, CHART_SESSION, EMA200_SMOOTH_LENGTH, EMA200_SMOOTH_TYPE, EPS, SESSION_CAL,
+)
+
+# Backtest vectorizado de cross-50-with-bias: las mismas reglas que MarketMonitor
+# (app/services/strategy.py) aplicadas a toda la historia de una vez.
+# Diferencia esperable con el vivo: el monitor ancla las EMAs en su semilla (WARMUP_BARS),
+# acá se anclan en la primera vela del histórico; tras unas ~1000 velas convergen.
+
+
+@dataclass
+class SignalRun:
+    """Serie completa (ya filtrada por sesión) con EMAs, señal y color por vela."""
+    t: np.ndarray              # int64 epoch-ns UTC (apertura de la vela)
+    o: np.ndarray
+    h: np.ndarray
+    l: np.ndarray
+    close: np.ndarray
+    ema50: np.ndarray
+    ema200_base: np.ndarray
+    ema200: np.ndarray         # mostrada (suavizado opcional)
+    signal: np.ndarray         # int8: strategy.LONG / SHORT / NO_SIGNAL
+    color: np.ndarray          # int8: strategy.GREEN / YELLOW / RED / GRAY
+
+    def __len__(self) -> int:
+        return int(self.t.shape[0])
+
+    def entries(self) -> np.ndarray:
+        """Índices de las velas con señal (la señal se opera al cierre de esa vela)."""
+        return np.flatnonzero(self.signal)
+
+    def to_frame(self, only_signals: bool = False) -> pd.DataFrame:
+        idx = self.entries() if only_signals else slice(None)
+        return pd.DataFrame({
+            "datetime": pd.to_datetime(self.t[idx], utc=True),
+            "close": self.close[idx],
+            "ema50": self.ema50[idx],
+            "ema200": self.ema200[idx],
+            "color": [strategy.COLOR_NAMES[int(c)] for c in self.color[idx]],
+            "signal": [strategy.SIGNAL_NAMES[int(s)] for s in self.signal[idx]],
+        })
+
+
+def signals_from_arrays(close: np.ndarray, ema50: np.ndarray, ema200_base: np.ndarray,
+                        eps: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Señal y color de cada vela contra la anterior (la primera vela no tiene prev)."""
+    eps = EPS if eps is None else float(eps)
+    n = close.shape[0]
+    signal = np.zeros(n, dtype="int8")
+    color = np.full(n, strategy.GRAY, dtype="int8")
+    if n >= 2:
+        signal[1:] = strategy.cross50_with_bias(close[:-1], ema50[:-1], close[1:], ema50[1:],
+                                                ema200_base[1:], eps)
+        color[1:] = strategy.zone_color(close[:-1], ema50[:-1], ema200_base[:-1],
+                                        close[1:], ema50[1:], ema200_base[1:])
+    return signal, color
+
+
+def run_signals(cols: BarColumns, eps: Optional[float] = None, session: Optional[str] = None,
+                smooth_type: Optional[str] = None, smooth_length: Optional[int] = None,
+                emas: Optional[Dict[str, np.ndarray]] = None) -> SignalRun:
+    """
+    Todas las señales históricas de una serie de velas cerradas.
+    - Defaults = config del vivo (EMA_CROSS_EPS, CHART_SESSION, EMA200_SMOOTH_*).
+    - `emas`: EMAs ya calculadas sobre la serie filtrada (para reutilizar entre corridas).
+    """
+    cols = strategy.session_filter(cols, session or CHART_SESSION, SESSION_CAL)
+    if emas is None:
+        emas = strategy.compute_emas(
+            cols.c,
+            EMA200_SMOOTH_TYPE if smooth_type is None else smooth_type,
+            EMA200_SMOOTH_LENGTH if smooth_length is None else int(smooth_length),
+        )
+    signal, color = signals_from_arrays(cols.c, emas["ema50"], emas["ema200_base"], eps)
+    return SignalRun(t=cols.t, o=cols.o, h=cols.h, l=cols.l, close=cols.c,
+                     ema50=emas["ema50"], ema200_base=emas["ema200_base"], ema200=emas["ema200"],
+                     signal=signal, color=color)
+
+
+def load_history(contract_id: str, root: Optional[str] = None,
+                 bar_minutes: int = BAR_MINUTES) -> BarColumns:
+    """Histórico cacheado por BarStore (BAR_CACHE_DIR), memmap de sólo lectura."""
+    return open_bars(root or os.getenv("BAR_CACHE_DIR", "bar_cache"), contract_id, 2, bar_minutes)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Backtest vectorizado de cross-50-with-bias")
+    ap.add_argument("contract_id", help="contractId con histórico en BAR_CACHE_DIR")
+    ap.add_argument("--root", default=None, help="directorio del cache (default BAR_CACHE_DIR)")
+    ap.add_argument("--session", default=None, help="ETH | RTH (default CHART_SESSION)")
+    ap.add_argument("--eps", type=float, default=None, help="tolerancia del cruce (default EMA_CROSS_EPS)")
+    ap.add_argument("--last", type=int, default=20, help="señales a listar")
+    args = ap.parse_args()
+
+    cols = load_history(args.contract_id, args.root)
+    t0 = time.perf_counter()
+    run = run_signals(cols, eps=args.eps, session=args.session)
+    dt = (time.perf_counter() - t0) * 1000.0
+    n_long = int((run.signal == strategy.LONG).sum())
+    n_short = int((run.signal == strategy.SHORT).sum())
+    print(f"[Backtest] {args.contract_id}: {len(run)} velas, {n_long} LONG / {n_short} SHORT en {dt:.1f}ms")
+    if args.last > 0:
+        print(run.to_frame(only_signals=True).tail(args.last).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
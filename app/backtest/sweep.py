@@ -0,0 +1,300 @@
+# app/backtest/sweep.py
+from __future__ import annotations
+
+import os
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.backtest import bracket
+from app.backtest.engine import BAR_MINUTES, CHART_SESSION, EPS, SESSION_CAL, SignalRun, signals_from_arrays
+from app.data.bar_file import BarColumns
+from app.indicators.ema import ema_batch
+from app.services import strategy
+
+# Barrido de parámetros en un pool de procesos:
+# - las velas se publican una vez en shared memory (sólo lectura) y cada worker las mapea
+#   al arrancar: nada de pickles de arrays por tarea;
+# - una tarea = (ema rápida, ema lenta, eps) y resuelve TODO el grid TP×SL en una llamada
+#   vectorizada del simulador de brackets;
+# - cada worker cachea las EMAs por período: la EMA200 se calcula una vez por proceso.
+# EMA200_SMOOTH_LENGTH no se barre: el suavizado es sólo de display, no cambia señales.
+
+SWEEP_WORKERS: int = int(os.getenv("SWEEP_WORKERS", "0"))       # 0 = os.cpu_count()
+
+METRICS = ("trades", "win_rate", "total_points", "avg_points", "profit_factor",
+           "max_drawdown", "sharpe")
+
+_FIELDS = ("t", "o", "h", "l", "c")
+
+
+# ------------- Velas en shared memory -------------
+
+@dataclass(frozen=True)
+class SharedBarsRef:
+    """Lo único que viaja a los workers: nombre del bloque y tamaños."""
+    name: str
+    n: int
+    n_session: int
+
+
+class SharedBars:
+    """
+    Columnas t/o/h/l/c de la serie completa + índices de las velas de sesión en un bloque
+    de shared memory. El proceso que la crea es el dueño (close() libera y borra).
+    """
+
+    def __init__(self, cols: BarColumns, session_idx: np.ndarray) -> None:
+        n, m = len(cols), int(session_idx.shape[0])
+        self._shm = shared_memory.SharedMemory(create=True, size=max(8 * (5 * n + m), 8))
+        self.ref = SharedBarsRef(self._shm.name, n, m)
+        views = _views(self._shm.buf, n, m)
+        for k in _FIELDS:
+            views[k][:] = getattr(cols, k)
+        views["session"][:] = session_idx
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedBars":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _views(buf, n: int, m: int) -> Dict[str, np.ndarray]:
+    out: Dict[str, np.ndarray] = {}
+    for i, k in enumerate(_FIELDS):
+        out[k] = np.ndarray((n,), dtype="<i8" if k == "t" else "<f8", buffer=buf, offset=8 * n * i)
+    out["session"] = np.ndarray((m,), dtype="<i8", buffer=buf, offset=8 * n * 5)
+    return out
+
+
+# ------------- Worker -------------
+
+class _Worker:
+    """Estado por proceso: velas mapeadas (sólo lectura) y cache de EMAs por período."""
+
+    def __init__(self, ref: SharedBarsRef, bar_minutes: int) -> None:
+        self._shm = shared_memory.SharedMemory(name=ref.name)
+        v = _views(self._shm.buf, ref.n, ref.n_session)
+        for a in v.values():
+            a.flags.writeable = False
+        self.cols = BarColumns(v["t"], v["o"], v["h"], v["l"], v["c"], np.zeros(0))
+        self.session = v["session"]
+        self.closes = self.cols.c[self.session]          # serie de señales (filtrada)
+        self.bar_minutes = bar_minutes
+        self.emas: Dict[int, np.ndarray] = {}
+
+    def ema(self, period: int) -> np.ndarray:
+        e = self.emas.get(period)
+        if e is None:
+            e = self.emas[period] = ema_batch(self.closes, [period])[0]
+        return e
+
+    def simulate(self, fast: int, slow: int, eps: float, tps: np.ndarray, sls: np.ndarray,
+                 rule: Optional[str], max_hold_bars: Optional[int]) -> bracket.BracketResult:
+        e_fast, e_slow = self.ema(fast), self.ema(slow)
+        signal, color = signals_from_arrays(self.closes, e_fast, e_slow, eps)
+        s = self.session
+        c = self.cols
+        run = SignalRun(t=c.t[s], o=c.o[s], h=c.h[s], l=c.l[s], close=self.closes,
+                        ema50=e_fast, ema200_base=e_slow, ema200=e_slow, signal=signal, color=color)
+        entries = bracket.entries_from_signals(run, self.cols, self.bar_minutes)
+        return bracket.simulate(self.cols, entries, tps, sls, rule, None, max_hold_bars)
+
+
+_WORKER: Optional[_Worker] = None
+
+
+def _init_worker(ref: SharedBarsRef, bar_minutes: int) -> None:
+    global _WORKER
+    _WORKER = _Worker(ref, bar_minutes)
+
+
+def _metrics_task(args: Tuple) -> Tuple[Tuple[int, int, float], Dict[str, np.ndarray]]:
+    fast, slow, eps = args[:3]
+    res = _WORKER.simulate(*args)
+    return (fast, slow, eps), grid_metrics(res.pnl_points, res.outcome)
+
+
+def _trades_task(args: Tuple) -> Tuple[Tuple[int, int, float], Dict[str, np.ndarray]]:
+    # trades completos (E, T, S) de una combinación: para walk-forward
+    fast, slow, eps = args[:3]
+    res = _WORKER.simulate(*args)
+    return (fast, slow, eps), {
+        "entry_t": res.entries.t, "side": res.entries.side,
+        "exit_t": _WORKER.cols.t[res.exit_bar], "outcome": res.outcome, "pnl": res.pnl_points,
+    }
+
+
+def map_combos(cols: BarColumns, combos: Sequence[Tuple[int, int, float]], tps: np.ndarray,
+               sls: np.ndarray, task=_metrics_task, session: Optional[str] = None,
+               ambiguous: Optional[str] = None, max_hold_bars: Optional[int] = None,
+               workers: Optional[int] = None, bar_minutes: int = BAR_MINUTES) -> Iterator[Tuple]:
+    """Corre `task` por combinación (fast, slow, eps) en el pool, con las velas en shared memory."""
+    workers = int(workers or SWEEP_WORKERS or os.cpu_count() or 1)
+    with SharedBars(cols, session_index(cols, session)) as shared:
+        tasks = [(int(f), int(s), float(e), tps, sls, ambiguous, max_hold_bars) for f, s, e in combos]
+        # orden de tareas por período lento: cada worker reutiliza su EMA cacheada
+        tasks.sort(key=lambda a: (a[1], a[0], a[2]))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared.ref, bar_minutes)) as pool:
+            yield from pool.map(task, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+
+# ------------- Métricas -------------
+
+def grid_metrics(pnl: np.ndarray, outcome: np.ndarray,
+                 valid: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Métricas por combinación (T, S) a partir del pnl por trade (E, T, S), en orden de entrada.
+    `valid` (E, T, S) excluye trades (p.ej. los que salen fuera de la ventana de train).
+    """
+    if valid is None:
+        valid = np.ones(pnl.shape, dtype=bool)
+    pnl = np.where(valid, pnl, 0.0)
+    n = valid.sum(axis=0)
+    total = pnl.sum(axis=0)
+    gains = np.where(pnl > 0, pnl, 0.0).sum(axis=0)
+    losses = -np.where(pnl < 0, pnl, 0.0).sum(axis=0)
+    equity = np.cumsum(pnl, axis=0)
+    peak = np.maximum.accumulate(np.concatenate([np.zeros((1,) + pnl.shape[1:]), equity]), axis=0)[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(n > 0, total / n, 0.0)
+        std = np.sqrt(np.where(n > 1, (np.where(valid, pnl - mean, 0.0) ** 2).sum(axis=0) / n, 0.0))
+        return {
+            "trades": n.astype("int64"),
+            "win_rate": np.where(n > 0, ((outcome == bracket.TP) & valid).sum(axis=0) / np.maximum(n, 1), 0.0),
+            "total_points": total,
+            "avg_points": mean,
+            "profit_factor": np.where(losses > 0, gains / losses, np.where(gains > 0, np.inf, 0.0)),
+            "max_drawdown": (peak - equity).max(axis=0) if pnl.shape[0] else np.zeros(pnl.shape[1:]),
+            "sharpe": np.where(std > 0, mean / std * np.sqrt(n), 0.0),
+        }
+
+
+def rank(table: pd.DataFrame, by: Sequence[str] = ("total_points",),
+         ascending: Optional[Sequence[bool]] = None) -> pd.DataFrame:
+    """Ordena por las métricas elegidas (desc salvo max_drawdown); agrega la columna rank."""
+    by = list(by)
+    unknown = [m for m in by if m not in table.columns]
+    if unknown:
+        raise ValueError(f"métricas desconocidas: {unknown} (opciones: {list(METRICS)})")
+    if ascending is None:
+        ascending = [m == "max_drawdown" for m in by]
+    out = table.sort_values(by, ascending=list(ascending), kind="stable").reset_index(drop=True)
+    out.insert(0, "rank", np.arange(1, len(out) + 1))
+    return out
+
+
+# ------------- Barrido -------------
+
+def session_index(cols: BarColumns, session: Optional[str] = None) -> np.ndarray:
+    """Índices de las velas que entran en la serie de señales (filtro de sesión del monitor)."""
+    return strategy.session_index(cols.t, session or CHART_SESSION, SESSION_CAL)
+
+
+def param_combos(fast: Sequence[int], slow: Sequence[int], eps: Sequence[float]) -> List[Tuple[int, int, float]]:
+    """fast × slow × eps sin las combinaciones con fast >= slow."""
+    return [(int(f), int(s), float(e)) for f, s, e in itertools.product(fast, slow, eps) if int(f) < int(s)]
+
+
+def _bracket_grid(tp_points: Optional[Sequence[float]], sl_points: Optional[Sequence[float]],
+                  symbol: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # TP/SL no indicados: los del trader en vivo para `symbol` (TP_POINTS_<SYM> / SL_POINTS_<SYM>)
+    if tp_points is None or sl_points is None:
+        if not symbol:
+            raise ValueError("sin tp_points/sl_points hace falta `symbol` (TP_POINTS_<SYM> / SL_POINTS_<SYM>)")
+        spec = bracket.bracket_spec(symbol)
+        tp_points = (spec.tp_points,) if tp_points is None else tp_points
+        sl_points = (spec.sl_points,) if sl_points is None else sl_points
+    return np.asarray(tp_points, dtype="float64"), np.asarray(sl_points, dtype="float64")
+
+
+def run_sweep(cols: BarColumns, fast: Sequence[int] = (50,), slow: Sequence[int] = (200,),
+              eps: Sequence[float] = (EPS,), tp_points: Optional[Sequence[float]] = None,
+              sl_points: Optional[Sequence[float]] = None, rank_by: Sequence[str] = ("total_points",),
+              session: Optional[str] = None, ambiguous: Optional[str] = None,
+              max_hold_bars: Optional[int] = None, workers: Optional[int] = None,
+              bar_minutes: int = BAR_MINUTES, symbol: Optional[str] = None) -> pd.DataFrame:
+    """
+    Barre fast × slow × eps × tp × sl y devuelve una tabla (una fila por combinación)
+    rankeada por `rank_by`. Combinaciones con fast >= slow se descartan.
+    TP/SL sin indicar = los del .env para `symbol` (bracket.bracket_spec).
+    """
+    tps, sls = _bracket_grid(tp_points, sl_points, symbol)
+    combos = param_combos(fast, slow, eps)
+    cols_out: Dict[str, List[np.ndarray]] = {k: [] for k in ("fast", "slow", "eps", "tp_points", "sl_points") + METRICS}
+    tp_g, sl_g = (g.ravel() for g in np.meshgrid(tps, sls, indexing="ij"))
+    for (f, s, e), m in map_combos(cols, combos, tps, sls, _metrics_task, session, ambiguous,
+                                   max_hold_bars, workers, bar_minutes):
+        cols_out["fast"].append(np.full(tp_g.shape[0], f))
+        cols_out["slow"].append(np.full(tp_g.shape[0], s))
+        cols_out["eps"].append(np.full(tp_g.shape[0], e))
+        cols_out["tp_points"].append(tp_g)
+        cols_out["sl_points"].append(sl_g)
+        for k in METRICS:
+            cols_out[k].append(np.asarray(m[k]).ravel())
+    table = pd.DataFrame({k: (np.concatenate(v) if v else np.empty(0)) for k, v in cols_out.items()})
+    return rank(table, rank_by)
+
+
+def _floats(raw: str) -> List[float]:
+    # "2:20:2" (inicio:fin:paso, fin incluido) o "4,8,12"
+    if ":" in raw:
+        a, b, step = (float(x) for x in raw.split(":"))
+        return [float(x) for x in np.arange(a, b + step / 2, step)]
+    return [float(x) for x in raw.split(",") if x.strip()]
+
+
+def main() -> None:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    from app.backtest.engine import load_history
+
+    ap = argparse.ArgumentParser(description="Barrido de parámetros (EMAs, EPS, TP/SL) en paralelo")
+    ap.add_argument("contract_id", help="contractId con histórico en BAR_CACHE_DIR")
+    ap.add_argument("--root", default=None)
+    ap.add_argument("--fast", default="50", help="períodos EMA rápida, p.ej. 20:60:10")
+    ap.add_argument("--slow", default="200", help="períodos EMA lenta, p.ej. 100:300:50")
+    ap.add_argument("--eps", default=str(EPS))
+    ap.add_argument("--symbol", default=None, help="MNQ | ES: TP/SL por defecto de TP_POINTS_<SYM> / SL_POINTS_<SYM>")
+    ap.add_argument("--tp", default=None, help="TP en puntos, p.ej. 4:40:2 (default el de --symbol)")
+    ap.add_argument("--sl", default=None, help="SL en puntos (default el de --symbol)")
+    ap.add_argument("--rank", default="total_points", help=f"métricas separadas por coma: {','.join(METRICS)}")
+    ap.add_argument("--rule", default=None, help=f"vela ambigua: {' | '.join(bracket.AMBIGUOUS_RULES)}")
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default=None, help="guardar la tabla completa (.csv o .parquet)")
+    args = ap.parse_args()
+    if (args.tp is None or args.sl is None) and not args.symbol:
+        ap.error("sin --tp/--sl hace falta --symbol (TP_POINTS_<SYM> / SL_POINTS_<SYM>)")
+
+    cols = load_history(args.contract_id, args.root)
+    t0 = time.perf_counter()
+    table = run_sweep(cols, [int(x) for x in _floats(args.fast)], [int(x) for x in _floats(args.slow)],
+                      _floats(args.eps), _floats(args.tp) if args.tp else None,
+                      _floats(args.sl) if args.sl else None,
+                      [m.strip() for m in args.rank.split(",") if m.strip()],
+                      ambiguous=args.rule, workers=args.workers or None, symbol=args.symbol)
+    print(f"[Sweep] {len(table)} combinaciones en {time.perf_counter() - t0:.2f}s")
+    print(table.head(args.top).to_string(index=False))
+    if args.out:
+        (table.to_parquet if args.out.endswith(".parquet") else table.to_csv)(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# app/backtest/walkforward.py
+from __future__ import annotations
+
+import os
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.backtest.engine import BAR_MINUTES, EPS
+from app.backtest.sweep import (
+    METRICS, SWEEP_WORKERS, _bracket_grid, _floats, _trades_task, grid_metrics, map_combos, param_combos,
+    session_index,
+)
+from app.data.bar_file import BarColumns
+
+# Walk-forward: ventanas train/test que avanzan de a `test_bars` velas (de la serie de señales).
+# En cada ventana se elige la mejor combinación (fast, slow, eps, tp, sl) en train y se opera
+# sólo en el test siguiente; los tests no se solapan y se cosen en una curva out-of-sample.
+# Reutilización: EMAs, señales y brackets se calculan UNA vez sobre toda la historia por
+# combinación (en el pool de sweep, con shared memory); cada ventana sólo selecciona las
+# entradas de su rango. Las EMAs de cada ventana llevan la historia previa, como en vivo.
+# En train sólo cuentan los trades que también SALEN dentro de train (sin mirar el test).
+
+
+@dataclass(frozen=True)
+class Window:
+    train_start: int           # epoch-ns, inclusivo
+    train_end: int             # = test_start
+    test_end: int              # exclusivo
+
+    @property
+    def test_start(self) -> int:
+        return self.train_end
+
+
+def make_windows(t: np.ndarray, train_bars: int, test_bars: int) -> List[Window]:
+    """Ventanas rolling sobre los tiempos de la serie de señales; el último test puede quedar corto."""
+    n = int(t.shape[0])
+    if train_bars < 1 or test_bars < 1:
+        raise ValueError(f"ventanas inválidas: train={train_bars} test={test_bars}")
+    out: List[Window] = []
+    start = 0
+    while start + train_bars < n:
+        mid = start + train_bars
+        end = mid + test_bars
+        out.append(Window(int(t[start]), int(t[mid]), int(t[end]) if end < n else int(t[-1]) + 1))
+        start += test_bars
+    return out
+
+
+@dataclass
+class WalkForwardResult:
+    windows: pd.DataFrame      # una fila por ventana: elección en train y resultado en test
+    trades: pd.DataFrame       # trades out-of-sample (todos los tests), orden de salida
+    equity: pd.Series          # curva OOS cosida: puntos acumulados por tiempo de salida
+
+    @property
+    def total_points(self) -> float:
+        return float(self.equity.iloc[-1]) if len(self.equity) else 0.0
+
+
+def _evaluate(w: Window, grids: Dict[Tuple[int, int, float], Dict[str, np.ndarray]],
+              tps: np.ndarray, sls: np.ndarray, metric: str, min_trades: int) -> Tuple[Dict, pd.DataFrame]:
+    best: Optional[Tuple[float, Tuple, int, int, Dict]] = None
+    for key, g in grids.items():
+        lo, hi = np.searchsorted(g["entry_t"], [w.train_start, w.train_end], side="left")
+        valid = g["exit_t"][lo:hi] < w.train_end
+        m = grid_metrics(g["pnl"][lo:hi], g["outcome"][lo:hi], valid)
+        score = np.where(m["trades"] >= min_trades, m[metric], -np.inf)
+        if metric == "max_drawdown":
+            score = np.where(m["trades"] >= min_trades, -m[metric], -np.inf)
+        ti, si = np.unravel_index(int(np.argmax(score)), score.shape)
+        if best is None or score[ti, si] > best[0]:
+            best = (float(score[ti, si]), key, int(ti), int(si), {k: float(m[k][ti, si]) for k in METRICS})
+
+    row: Dict = {"train_start": pd.Timestamp(w.train_start, tz="UTC"),
+                 "test_start": pd.Timestamp(w.test_start, tz="UTC"),
+                 "test_end": pd.Timestamp(w.test_end, tz="UTC")}
+    if best is None or not np.isfinite(best[0]):
+        return row, pd.DataFrame()
+    _, key, ti, si, is_m = best
+    g = grids[key]
+    lo, hi = np.searchsorted(g["entry_t"], [w.test_start, w.test_end], side="left")
+    pnl = g["pnl"][lo:hi, ti, si]
+    trades = pd.DataFrame({
+        "entry_time": pd.to_datetime(g["entry_t"][lo:hi], utc=True),
+        "exit_time": pd.to_datetime(g["exit_t"][lo:hi, ti, si], utc=True),
+        "side": np.where(g["side"][lo:hi] > 0, "LONG", "SHORT"),
+        "outcome": g["outcome"][lo:hi, ti, si],
+        "pnl_points": pnl,
+        "fast": key[0], "slow": key[1], "eps": key[2], "tp_points": tps[ti], "sl_points": sls[si],
+    })
+    row.update({"fast": key[0], "slow": key[1], "eps": key[2], "tp_points": float(tps[ti]),
+                "sl_points": float(sls[si])})
+    row.update({f"is_{k}": v for k, v in is_m.items()})
+    row.update({"oos_trades": int(pnl.shape[0]), "oos_points": float(pnl.sum())})
+    return row, trades
+
+
+def walk_forward(cols: BarColumns, train_bars: int, test_bars: int,
+                 fast: Sequence[int] = (50,), slow: Sequence[int] = (200,), eps: Sequence[float] = (EPS,),
+                 tp_points: Optional[Sequence[float]] = None, sl_points: Optional[Sequence[float]] = None,
+                 metric: str = "total_points", min_trades: int = 5, session: Optional[str] = None,
+                 ambiguous: Optional[str] = None, max_hold_bars: Optional[int] = None,
+                 workers: Optional[int] = None, bar_minutes: int = BAR_MINUTES,
+                 symbol: Optional[str] = None) -> WalkForwardResult:
+    """
+    Optimiza en cada train por `metric` (combinaciones con menos de `min_trades` no califican)
+    y cose los tests. Ventanas medidas en velas de la serie de señales (post filtro de sesión).
+    TP/SL sin indicar = los del .env para `symbol` (bracket.bracket_spec).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"métrica desconocida: {metric} (opciones: {list(METRICS)})")
+    tps, sls = _bracket_grid(tp_points, sl_points, symbol)
+    windows = make_windows(cols.t[session_index(cols, session)], int(train_bars), int(test_bars))
+
+    # 1) trades de toda la historia por combinación, una sola vez (pool de procesos)
+    grids = dict(map_combos(cols, param_combos(fast, slow, eps), tps, sls, _trades_task,
+                            session, ambiguous, max_hold_bars, workers, bar_minutes))
+    # 2) ventanas en paralelo: sólo slicing + métricas sobre arrays ya calculados
+    n_threads = int(workers or SWEEP_WORKERS or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="walkforward") as pool:
+        done = list(pool.map(lambda w: _evaluate(w, grids, tps, sls, metric, min_trades), windows))
+
+    rows = [r for r, _ in done]
+    parts = [tr for _, tr in done if len(tr)]
+    trades = pd.concat(parts, ignore_index=True).sort_values("exit_time", kind="stable") \
+        if parts else pd.DataFrame(columns=["entry_time", "exit_time", "pnl_points"])
+    equity = pd.Series(np.cumsum(trades["pnl_points"].to_numpy(dtype="float64")),
+                       index=pd.DatetimeIndex(trades["exit_time"]), name="oos_equity")
+    return WalkForwardResult(windows=pd.DataFrame(rows), trades=trades.reset_index(drop=True), equity=equity)
+
+
+def main() -> None:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+    from app.backtest.engine import load_history
+
+    ap = argparse.ArgumentParser(description="Walk-forward con ventanas train/test rolling")
+    ap.add_argument("contract_id", help="contractId con histórico en BAR_CACHE_DIR")
+    ap.add_argument("--root", default=None)
+    ap.add_argument("--train", type=int, default=96 * 20, help="velas de train (default 20 días de 15m)")
+    ap.add_argument("--test", type=int, default=96 * 5, help="velas de test")
+    ap.add_argument("--fast", default="50")
+    ap.add_argument("--slow", default="200")
+    ap.add_argument("--eps", default=str(EPS))
+    ap.add_argument("--symbol", default=None, help="MNQ | ES: TP/SL por defecto de TP_POINTS_<SYM> / SL_POINTS_<SYM>")
+    ap.add_argument("--tp", default=None, help="TP en puntos (default el de --symbol)")
+    ap.add_argument("--sl", default=None, help="SL en puntos (default el de --symbol)")
+    ap.add_argument("--metric", default="total_points", help=f"{' | '.join(METRICS)}")
+    ap.add_argument("--min-trades", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--out", default=None, help="guardar la curva OOS (.csv)")
+    args = ap.parse_args()
+    if (args.tp is None or args.sl is None) and not args.symbol:
+        ap.error("sin --tp/--sl hace falta --symbol (TP_POINTS_<SYM> / SL_POINTS_<SYM>)")
+
+    cols = load_history(args.contract_id, args.root)
+    t0 = time.perf_counter()
+    res = walk_forward(cols, args.train, args.test, [int(x) for x in _floats(args.fast)],
+                       [int(x) for x in _floats(args.slow)], _floats(args.eps),
+                       _floats(args.tp) if args.tp else None, _floats(args.sl) if args.sl else None,
+                       args.metric, args.min_trades, workers=args.workers or None, symbol=args.symbol)
+    print(res.windows.to_string(index=False))
+    print(f"[WalkForward] {len(res.windows)} ventanas, {len(res.trades)} trades OOS, "
+          f"{res.total_points:.2f} pts en {time.perf_counter() - t0:.2f}s")
+    if args.out:
+        res.equity.to_csv(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# app/brokers/market_stream.py
+from __future__ import annotations
+
+import os
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Protocol
+
+try:
+    import websockets
+    HAVE_WEBSOCKETS = True
+except Exception:
+    websockets = None
+    HAVE_WEBSOCKETS = False
+
+NS = 1_000_000_000
+
+# Protocolo (JSON por mensaje de WebSocket), el mismo que habla LocalStreamHub:
+#   cliente -> {"action": "subscribe" | "unsubscribe", "contractId": "CON.F.US.MNQ.Z25"}
+#   server  -> {"type": "trade", "contractId": ..., "t": ISO o epoch-ns, "price": x, "volume": n}
+#              {"type": "quote", ..., "last": x}   (sin "last" se ignora: sólo bid/ask)
+#              {"type": "clock", "t": ...}         (reloj de mercado; lo usa el replay)
+
+
+def parse_ts_ns(v: Any) -> int:
+    if isinstance(v, (int, float)):
+        return int(v)
+    return int(datetime.fromisoformat(str(v).replace("Z", "+00:00")).timestamp() * NS)
+
+
+@dataclass
+class Tick:
+    contract_id: str
+    t: int            # epoch-ns UTC
+    price: float
+    size: float = 0.0
+
+
+class StreamListener(Protocol):
+    # corren en el event loop del stream (compartido por todos los contratos): sin I/O ni esperas
+    def on_tick(self, tick: Tick) -> None: ...
+    def on_time(self, now_ns: int) -> None: ...
+    def deadline_ns(self) -> Optional[int]: ...
+
+
+class MarketStream:
+    """
+    Cliente push de market data sobre WebSocket (dependencia opcional `websockets`).
+    - Corre en un hilo daemon con su propio event loop; reconecta solo y re-suscribe.
+    - Despacha ticks a los listeners de cada contractId; con `wall_clock` (feed en vivo)
+      además despierta en el deadline más próximo de los listeners para cerrar velas
+      sin esperar al próximo tick. En replay (wall_clock=False) manda el reloj del hub.
+    - `record_path`: guarda cada tick recibido en JSONL (mismo formato; sirve de grabación
+      para LocalStreamHub).
+    """
+
+    def __init__(self, url: str, wall_clock: bool = True, reconnect_sec: float = 2.0,
+                 record_path: Optional[str] = None) -> None:
+        if not HAVE_WEBSOCKETS:
+            raise RuntimeError("MarketStream requiere el paquete 'websockets' (pip install websockets)")
+        self.url = url
+        self.wall_clock = wall_clock
+        self.reconnect_sec = float(reconnect_sec)
+        self.record_path = record_path
+
+        self._lock = threading.Lock()
+        self._listeners: Dict[str, List[StreamListener]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._record = None
+
+        self.connected = False
+        self.ticks = 0
+        self.reconnects = 0
+        self.last_msg_at: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["MarketStream"]:
+        url = os.getenv("MARKET_STREAM_URL", "").strip()
+        if not url:
+            return None
+        if not HAVE_WEBSOCKETS:
+            print("[MarketStream][WARN] MARKET_STREAM_URL definido pero falta 'websockets'; se usa polling")
+            return None
+        wall = os.getenv("MARKET_STREAM_WALL_CLOCK", "true").lower() in ("1", "true", "yes", "on")
+        return cls(url, wall_clock=wall, record_path=os.getenv("MARKET_STREAM_RECORD", "").strip() or None)
+
+    # ------------- Suscripciones -------------
+
+    def subscribe(self, contract_id: str, listener: StreamListener) -> None:
+        with self._lock:
+            subs = self._listeners.setdefault(contract_id, [])
+            first = not subs
+            if listener not in subs:
+                subs.append(listener)
+        if first:
+            self._send_threadsafe({"action": "subscribe", "contractId": contract_id})
+
+    def unsubscribe(self, contract_id: str, listener: StreamListener) -> None:
+        with self._lock:
+            subs = self._listeners.get(contract_id, [])
+            if listener in subs:
+                subs.remove(listener)
+            last = not subs
+            if last:
+                self._listeners.pop(contract_id, None)
+        if last:
+            self._send_threadsafe({"action": "unsubscribe", "contractId": contract_id})
+
+    def _send_threadsafe(self, msg: Dict[str, Any]) -> None:
+        loop, ws = self._loop, self._ws
+        if loop is None or ws is None or not self.connected:
+            return                    # se envía al (re)conectar
+        asyncio.run_coroutine_threadsafe(ws.send(json.dumps(msg)), loop)
+
+    # ------------- Ciclo de vida -------------
+
+    def start(self) -> "MarketStream":
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()),
+                                            name="market-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        loop, ws = self._loop, self._ws
+        if loop is not None and ws is not None:
+            asyncio.run_coroutine_threadsafe(ws.close(), loop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self._ws = ws
+                    self.connected = True
+                    with self._lock:
+                        contracts = list(self._listeners)
+                    for cid in contracts:
+                        await ws.send(json.dumps({"action": "subscribe", "contractId": cid}))
+                    await self._read(ws)
+            except Exception as e:
+                if not self._stop.is_set():
+                    print("[MarketStream][WARN]", e)
+            finally:
+                self.connected = False
+                self._ws = None
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_sec)
+
+    async def _read(self, ws) -> None:
+        while not self._stop.is_set():
+            timeout = self._next_wakeup()
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self._on_time(time.time_ns())
+                continue
+            self.last_msg_at = time.time()
+            try:
+                self._dispatch(json.loads(raw))
+            except Exception as e:
+                print("[MarketStream][WARN] mensaje inválido:", e)
+            if self.wall_clock:
+                self._on_time(time.time_ns())
+
+    def _all_listeners(self) -> List[StreamListener]:
+        with self._lock:
+            return [l for subs in self._listeners.values() for l in subs]
+
+    def _next_wakeup(self) -> Optional[float]:
+        if not self.wall_clock:
+            return None
+        deadlines = [d for d in (l.deadline_ns() for l in self._all_listeners()) if d is not None]
+        if not deadlines:
+            return 1.0
+        return max(0.0, (min(deadlines) - time.time_ns()) / NS)
+
+    def _on_time(self, now_ns: int) -> None:
+        for l in self._all_listeners():
+            try:
+                l.on_time(now_ns)
+            except Exception as e:
+                print("[MarketStream][WARN] listener:", e)
+
+    def _dispatch(self, msg: Dict[str, Any]) -> None:
+        kind = msg.get("type")
+        if kind == "clock":
+            self._on_time(parse_ts_ns(msg["t"]))
+            return
+        if kind not in ("trade", "quote"):
+            return
+        price = msg.get("price") if kind == "trade" else msg.get("last")
+        if price is None:
+            return
+        tick = Tick(str(msg["contractId"]), parse_ts_ns(msg["t"]), float(price),
+                    float(msg.get("volume") or msg.get("size") or 0.0))
+        self.ticks += 1
+        if self.record_path:
+            if self._record is None:
+                self._record = open(self.record_path, "a", encoding="utf-8")
+            self._record.write(json.dumps(msg) + "\n")
+        with self._lock:
+            subs = list(self._listeners.get(tick.contract_id, ()))
+        for l in subs:
+            try:
+                l.on_tick(tick)
+            except Exception as e:
+                print("[MarketStream][WARN] listener:", e)
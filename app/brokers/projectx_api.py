@@ -3,11 +3,21 @@ from __future__ import annotations
 
 import os
 import json
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse, urlunparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from app.brokers.rate_limit import BULK, CRITICAL, RateLimiter, TokenBucket
+from app.brokers.resilience import CircuitBreaker, CircuitOpenError, HttpMetrics, RetryPolicy
+from app.brokers.singleflight import SingleFlight
+from app.brokers.token_manager import TokenManager
+from app.data.bar_file import BarColumns
+from app.data.bar_store import BarStore, UNIT_SECONDS
 
 
 def _iso_z(dt: datetime) -> str:
@@ -21,6 +31,74 @@ def _env_bool(name: str, default: bool = False) -> bool:
     return v.lower() in ("1", "true", "yes", "on")
 
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+# Conexiones keep-alive HTTP/1.1 reutilizables hacia el gateway (pool acotado)
+POOL_SIZE: int = _env_int("PROJECTX_POOL_SIZE", 8)
+
+# Timeouts (segundos) por endpoint; DEFAULT_TIMEOUT para el resto
+DEFAULT_TIMEOUT: float = 30.0
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "/api/Auth/loginKey": 20.0,
+    "/api/Auth/loginWithKey": 20.0,
+    "/api/Auth/validate": 10.0,
+    "/api/Account/search": 15.0,
+    "/api/Contract/search": 20.0,
+    "/api/Contract/searchById": 15.0,
+    "/api/History/retrieveBars": 30.0,
+    "/api/Order/place": 15.0,
+    "/api/Order/cancel": 10.0,
+    "/api/Order/searchOpen": 15.0,
+    "/api/Order/search": 20.0,
+    "/api/Trade/search": 20.0,
+}
+
+# Reintentos por endpoint (backoff exponencial con jitter). Place NO es idempotente:
+# sólo se reintenta si la conexión no llegó a establecerse o el gateway respondió 429.
+DEFAULT_RETRY = RetryPolicy(attempts=max(1, _env_int("PROJECTX_RETRY_ATTEMPTS", 3)))
+ENDPOINT_RETRY: Dict[str, RetryPolicy] = {
+    "/api/Order/place": RetryPolicy(attempts=2, idempotent=False),
+    "/api/Order/cancel": RetryPolicy(attempts=2),
+    "/api/History/retrieveBars": RetryPolicy(attempts=max(1, _env_int("PROJECTX_RETRY_ATTEMPTS", 3)),
+                                             cap_sec=1.0),
+}
+
+# Circuit breaker del gateway: N fallas seguidas (5xx/red) -> fail-fast durante RESET segundos
+BREAKER_THRESHOLD: int = _env_int("PROJECTX_BREAKER_THRESHOLD", 5)
+BREAKER_RESET_SEC: float = float(_env_int("PROJECTX_BREAKER_RESET_SEC", 15))
+
+# Rate limit del lado cliente (límites del gateway: retrieveBars 50/30s, resto 200/60s).
+# Órdenes y auth son CRITICAL; el histórico es BULK y deja libre RATE_BULK_RESERVE del cupo global.
+RATE_LIMIT: bool = _env_bool("PROJECTX_RATE_LIMIT", True)
+RATE_GLOBAL_PER_MIN: int = _env_int("PROJECTX_REQ_PER_MIN", 200)
+RATE_BARS_PER_30S: int = _env_int("PROJECTX_BARS_PER_30S", 50)
+RATE_BULK_RESERVE: int = _env_int("PROJECTX_BULK_RESERVE", 20)
+ENDPOINT_PRIORITY: Dict[str, int] = {
+    "/api/Auth/loginKey": CRITICAL,
+    "/api/Auth/loginWithKey": CRITICAL,
+    "/api/Auth/validate": CRITICAL,
+    "/api/Order/place": CRITICAL,
+    "/api/Order/cancel": CRITICAL,
+    "/api/History/retrieveBars": BULK,
+}
+
+# Endpoints de auth: un 401 acá no dispara re-login + replay
+AUTH_PATHS = frozenset({"/api/Auth/loginKey", "/api/Auth/loginWithKey", "/api/Auth/validate"})
+
+# retrieveBars idénticos concurrentes comparten un solo request; además el resultado se
+# reutiliza BARS_DEDUP_TTL_SEC (mantenerlo < CLOSE_RETRY_INTERVAL: cada reintento ve datos nuevos)
+BARS_DEDUP_TTL_SEC: float = float(os.getenv("BARS_DEDUP_TTL_SEC", "0.3"))
+
+# Grabación de respuestas de retrieveBars (velas cerradas) en JSONL, para el replay
+# determinístico (app/brokers/replay_client.py). Vacío = no grabar.
+RECORD_BARS_PATH: str = os.getenv("PROJECTX_RECORD_BARS", "").strip()
+
+
 class ProjectXClient:
     """
     Cliente ligero para TopstepX/ProjectX Gateway API.
@@ -28,9 +106,17 @@ class ProjectXClient:
       - PROJECTX_API_BASE (p.ej. https://api.topstepx.com)
       - PROJECTX_USER
       - PROJECTX_API_KEY
+    Las velas cerradas se cachean en disco (BAR_CACHE / BAR_CACHE_DIR, ver BarStore).
+    retrieveBars idénticos en vuelo se unifican (SingleFlight, BARS_DEDUP_TTL_SEC).
+    El token se renueva en segundo plano antes de vencer (TokenManager) y un 401 se
+    reintenta una vez tras re-login.
+    Errores transitorios se reintentan según ENDPOINT_RETRY; con el gateway caído el
+    circuit breaker corta en el acto (CircuitOpenError). metrics() expone contadores/latencias.
+    Rate limiter token-bucket por endpoint con prioridades (órdenes antes que histórico).
     """
 
-    def __init__(self, base_api: Optional[str] = None, user: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(self, base_api: Optional[str] = None, user: Optional[str] = None, api_key: Optional[str] = None,
+                 pool_size: Optional[int] = None, bar_store: Optional[BarStore] = None):
         # Base URL (forzar https)
         base = base_api or os.getenv("PROJECTX_API_BASE", "https://api.topstepx.com").strip()
         u = urlparse(base)
@@ -42,9 +128,33 @@ class ProjectXClient:
         self.user: str = user or os.getenv("PROJECTX_USER", "").strip()
         self.api_key: str = api_key or os.getenv("PROJECTX_API_KEY", "").strip()
 
-        # Sesión HTTP
+        # Sesión HTTP con pool keep-alive acotado (bloquea en vez de abrir conexiones extra)
+        self.pool_size: int = max(1, int(pool_size or POOL_SIZE))
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
         self._token: Optional[str] = None
+        self.tokens = TokenManager(self, background=_env_bool("PROJECTX_TOKEN_REFRESH", True))
+
+        # Resiliencia: reintentos por endpoint, circuit breaker y métricas
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET_SEC)
+        self.http_metrics = HttpMetrics()
+        self.rate_limiter: Optional[RateLimiter] = None
+        if RATE_LIMIT:
+            self.rate_limiter = RateLimiter(
+                TokenBucket.for_window(RATE_GLOBAL_PER_MIN, 60.0),
+                {"/api/History/retrieveBars": TokenBucket.for_window(RATE_BARS_PER_30S, 30.0)},
+                priorities=ENDPOINT_PRIORITY,
+                bulk_reserve=RATE_BULK_RESERVE,
+            )
+
+        # Cache local de velas (None = siempre ir al gateway)
+        self.bar_store: Optional[BarStore] = bar_store if bar_store is not None else BarStore.from_env()
+        # Single-flight + micro-cache TTL para retrieveBars (key = payload completo)
+        self.bars_flight = SingleFlight(ttl=BARS_DEDUP_TTL_SEC)
+        # Grabación opcional de retrieveBars (PROJECTX_RECORD_BARS)
+        self.record_bars_path: Optional[str] = RECORD_BARS_PATH or None
+        self._record_lock = threading.Lock()
 
         # Debug HTTP
         self.debug_http: bool = _env_bool("DEBUG_HTTP", False)
@@ -59,8 +169,16 @@ class ProjectXClient:
             h["Authorization"] = f"Bearer {self._token}"
         return h
 
-    def _post(self, path: str, payload: Dict[str, Any], timeout: float = 30.0) -> Dict[str, Any]:
+    def _set_token(self, token: str) -> None:
+        self._token = token
+        self.session.headers.update({"Authorization": f"Bearer {self._token}"})
+        self.tokens.on_token(token)
+
+    def _post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+              _replay: bool = True) -> Dict[str, Any]:
         url = f"{self.base_api}{path}"
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
         if self.debug_http:
             try:
                 print("POST", url)
@@ -68,7 +186,12 @@ class ProjectXClient:
             except Exception:
                 print("POST", url)
                 print("payload:(no-dump)")
-        r = self.session.post(url, headers=self._headers(), json=payload, timeout=timeout)
+        sent_token = self._token
+        r = self._send(path, url, payload, timeout)
+        if r.status_code == 401 and _replay and sent_token and path not in AUTH_PATHS:
+            # token vencido/revocado: re-login (una sola vez entre hilos) y replay único
+            if self.tokens.reauth(sent_token):
+                return self._post(path, payload, timeout, _replay=False)
         if not r.ok:
             # intentar mostrar body decodificado
             try:
@@ -82,6 +205,72 @@ class ProjectXClient:
         except Exception:
             return {"raw": r.text}
 
+    def _send(self, path: str, url: str, payload: Dict[str, Any], timeout: float) -> requests.Response:
+        """POST con reintentos (backoff con jitter), circuit breaker y métricas."""
+        policy = ENDPOINT_RETRY.get(path, DEFAULT_RETRY)
+        self.http_metrics.request(path)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                # cada intento (también los reintentos) consume cupo; antes de allow():
+                # un RateLimitTimeout no debe dejar tomado el request de prueba del breaker
+                self.rate_limiter.acquire(path, timeout=timeout)
+            if not self.breaker.allow():
+                self.http_metrics.rejected(path)
+                raise CircuitOpenError(f"gateway no disponible (circuit open) {path}")
+            attempt += 1
+            t0 = time.monotonic()
+            error: Optional[BaseException] = None
+            r: Optional[requests.Response] = None
+            try:
+                r = self.session.post(url, headers=self._headers(), json=payload, timeout=timeout)
+            except requests.RequestException as e:
+                error = e
+            except BaseException:
+                # error inesperado (no de red): liberar la prueba sin contarlo como falla
+                self.breaker.release()
+                raise
+            self.http_metrics.attempt(path, time.monotonic() - t0, retry=attempt > 1)
+
+            status = r.status_code if r is not None else None
+            self.breaker.record(error is None and (status is None or status < 500))
+            if not policy.should_retry(attempt, status, error):
+                if error is not None:
+                    self.http_metrics.failure(path)
+                    raise error
+                if status is not None and status >= 500:
+                    self.http_metrics.failure(path)
+                return r
+
+            retry_after = None
+            if r is not None:
+                try:
+                    retry_after = float(r.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+            delay = policy.backoff(attempt, retry_after)
+            print(f"[ProjectXClient][WARN] {path} {status or type(error).__name__}; "
+                  f"reintento {attempt}/{policy.attempts - 1} en {delay:.2f}s")
+            time.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Métricas HTTP por endpoint + estado del circuit breaker."""
+        return {"endpoints": self.http_metrics.snapshot(),
+                "breaker": self.breaker.state, "breaker_opens": self.breaker.opens,
+                "rate_limit": self.rate_limiter.usage() if self.rate_limiter is not None else {}}
+
+    def budget_summary(self) -> str:
+        """Uso de los presupuestos del rate limiter, p.ej. '* 12% | retrieveBars 40%'."""
+        if self.rate_limiter is None:
+            return "rate limit off"
+        parts = []
+        for name, u in self.rate_limiter.usage().items():
+            if "used_pct" in u:
+                parts.append(f"{name.rsplit('/', 1)[-1]} {u['used_pct']:.0f}%")
+            elif u["waits"]:
+                parts.append(f"{name} esperas={u['waits']} ({u['wait_sec']:.2f}s)")
+        return " | ".join(parts)
+
     # ------------- Auth -------------
 
     def login_with_key(self) -> str:
@@ -96,11 +285,11 @@ class ProjectXClient:
 
         # preferido: loginKey
         try:
-            data = self._post("/api/Auth/loginKey", payload, timeout=20)
+            data = self._post("/api/Auth/loginKey", payload)
         except requests.HTTPError as e:
             # compatibilidad con ambientes viejos que usaban loginWithKey
             if e.response is not None and e.response.status_code == 404:
-                data = self._post("/api/Auth/loginWithKey", payload, timeout=20)
+                data = self._post("/api/Auth/loginWithKey", payload)
             else:
                 raise
 
@@ -108,8 +297,7 @@ class ProjectXClient:
         if not token:
             raise requests.HTTPError("Auth failed", response=requests.Response())
 
-        self._token = token
-        self.session.headers.update({"Authorization": f"Bearer {self._token}"})
+        self._set_token(token)
         return token
 
 
@@ -117,7 +305,10 @@ class ProjectXClient:
         """
         POST /api/Auth/validate
         """
-        data = self._post("/api/Auth/validate", {}, timeout=10)
+        data = self._post("/api/Auth/validate", {})
+        new = (data or {}).get("newToken")
+        if new:
+            self._set_token(new)
         return bool((data or {}).get("success", False))
 
     # ------------- Accounts -------------
@@ -128,7 +319,7 @@ class ProjectXClient:
         payload: { "onlyActiveAccounts": true/false }
         """
         payload = {"onlyActiveAccounts": bool(only_active)}
-        data = self._post("/api/Account/search", payload, timeout=15)
+        data = self._post("/api/Account/search", payload)
         if not data.get("success", False):
             raise RuntimeError(f"Account.search failed: {data}")
         return data.get("accounts", []) or []
@@ -141,7 +332,7 @@ class ProjectXClient:
         payload: { "text": <str>, "live": <bool> }
         """
         payload = {"text": text, "live": bool(live)}
-        data = self._post("/api/Contract/search", payload, timeout=20)
+        data = self._post("/api/Contract/search", payload)
         if not data.get("success", False):
             raise RuntimeError(f"Contract.search failed: {data}")
         return data.get("contracts", []) or []
@@ -152,7 +343,7 @@ class ProjectXClient:
         payload: { "contractId": <str> }
         """
         payload = {"contractId": contract_id}
-        data = self._post("/api/Contract/searchById", payload, timeout=15)
+        data = self._post("/api/Contract/searchById", payload)
         if not data.get("success", False):
             raise RuntimeError(f"Contract.searchById failed: {data}")
         return data.get("contracts", []) or []
@@ -185,6 +376,37 @@ class ProjectXClient:
             "includePartialBar": false
           }
         - Si no se pasan start_time/end_time, se calculan por lookback_days (por defecto 7-14d).
+        - Con bar_store y velas cerradas: lee del cache y sólo pide al gateway los huecos.
+        """
+        if end_time is None:
+            end_time = datetime.now(timezone.utc)
+        if start_time is None:
+            days = lookback_days if (lookback_days and lookback_days > 0) else 7
+            start_time = end_time - timedelta(days=days)
+
+        if self.bar_store is not None and not include_partial and int(unit) in UNIT_SECONDS:
+            def fetch(s: datetime, e: datetime, n: int) -> List[Dict[str, Any]]:
+                return self._retrieve_bars_remote(contract_id, live, unit, unit_number, False, n, s, e)
+            return self.bar_store.retrieve((contract_id, int(unit), int(unit_number)),
+                                           start_time, end_time, int(limit), fetch)
+        return self._retrieve_bars_remote(contract_id, live, unit, unit_number, include_partial,
+                                          limit, start_time, end_time)
+
+    def retrieve_bar_columns(
+        self,
+        contract_id: str,
+        live: bool,
+        unit: int,
+        unit_number: int,
+        limit: int = 400,
+        lookback_days: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> BarColumns:
+        """
+        Igual que retrieve_bars (sólo velas cerradas) pero en formato columnar:
+        t int64 epoch-ns + OHLCV float64, ascendente. Con bar_store no hay parseo JSON
+        de lo ya cacheado.
         """
         if end_time is None:
             end_time = datetime.now(timezone.utc)
@@ -192,6 +414,18 @@ class ProjectXClient:
             days = lookback_days if (lookback_days and lookback_days > 0) else 7
             start_time = end_time - timedelta(days=days)
 
+        if self.bar_store is not None and int(unit) in UNIT_SECONDS:
+            def fetch(s: datetime, e: datetime, n: int) -> List[Dict[str, Any]]:
+                return self._retrieve_bars_remote(contract_id, live, unit, unit_number, False, n, s, e)
+            return self.bar_store.retrieve_columns((contract_id, int(unit), int(unit_number)),
+                                                   start_time, end_time, int(limit), fetch)
+        bars = self._retrieve_bars_remote(contract_id, live, unit, unit_number, False,
+                                          limit, start_time, end_time)
+        return BarColumns.from_dicts(bars)
+
+    def _retrieve_bars_remote(self, contract_id: str, live: bool, unit: int, unit_number: int,
+                              include_partial: bool, limit: int,
+                              start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
         payload = {
             "contractId": contract_id,
             "live": bool(live),
@@ -202,13 +436,38 @@ class ProjectXClient:
             "limit": int(limit),
             "includePartialBar": bool(include_partial),
         }
-        data = self._post("/api/History/retrieveBars", payload, timeout=30)
-        # formato esperado: { success: bool, bars: [...] }
-        if not data.get("success", False):
-            raise RuntimeError(f"retrieveBars failed: {data}")
-        bars = data.get("bars") or []
+
+        def call() -> List[Dict[str, Any]]:
+            data = self._post("/api/History/retrieveBars", payload)
+            # formato esperado: { success: bool, bars: [...] }
+            if not data.get("success", False):
+                raise RuntimeError(f"retrieveBars failed: {data}")
+            return data.get("bars") or []
+
+        key = tuple(sorted(payload.items()))
+        # copia de la lista: los llamadores comparten el resultado parseado
+        bars = list(self.bars_flight.do(key, call))
+        if self.record_bars_path and not include_partial:
+            self._record_bars(payload, bars)
         return bars
 
+    def _record_bars(self, payload: Dict[str, Any], bars: List[Dict[str, Any]]) -> None:
+        """Una línea JSONL por respuesta; el replay las fusiona (repetidas = misma vela)."""
+        if not bars:
+            return
+        line = json.dumps({
+            "ts": _iso_z(datetime.now(timezone.utc)),
+            "contractId": payload["contractId"],
+            "unit": payload["unit"],
+            "unitNumber": payload["unitNumber"],
+            "bars": bars,
+        }, ensure_ascii=False)
+        try:
+            with self._record_lock, open(self.record_bars_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"[ProjectXClient][WARN] no se pudo grabar retrieveBars en {self.record_bars_path}: {e}")
+
     # ------------- Orders / Trades -------------
 
     def place_order(self, **kwargs) -> Dict[str, Any]:
@@ -251,7 +510,7 @@ class ProjectXClient:
             if k not in payload:
                 raise ValueError(f"place_order missing field: {k}")
 
-        data = self._post("/api/Order/place", payload, timeout=15)
+        data = self._post("/api/Order/place", payload)
         if not data.get("success", False):
             raise RuntimeError(f"order.place failed: {data}")
         return data
@@ -262,7 +521,7 @@ class ProjectXClient:
         payload: { "accountId": <int>, "orderId": <int> }
         """
         payload = {"accountId": int(account_id), "orderId": int(order_id)}
-        data = self._post("/api/Order/cancel", payload, timeout=10)
+        data = self._post("/api/Order/cancel", payload)
         if not data.get("success", False):
             raise RuntimeError(f"order.cancel failed: {data}")
         return data
@@ -273,7 +532,7 @@ class ProjectXClient:
         payload: { "accountId": <int> }
         """
         payload = {"accountId": int(account_id)}
-        data = self._post("/api/Order/searchOpen", payload, timeout=15)
+        data = self._post("/api/Order/searchOpen", payload)
         if not data.get("success", False):
             raise RuntimeError(f"order.searchOpen failed: {data}")
         return data.get("orders", []) or []
@@ -286,7 +545,7 @@ class ProjectXClient:
         payload = {"accountId": int(account_id), "startTimestamp": start_iso}
         if end_iso:
             payload["endTimestamp"] = end_iso
-        data = self._post("/api/Order/search", payload, timeout=20)
+        data = self._post("/api/Order/search", payload)
         if not data.get("success", False):
             raise RuntimeError(f"order.search failed: {data}")
         return data.get("orders", []) or []
@@ -299,7 +558,7 @@ class ProjectXClient:
         payload = {"accountId": int(account_id), "startTimestamp": start_iso}
         if end_iso:
             payload["endTimestamp"] = end_iso
-        data = self._post("/api/Trade/search", payload, timeout=20)
+        data = self._post("/api/Trade/search", payload)
         if not data.get("success", False):
             raise RuntimeError(f"trade.search failed: {data}")
         return data.get("trades", []) or []
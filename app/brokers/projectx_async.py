@@ -0,0 +1,161 @@
+# app/brokers/projectx_async.py
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from app.brokers.projectx_api import ProjectXClient
+from app.data.bar_file import BarColumns
+
+T = TypeVar("T")
+
+
+class AsyncProjectXClient:
+    """
+    Variante asyncio de ProjectXClient (misma superficie de métodos, todos `async`).
+    - Comparte token y sesión con un ProjectXClient: las conexiones keep-alive
+      HTTP/1.1 salen del pool acotado de esa sesión (PROJECTX_POOL_SIZE).
+    - Cada request corre en un executor con tantos workers como conexiones del pool,
+      así varios monitores y el flujo de órdenes avanzan en paralelo sin bloquear el loop.
+    - Los timeouts por endpoint son los de ENDPOINT_TIMEOUTS del cliente síncrono.
+
+    Uso:
+        async with AsyncProjectXClient() as apx:
+            await apx.login_with_key()
+            bars_mnq, bars_es = await asyncio.gather(
+                apx.retrieve_bars("CON.F.US.MNQ.Z25", False, 2, 15, limit=2),
+                apx.retrieve_bars("CON.F.US.EP.Z25", False, 2, 15, limit=2),
+            )
+    """
+
+    def __init__(self, px: Optional[ProjectXClient] = None, max_concurrency: Optional[int] = None) -> None:
+        self.px = px or ProjectXClient()
+        self.max_concurrency: int = max(1, int(max_concurrency or self.px.pool_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="projectx")
+
+    @property
+    def _token(self) -> Optional[str]:
+        return self.px._token
+
+    async def _call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def aclose(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> "AsyncProjectXClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    # ------------- Métricas (en memoria: sin executor) -------------
+
+    async def metrics(self) -> Dict[str, Any]:
+        return self.px.metrics()
+
+    async def budget_summary(self) -> str:
+        return self.px.budget_summary()
+
+    # ------------- Auth -------------
+
+    async def login_with_key(self) -> str:
+        return await self._call(self.px.login_with_key)
+
+    async def validate_token(self) -> bool:
+        return await self._call(self.px.validate_token)
+
+    # ------------- Accounts -------------
+
+    async def search_accounts(self, only_active: bool = True) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_accounts, only_active)
+
+    # ------------- Contracts -------------
+
+    async def search_contracts(self, text: str, live: bool = False) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_contracts, text, live)
+
+    async def search_contracts_by_id(self, contract_id: str) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_contracts_by_id, contract_id)
+
+    # ------------- History / Bars -------------
+
+    async def retrieve_bars(
+        self,
+        contract_id: str,
+        live: bool,
+        unit: int,
+        unit_number: int,
+        include_partial: bool = False,
+        limit: int = 400,
+        lookback_days: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        return await self._call(
+            self.px.retrieve_bars,
+            contract_id=contract_id,
+            live=live,
+            unit=unit,
+            unit_number=unit_number,
+            include_partial=include_partial,
+            limit=limit,
+            lookback_days=lookback_days,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+    async def retrieve_bar_columns(
+        self,
+        contract_id: str,
+        live: bool,
+        unit: int,
+        unit_number: int,
+        limit: int = 400,
+        lookback_days: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> BarColumns:
+        return await self._call(
+            self.px.retrieve_bar_columns,
+            contract_id=contract_id,
+            live=live,
+            unit=unit,
+            unit_number=unit_number,
+            limit=limit,
+            lookback_days=lookback_days,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+    # ------------- Orders / Trades -------------
+
+    async def place_order(self, **kwargs) -> Dict[str, Any]:
+        return await self._call(self.px.place_order, **kwargs)
+
+    async def cancel_order(self, account_id: int, order_id: int) -> Dict[str, Any]:
+        return await self._call(self.px.cancel_order, account_id, order_id)
+
+    async def search_open_orders(self, account_id: int) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_open_orders, account_id)
+
+    async def search_orders(self, account_id: int, start_iso: str, end_iso: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_orders, account_id, start_iso, end_iso)
+
+    async def search_trades(self, account_id: int, start_iso: str, end_iso: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self._call(self.px.search_trades, account_id, start_iso, end_iso)
+
+
+def missing_async_methods() -> List[str]:
+    """Métodos públicos de ProjectXClient sin su versión async (debe quedar vacío)."""
+    sync = {n for n, v in vars(ProjectXClient).items() if callable(v) and not n.startswith("_")}
+    return sorted(n for n in sync if not asyncio.iscoroutinefunction(getattr(AsyncProjectXClient, n, None)))
+
+
+# misma superficie que el cliente síncrono: un método nuevo allá sin wrapper acá falla al importar
+if missing_async_methods():
+    raise ImportError(f"AsyncProjectXClient sin wrappers para: {missing_async_methods()}")
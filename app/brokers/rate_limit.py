@@ -0,0 +1,156 @@
+# app/brokers/rate_limit.py
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import requests
+
+# Clases de prioridad (menor = más urgente)
+CRITICAL, NORMAL, BULK = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: "critical", NORMAL: "normal", BULK: "bulk"}
+
+
+class RateLimitTimeout(requests.Timeout):
+    """No hubo cupo en el rate limiter dentro del timeout del request."""
+
+
+class TokenBucket:
+    """
+    Bucket clásico: `capacity` fichas, se reponen a `rate` por segundo.
+    Para un límite "quota por window" usar for_window(): en cualquier ventana entran a lo
+    sumo capacity + rate × window fichas, así que ambos se dimensionan para sumar quota.
+    """
+
+    def __init__(self, rate: float, capacity: float, window: Optional[float] = None,
+                 quota: Optional[float] = None) -> None:
+        self.rate = max(float(rate), 1e-9)
+        self.capacity = max(float(capacity), 1.0)
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+        # presupuesto real (límite del gateway) y log de lo otorgado en la ventana móvil
+        self.window = float(window) if window else None
+        self.quota = float(quota) if quota else None
+        self._granted: Deque[float] = deque()
+
+    @classmethod
+    def for_window(cls, quota: float, window_sec: float) -> "TokenBucket":
+        """Mitad del cupo como ráfaga y la otra mitad repuesta a lo largo de la ventana."""
+        half = max(float(quota), 2.0) / 2.0
+        return cls(half / float(window_sec), half, window_sec, quota)
+
+    def take(self, now: float) -> None:
+        self.tokens -= 1.0
+        if self.window is not None:
+            self._granted.append(now)
+
+    def used_in_window(self, now: float) -> int:
+        if self.window is None:
+            return 0
+        while self._granted and self._granted[0] <= now - self.window:
+            self._granted.popleft()
+        return len(self._granted)
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def time_until(self, n: float) -> float:
+        return max(0.0, (n - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Rate limiter del cliente: un bucket global (todas las llamadas) + buckets por endpoint.
+    - Prioridades: CRITICAL (órdenes, auth) > NORMAL > BULK (histórico). Mientras haya
+      alguien esperando con más prioridad, los de menor prioridad no toman fichas.
+    - BULK además deja libres `bulk_reserve` fichas del bucket global: un burst de
+      retrieveBars nunca vacía el cupo que necesita una orden.
+    - usage() muestra cuán cerca está cada bucket de su presupuesto.
+    """
+
+    def __init__(self, global_bucket: TokenBucket, endpoint_buckets: Optional[Dict[str, TokenBucket]] = None,
+                 priorities: Optional[Dict[str, int]] = None, bulk_reserve: float = 0.0) -> None:
+        self.global_bucket = global_bucket
+        self.endpoint_buckets = dict(endpoint_buckets or {})
+        self.priorities = dict(priorities or {})
+        bulk_reserve = min(max(float(bulk_reserve), 0.0), global_bucket.capacity - 1.0)
+        self.reserve = {CRITICAL: 0.0, NORMAL: 0.0, BULK: bulk_reserve}
+        self._cond = threading.Condition()
+        self._waiting = {CRITICAL: 0, NORMAL: 0, BULK: 0}
+        self.granted = {CRITICAL: 0, NORMAL: 0, BULK: 0}
+        self.waits = {CRITICAL: 0, NORMAL: 0, BULK: 0}
+        self.wait_sec = {CRITICAL: 0.0, NORMAL: 0.0, BULK: 0.0}
+
+    def priority_of(self, path: str) -> int:
+        return self.priorities.get(path, NORMAL)
+
+    def acquire(self, path: str, priority: Optional[int] = None, timeout: Optional[float] = None) -> float:
+        """Bloquea hasta tener cupo; devuelve los segundos esperados. RateLimitTimeout si vence."""
+        prio = self.priority_of(path) if priority is None else priority
+        ep = self.endpoint_buckets.get(path)
+        t0 = time.monotonic()
+        blocked = False
+        with self._cond:
+            self._waiting[prio] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.global_bucket.refill(now)
+                    if ep is not None:
+                        ep.refill(now)
+                    if any(self._waiting[p] for p in range(prio)):
+                        wait = 0.05              # cede a los más prioritarios
+                    else:
+                        need = 1.0 + self.reserve[prio]
+                        wait = max(self.global_bucket.time_until(need),
+                                   ep.time_until(1.0) if ep is not None else 0.0)
+                        if wait <= 0.0:
+                            self.global_bucket.take(now)
+                            if ep is not None:
+                                ep.take(now)
+                            waited = now - t0
+                            self.granted[prio] += 1
+                            if blocked:
+                                self.waits[prio] += 1
+                                self.wait_sec[prio] += waited
+                            return waited
+                    if timeout is not None:
+                        left = timeout - (now - t0)
+                        if left <= 0.0:
+                            raise RateLimitTimeout(f"sin cupo para {path} tras {now - t0:.2f}s")
+                        wait = min(wait, left)
+                    blocked = True
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[prio] -= 1
+                self._cond.notify_all()
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        """
+        % del presupuesto en uso por bucket (100 = agotado) y esperas por prioridad.
+        Con quota/window (for_window) el % es lo otorgado en la ventana móvil vs el límite real.
+        """
+        now = time.monotonic()
+        out: Dict[str, Dict[str, float]] = {}
+        with self._cond:
+            for name, b in [("*", self.global_bucket)] + sorted(self.endpoint_buckets.items()):
+                b.refill(now)
+                row = {"available": round(b.tokens, 2), "capacity": b.capacity}
+                if b.quota is not None:
+                    used = b.used_in_window(now)
+                    row.update({"quota": b.quota, "window_sec": b.window, "used": used,
+                                "used_pct": round(100.0 * used / b.quota, 1)})
+                else:
+                    row["used_pct"] = round(100.0 * (1.0 - b.tokens / b.capacity), 1)
+                out[name] = row
+            for p, label in PRIORITY_NAMES.items():
+                out[f"prio:{label}"] = {
+                    "granted": self.granted[p],
+                    "waits": self.waits[p],
+                    "wait_sec": round(self.wait_sec[p], 3),
+                    "waiting": self._waiting[p],
+                }
+        return out
@@ -0,0 +1,162 @@
+# app/brokers/replay_client.py
+from __future__ import annotations
+
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.brokers.resilience import HttpMetrics
+from app.data.bar_file import BarColumns, open_bars
+from app.data.bar_store import UNIT_SECONDS
+from app.trading.scheduler import Clock, SimulatedClock
+
+Key = Tuple[str, int, int]     # (contractId, unit, unitNumber), igual que BarStore
+
+NS = 1_000_000_000
+BARS_PATH = "/api/History/retrieveBars"
+
+
+def _ns(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(round(dt.timestamp() * NS))
+
+
+class ReplayClient:
+    """
+    Stand-in de ProjectXClient para replay/tests: sirve velas grabadas sin red.
+    - Fuente: respuestas de retrieveBars grabadas (PROJECTX_RECORD_BARS) y/o el cache de
+      BarStore (BAR_CACHE_DIR); ante la misma vela gana la última grabada.
+    - Sólo se ven las velas ya cerradas según `clock` (t + duración <= ahora), como en vivo.
+    - Misma interfaz que usan MarketMonitor y signal_trader (login, contratos, velas, métricas).
+    - includePartialBar no tiene equivalente grabado: se sirven sólo velas cerradas.
+    """
+
+    def __init__(self, series: Optional[Dict[Key, BarColumns]] = None, clock: Optional[Clock] = None,
+                 contracts: Optional[Dict[str, str]] = None) -> None:
+        self.series: Dict[Key, BarColumns] = dict(series or {})
+        self.clock: Clock = clock or SimulatedClock(0.0)
+        # símbolo -> contractId (para search_contracts)
+        self.contracts: Dict[str, str] = {k.strip().upper(): v for k, v in (contracts or {}).items()}
+        self._token: Optional[str] = "replay"
+        self.bar_store = None
+        self.http_metrics = HttpMetrics()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    # ------------- Fuentes -------------
+
+    def add(self, key: Key, cols: BarColumns) -> None:
+        """Fusiona velas en la serie `key` (ante el mismo t gana `cols`)."""
+        key = (key[0], int(key[1]), int(key[2]))
+        prev = self.series.get(key)
+        self.series[key] = cols if prev is None else prev.merge(cols)
+
+    @classmethod
+    def from_recording(cls, path: str, clock: Optional[Clock] = None,
+                       contracts: Optional[Dict[str, str]] = None) -> "ReplayClient":
+        """Desde el JSONL de PROJECTX_RECORD_BARS (una línea por respuesta de retrieveBars)."""
+        raw: Dict[Key, List[Dict[str, Any]]] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                key = (str(rec["contractId"]), int(rec["unit"]), int(rec["unitNumber"]))
+                raw.setdefault(key, []).extend(rec.get("bars") or [])
+        # from_dicts ordena y deduplica en orden de grabación (la última corrección gana)
+        return cls({k: BarColumns.from_dicts(v) for k, v in raw.items()}, clock, contracts)
+
+    @classmethod
+    def from_bar_cache(cls, root: str, contract_ids: Iterable[str], clock: Optional[Clock] = None,
+                       unit: int = 2, unit_number: int = 15,
+                       contracts: Optional[Dict[str, str]] = None) -> "ReplayClient":
+        """Desde el cache columnar de BarStore (memmap de sólo lectura, sin copia)."""
+        series = {(cid, int(unit), int(unit_number)): open_bars(root, cid, unit, unit_number)
+                  for cid in contract_ids}
+        return cls(series, clock, contracts)
+
+    # ------------- Auth / contratos -------------
+
+    def login_with_key(self) -> str:
+        self._token = "replay"
+        return self._token
+
+    def _contract_ids(self) -> List[str]:
+        return sorted({k[0] for k in self.series} | set(self.contracts.values()))
+
+    def search_contracts(self, text: str, live: bool = False) -> List[Dict[str, Any]]:
+        """Por símbolo configurado o por la raíz del contractId (CON.F.US.<raíz>.<vto>)."""
+        t = text.strip().upper()
+        if t in self.contracts:
+            return [{"id": self.contracts[t], "activeContract": True}]
+        return [{"id": cid, "activeContract": True} for cid in self._contract_ids()
+                if t in cid.upper().split(".")]
+
+    def search_contracts_by_id(self, contract_id: str) -> List[Dict[str, Any]]:
+        return [{"id": cid, "activeContract": True} for cid in self._contract_ids() if cid == contract_id]
+
+    # ------------- History / Bars -------------
+
+    def retrieve_bar_columns(
+        self,
+        contract_id: str,
+        live: bool,
+        unit: int,
+        unit_number: int,
+        limit: int = 400,
+        lookback_days: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> BarColumns:
+        """Mismo contrato que ProjectXClient.retrieve_bar_columns, con `ahora` = clock."""
+        now = datetime.fromtimestamp(self.clock.time(), tz=timezone.utc)
+        if end_time is None:
+            end_time = now
+        if start_time is None:
+            days = lookback_days if (lookback_days and lookback_days > 0) else 7
+            start_time = end_time - timedelta(days=days)
+
+        with self._lock:
+            self.calls += 1
+        self.http_metrics.request(BARS_PATH)
+        self.http_metrics.attempt(BARS_PATH, 0.0, False)
+
+        ser = self.series.get((contract_id, int(unit), int(unit_number)))
+        if ser is None or len(ser) == 0:
+            return BarColumns.empty()
+        # velas cerradas a esta hora: apertura + duración <= ahora
+        bar_ns = UNIT_SECONDS[int(unit)] * int(unit_number) * NS
+        closed = int(np.searchsorted(ser.t, _ns(now) - bar_ns, side="right"))
+        return ser.slice(0, closed).between(_ns(start_time), _ns(end_time), int(limit))
+
+    def retrieve_bars(
+        self,
+        contract_id: str,
+        live: bool,
+        unit: int,
+        unit_number: int,
+        include_partial: bool = False,
+        limit: int = 400,
+        lookback_days: Optional[int] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.retrieve_bar_columns(contract_id, live, unit, unit_number, limit, lookback_days,
+                                         start_time, end_time).to_dicts()
+
+    # ------------- Métricas -------------
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"endpoints": self.http_metrics.snapshot(), "breaker": "replay", "breaker_opens": 0,
+                "rate_limit": {}}
+
+    def budget_summary(self) -> str:
+        return f"replay ({self.calls} retrieveBars)"
@@ -0,0 +1,168 @@
+# app/brokers/resilience.py
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+import requests
+
+# Respuestas transitorias: se pueden reintentar en endpoints idempotentes
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """El gateway viene fallando: se corta sin hacer el request (hereda ConnectionError)."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 3            # intentos totales (1 = sin reintentos)
+    base_sec: float = 0.2        # backoff exponencial con jitter completo
+    cap_sec: float = 2.0
+    idempotent: bool = True      # False: sólo reintentar si el request seguro no llegó
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # attempt: 1 tras el primer fallo; Retry-After del gateway manda si es mayor
+        delay = random.uniform(0.0, min(self.cap_sec, self.base_sec * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.cap_sec * 4))
+        return delay
+
+    def should_retry(self, attempt: int, status: Optional[int] = None,
+                     error: Optional[BaseException] = None) -> bool:
+        if attempt >= self.attempts:
+            return False
+        if not self.idempotent:
+            # p.ej. /api/Order/place: un reintento ciego puede duplicar la orden.
+            # Sólo es seguro si la conexión nunca se estableció o el gateway rechazó por cuota.
+            return isinstance(error, requests.ConnectTimeout) or status == 429
+        if error is not None:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return status in RETRY_STATUS
+
+
+class CircuitBreaker:
+    """
+    closed -> open tras `threshold` fallas seguidas (5xx / red); open corta durante
+    `reset_sec`; luego half-open deja pasar un request de prueba: éxito cierra, falla reabre.
+    """
+
+    def __init__(self, threshold: int = 5, reset_sec: float = 15.0) -> None:
+        self.threshold = max(1, int(threshold))
+        self.reset_sec = float(reset_sec)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_sec:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_sec or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self) -> None:
+        """Libera el request de prueba (half-open) sin registrar resultado."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    self.opens += 1
+                self._opened_at = time.monotonic()
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "attempts", "retries", "failures", "rejected", "lat")
+
+    def __init__(self, window: int) -> None:
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0               # cortados por el circuit breaker
+        self.lat: Deque[float] = deque(maxlen=window)
+
+
+class HttpMetrics:
+    """Contadores y latencias (ventana de las últimas `window` respuestas) por endpoint."""
+
+    def __init__(self, window: int = 512) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def _get(self, path: str) -> _EndpointStats:
+        st = self._stats.get(path)
+        if st is None:
+            st = self._stats[path] = _EndpointStats(self.window)
+        return st
+
+    def request(self, path: str) -> None:
+        with self._lock:
+            self._get(path).requests += 1
+
+    def attempt(self, path: str, latency_sec: float, retry: bool) -> None:
+        with self._lock:
+            st = self._get(path)
+            st.attempts += 1
+            st.retries += int(retry)
+            st.lat.append(latency_sec)
+
+    def failure(self, path: str) -> None:
+        with self._lock:
+            self._get(path).failures += 1
+
+    def rejected(self, path: str) -> None:
+        with self._lock:
+            self._get(path).rejected += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        out: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for path, st in self._stats.items():
+                lat = sorted(st.lat)
+                pct = (lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000.0) if lat else (lambda q: 0.0)
+                out[path] = {
+                    "requests": st.requests,
+                    "attempts": st.attempts,
+                    "retries": st.retries,
+                    "failures": st.failures,
+                    "rejected": st.rejected,
+                    "p50_ms": round(pct(0.50), 1),
+                    "p95_ms": round(pct(0.95), 1),
+                    "max_ms": round(lat[-1] * 1000.0, 1) if lat else 0.0,
+                }
+        return out
+
+    def summary(self) -> str:
+        parts = []
+        for path, m in sorted(self.snapshot().items()):
+            parts.append(f"{path.rsplit('/', 2)[-2]}/{path.rsplit('/', 1)[-1]} "
+                         f"n={m['requests']} retry={m['retries']} fail={m['failures']} "
+                         f"p50={m['p50_ms']}ms p95={m['p95_ms']}ms")
+        return " | ".join(parts)
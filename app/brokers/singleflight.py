@@ -0,0 +1,80 @@
+# app/brokers/singleflight.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalescing de llamadas idénticas (misma key):
+    - Concurrentes: la primera ejecuta fn(), las demás esperan y reciben el mismo resultado
+      (o la misma excepción).
+    - Micro-cache: un resultado exitoso se reutiliza durante `ttl` segundos; ttl=0 la desactiva.
+    Los errores nunca se cachean.
+    """
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = 256) -> None:
+        self.ttl = max(float(ttl), 0.0)
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, _Call] = {}
+        self._cache: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0          # ejecuciones reales de fn()
+        self.shared = 0         # esperaron una llamada en vuelo
+        self.cached = 0         # servidas por la micro-cache
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            hit = self._cache.get(key)
+            if hit is not None:
+                if now - hit[0] < self.ttl:
+                    self.cached += 1
+                    return hit[1]
+                del self._cache[key]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if call.error is None and self.ttl > 0:
+                    if len(self._cache) >= self.max_entries:
+                        self._evict_locked()
+                    self._cache[key] = (time.monotonic(), call.result)
+            call.done.set()
+        return call.result
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        for k in [k for k, (t, _) in self._cache.items() if now - t >= self.ttl]:
+            del self._cache[k]
+        while len(self._cache) >= self.max_entries:
+            self._cache.pop(next(iter(self._cache)))
@@ -0,0 +1,134 @@
+# app/brokers/stream_hub.py
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+from app.brokers.market_stream import HAVE_WEBSOCKETS, NS, parse_ts_ns, websockets
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    """JSONL de mensajes trade/quote (p.ej. grabado con MARKET_STREAM_RECORD), ordenado por t."""
+    out: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if msg.get("type") in ("trade", "quote") and "t" in msg:
+                out.append(msg)
+    out.sort(key=lambda m: parse_ts_ns(m["t"]))
+    return out
+
+
+class LocalStreamHub:
+    """
+    Hub WebSocket local que reemplaza al streaming del gateway en pruebas: reproduce
+    ticks grabados respetando sus tiempos (divididos por `speed`; speed<=0 = sin esperas).
+    - Cada conexión recibe su propio replay desde el principio, sólo de los contratos suscriptos.
+    - Entre ticks manda {"type": "clock"} con el tiempo de mercado, así el cliente cierra
+      velas aunque no haya un tick posterior; al terminar, un clock final cierra la última.
+    """
+
+    def __init__(self, recording: Union[str, Iterable[Dict[str, Any]]], host: str = "127.0.0.1",
+                 port: int = 8765, speed: float = 1.0, clock_sec: float = 1.0) -> None:
+        if not HAVE_WEBSOCKETS:
+            raise RuntimeError("LocalStreamHub requiere el paquete 'websockets'")
+        self.ticks = load_recording(recording) if isinstance(recording, str) else \
+            sorted(recording, key=lambda m: parse_ts_ns(m["t"]))
+        self.host = host
+        self.port = int(port)
+        self.speed = float(speed)
+        self.clock_ns = max(int(clock_sec * NS), 1)
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    async def _handler(self, ws, *_: Any) -> None:
+        subs: Set[str] = set()
+        subscribed = asyncio.Event()
+
+        async def reader() -> None:
+            async for raw in ws:
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    continue
+                cid = str(msg.get("contractId", ""))
+                if msg.get("action") == "subscribe":
+                    subs.add(cid)
+                    subscribed.set()
+                elif msg.get("action") == "unsubscribe":
+                    subs.discard(cid)
+
+        task = asyncio.create_task(reader())
+        try:
+            await subscribed.wait()
+            prev: Optional[int] = None
+            for msg in self.ticks:
+                t = parse_ts_ns(msg["t"])
+                if prev is not None:
+                    if self.speed > 0 and t > prev:
+                        await asyncio.sleep((t - prev) / NS / self.speed)
+                    boundary = (t // self.clock_ns) * self.clock_ns
+                    if boundary > prev:
+                        await ws.send(json.dumps({"type": "clock", "t": boundary}))
+                prev = t
+                if msg.get("contractId") in subs:
+                    await ws.send(json.dumps(msg))
+            if prev is not None:
+                await ws.send(json.dumps({"type": "clock", "t": prev + 86400 * NS}))
+            await ws.wait_closed()
+        except Exception:
+            pass
+        finally:
+            task.cancel()
+
+    async def serve_forever(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        async with websockets.serve(self._handler, self.host, self.port) as server:
+            self._server = server
+            if self.port == 0:
+                self.port = next(iter(server.sockets)).getsockname()[1]
+            self._ready.set()
+            await asyncio.Future()
+
+    def start_in_thread(self) -> "LocalStreamHub":
+        """Arranca el hub en un hilo daemon (port=0 elige uno libre); url en self.url."""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve_forever()),
+                                        name="stream-hub", daemon=True)
+        self._thread.start()
+        self._ready.wait(5.0)
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Hub WebSocket local que reproduce ticks grabados")
+    ap.add_argument("recording", help="JSONL de ticks (MARKET_STREAM_RECORD)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--speed", type=float, default=1.0, help="x veces tiempo real; 0 = sin esperas")
+    args = ap.parse_args()
+    hub = LocalStreamHub(args.recording, args.host, args.port, args.speed)
+    print(f"[StreamHub] {len(hub.ticks)} ticks en ws://{args.host}:{args.port} (speed={args.speed})")
+    asyncio.run(hub.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# app/brokers/token_manager.py
+from __future__ import annotations
+
+import os
+import base64
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+import requests
+
+if TYPE_CHECKING:
+    from app.brokers.projectx_api import ProjectXClient
+
+# Vida del token si no trae "exp" (JWT); el gateway emite tokens de ~24 h
+TOKEN_TTL_SEC: float = float(os.getenv("PROJECTX_TOKEN_TTL_SEC", str(24 * 3600)))
+# Renovar con este margen antes de vencer (en segundo plano, fuera de los cierres)
+TOKEN_REFRESH_MARGIN_SEC: float = float(os.getenv("PROJECTX_TOKEN_REFRESH_MARGIN_SEC", str(2 * 3600)))
+TOKEN_RETRY_SEC: float = 60.0
+
+
+def _jwt_exp(token: str) -> Optional[float]:
+    # sólo lee el claim "exp"; la firma la valida el gateway
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        pad = "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(parts[1] + pad))
+        exp = claims.get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class TokenManager:
+    """
+    Ciclo de vida del token de sesión de ProjectXClient.
+    - Vencimiento: claim "exp" del JWT o, si no hay, login + TOKEN_TTL_SEC.
+    - Hilo daemon que despierta TOKEN_REFRESH_MARGIN_SEC antes de vencer: /api/Auth/validate
+      (adopta `newToken` si viene) y, si falla, re-login. Reintenta cada TOKEN_RETRY_SEC.
+    - reauth(): re-login síncrono tras un 401; si otro hilo ya renovó el token, no repite.
+    """
+
+    def __init__(self, px: "ProjectXClient", background: bool = True) -> None:
+        self.px = px
+        self.background = background
+        self.expires_at: Optional[float] = None
+        self.refreshes = 0
+        self.reauths = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------- Estado -------------
+
+    def on_token(self, token: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self.expires_at = _jwt_exp(token) or (now + TOKEN_TTL_SEC)
+        self._wake.set()           # recalcular el próximo refresh
+        if self.background and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="projectx-token", daemon=True)
+            self._thread.start()
+
+    def refresh_at(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - TOKEN_REFRESH_MARGIN_SEC
+
+    def needs_refresh(self, now: Optional[float] = None) -> bool:
+        at = self.refresh_at()
+        now = time.time() if now is None else now
+        return at is not None and now >= at
+
+    # ------------- Renovación -------------
+
+    def refresh(self) -> bool:
+        """validate -> newToken; si no sirve, re-login. True si quedó un token vigente."""
+        with self._lock:
+            try:
+                data = self.px._post("/api/Auth/validate", {})
+                new = (data or {}).get("newToken")
+                if new:
+                    self.px._set_token(new)
+                    self.refreshes += 1
+                    return True
+            except (requests.RequestException, RuntimeError) as e:
+                print("[ProjectXClient][WARN] validate:", e)
+            try:
+                self.px.login_with_key()
+                self.refreshes += 1
+                return True
+            except Exception as e:
+                print("[ProjectXClient][WARN] re-login:", e)
+                return False
+
+    def reauth(self, stale_token: Optional[str]) -> bool:
+        """Tras un 401 con `stale_token`: re-login salvo que otro hilo ya lo haya renovado."""
+        with self._lock:
+            if self.px._token and self.px._token != stale_token:
+                return True
+            try:
+                self.px.login_with_key()
+                self.reauths += 1
+                return True
+            except Exception as e:
+                print("[ProjectXClient][WARN] re-login tras 401:", e)
+                return False
+
+    def _run(self) -> None:
+        while True:
+            at = self.refresh_at()
+            wait = TOKEN_RETRY_SEC if at is None else max(at - time.time(), 0.0)
+            self._wake.clear()
+            if self._wake.wait(timeout=wait):
+                continue           # token nuevo: reprogramar
+            if self.needs_refresh() and not self.refresh():
+                self._wake.wait(timeout=TOKEN_RETRY_SEC)
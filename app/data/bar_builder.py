@@ -0,0 +1,80 @@
+# app/data/bar_builder.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+NS = 1_000_000_000
+
+
+@dataclass
+class BuiltBar:
+    t: int            # apertura de la vela, epoch-ns UTC (misma convención que el gateway)
+    o: float
+    h: float
+    l: float
+    c: float
+    v: float
+    ticks: int = 0
+
+
+class BarBuilder:
+    """
+    Arma velas OHLCV de `bar_seconds` a partir de trades/quotes en tiempo real.
+    - on_tick(): acumula en la vela en curso; un tick de un intervalo posterior cierra la actual.
+    - on_time(): cierra la vela en curso apenas el reloj pasa el fin del intervalo, sin
+      esperar al próximo tick (ahí está la latencia de milisegundos).
+    - Ticks atrasados (de una vela ya cerrada o anterior a la abierta) se descartan y se
+      cuentan en `late_ticks`.
+    Intervalos sin ticks no generan vela (igual que el gateway).
+    """
+
+    def __init__(self, bar_seconds: int) -> None:
+        if bar_seconds < 1:
+            raise ValueError(f"bar_seconds inválido: {bar_seconds}")
+        self.bar_ns = int(bar_seconds) * NS
+        self.cur: Optional[BuiltBar] = None
+        self.last_closed_t: Optional[int] = None
+        self.late_ticks = 0
+
+    def _start(self, ts_ns: int) -> int:
+        return (int(ts_ns) // self.bar_ns) * self.bar_ns
+
+    def deadline_ns(self) -> Optional[int]:
+        """Fin del intervalo de la vela en curso (None si no hay vela abierta)."""
+        return None if self.cur is None else self.cur.t + self.bar_ns
+
+    def on_tick(self, ts_ns: int, price: float, size: float = 0.0) -> List[BuiltBar]:
+        start = self._start(ts_ns)
+        # atrasado: de una vela ya cerrada o anterior a la que está abierta (no se mezcla en ella)
+        if (self.last_closed_t is not None and start <= self.last_closed_t) or \
+                (self.cur is not None and start < self.cur.t):
+            self.late_ticks += 1
+            return []
+        out: List[BuiltBar] = []
+        cur = self.cur
+        if cur is not None and start > cur.t:
+            out.append(self._close())
+            cur = None
+        price = float(price)
+        if cur is None:
+            self.cur = BuiltBar(t=start, o=price, h=price, l=price, c=price, v=float(size), ticks=1)
+        else:
+            if price > cur.h:
+                cur.h = price
+            if price < cur.l:
+                cur.l = price
+            cur.c = price
+            cur.v += float(size)
+            cur.ticks += 1
+        return out
+
+    def on_time(self, now_ns: int) -> List[BuiltBar]:
+        if self.cur is not None and int(now_ns) >= self.cur.t + self.bar_ns:
+            return [self._close()]
+        return []
+
+    def _close(self) -> BuiltBar:
+        bar, self.cur = self.cur, None
+        self.last_closed_t = bar.t
+        return bar
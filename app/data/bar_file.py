@@ -0,0 +1,187 @@
+# app/data/bar_file.py
+from __future__ import annotations
+
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Formato columnar: un archivo binario por columna, ancho fijo little-endian, sin header.
+#   t.bin : int64   epoch en nanosegundos UTC (apertura de la vela, igual que "t" del gateway)
+#   o/h/l/c/v.bin : float64
+# La cantidad de velas es tamaño / 8. Se escribe primero OHLCV y al final t, así un corte a
+# mitad de un append deja columnas más largas que t y se recortan al abrir.
+COLUMNS = ("t", "o", "h", "l", "c", "v")
+DTYPES: Dict[str, str] = {"t": "<i8", "o": "<f8", "h": "<f8", "l": "<f8", "c": "<f8", "v": "<f8"}
+ITEMSIZE = 8
+
+
+def _iso_ns(ns: int) -> str:
+    sec, rem = divmod(int(ns), 1_000_000_000)
+    dt = datetime.fromtimestamp(sec, tz=timezone.utc)
+    if rem:
+        dt = dt.replace(microsecond=rem // 1000)
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def _parse_ns(t: Any) -> int:
+    dt = datetime.fromisoformat(str(t).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+
+@dataclass
+class BarColumns:
+    """Velas en arrays paralelos (ordenadas por t, sin duplicados)."""
+    t: np.ndarray
+    o: np.ndarray
+    h: np.ndarray
+    l: np.ndarray
+    c: np.ndarray
+    v: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.t.shape[0])
+
+    @classmethod
+    def empty(cls) -> "BarColumns":
+        return cls(*(np.empty(0, dtype=DTYPES[k]) for k in COLUMNS))
+
+    @classmethod
+    def from_dicts(cls, bars: List[Dict[str, Any]]) -> "BarColumns":
+        """Desde el formato del gateway ({"t","o","h","l","c","v"}); ordena y deduplica (gana la última)."""
+        if not bars:
+            return cls.empty()
+        t = np.fromiter((_parse_ns(b["t"]) for b in bars), dtype="<i8", count=len(bars))
+        vals = {k: np.fromiter((float(b.get(k) or 0.0) for b in bars), dtype="<f8", count=len(bars))
+                for k in COLUMNS[1:]}
+        # último índice de cada t (las repeticiones posteriores corrigen a las anteriores)
+        rev_t = t[::-1]
+        _, idx_rev = np.unique(rev_t, return_index=True)
+        idx = len(t) - 1 - idx_rev
+        return cls(t[idx], *(vals[k][idx] for k in COLUMNS[1:]))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        t, o, h, l, c, v = (self.t.tolist(), self.o.tolist(), self.h.tolist(),
+                            self.l.tolist(), self.c.tolist(), self.v.tolist())
+        return [{"t": _iso_ns(t[i]), "o": o[i], "h": h[i], "l": l[i], "c": c[i], "v": v[i]}
+                for i in range(len(t))]
+
+    def slice(self, lo: int, hi: int) -> "BarColumns":
+        return BarColumns(*(getattr(self, k)[lo:hi] for k in COLUMNS))
+
+    def between(self, start_ns: int, end_ns: int, limit: Optional[int] = None) -> "BarColumns":
+        """Vista (sin copia) de las velas con start_ns <= t <= end_ns; las `limit` más recientes."""
+        lo = int(np.searchsorted(self.t, start_ns, side="left"))
+        hi = int(np.searchsorted(self.t, end_ns, side="right"))
+        if limit is not None and limit > 0:
+            lo = max(lo, hi - int(limit))
+        return self.slice(lo, hi)
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        return self.t.view("datetime64[ns]")
+
+    def merge(self, other: "BarColumns") -> "BarColumns":
+        """Unión ordenada; ante el mismo t gana `other`."""
+        if len(self) == 0:
+            return other
+        if len(other) == 0:
+            return self
+        cat = [np.concatenate([getattr(self, k), getattr(other, k)]) for k in COLUMNS]
+        t = cat[0]
+        rev = t[::-1]
+        _, idx_rev = np.unique(rev, return_index=True)
+        idx = len(t) - 1 - idx_rev
+        return BarColumns(*(col[idx] for col in cat))
+
+
+class ColumnarBarFile:
+    """
+    Directorio con una columna por archivo para un (contrato, timeframe).
+    - open(mmap=True): arrays np.memmap de sólo lectura (zero-copy, sin parseo).
+    - append(): agrega velas posteriores a la última; write(): reescritura atómica
+      (directorio temporal + rename) para backfills hacia atrás o correcciones.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._recover()
+
+    def _col(self, name: str, base: Optional[str] = None) -> str:
+        return os.path.join(base or self.path, f"{name}.bin")
+
+    def _recover(self) -> None:
+        # corte durante write(): el directorio viejo quedó como .old
+        old = self.path + ".old"
+        if not os.path.isdir(self.path) and os.path.isdir(old):
+            os.replace(old, self.path)
+        elif os.path.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self._col("t")) // ITEMSIZE
+        except OSError:
+            return 0
+
+    def exists(self) -> bool:
+        return os.path.isfile(self._col("t"))
+
+    def open(self, mmap: bool = True) -> BarColumns:
+        n = len(self)
+        if n == 0:
+            return BarColumns.empty()
+        cols = []
+        for k in COLUMNS:
+            if mmap:
+                cols.append(np.memmap(self._col(k), dtype=DTYPES[k], mode="r", shape=(n,)))
+            else:
+                cols.append(np.fromfile(self._col(k), dtype=DTYPES[k], count=n))
+        return BarColumns(*cols)
+
+    def last_t(self) -> Optional[int]:
+        n = len(self)
+        if n == 0:
+            return None
+        with open(self._col("t"), "rb") as f:
+            f.seek((n - 1) * ITEMSIZE)
+            return int(np.frombuffer(f.read(ITEMSIZE), dtype="<i8")[0])
+
+    def append(self, cols: BarColumns) -> None:
+        if len(cols) == 0:
+            return
+        last = self.last_t()
+        if last is not None and int(cols.t[0]) <= last:
+            raise ValueError("append fuera de orden: usar write() con el merge")
+        os.makedirs(self.path, exist_ok=True)
+        n = len(self)
+        for k in COLUMNS[1:] + ("t",):
+            with open(self._col(k), "ab") as f:
+                # descartar cola huérfana de un append cortado
+                f.truncate(n * ITEMSIZE)
+                f.seek(n * ITEMSIZE)
+                f.write(np.ascontiguousarray(getattr(cols, k), dtype=DTYPES[k]).tobytes())
+
+    def write(self, cols: BarColumns) -> None:
+        tmp = self.path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for k in COLUMNS:
+            np.ascontiguousarray(getattr(cols, k), dtype=DTYPES[k]).tofile(self._col(k, tmp))
+        old = self.path + ".old"
+        if os.path.isdir(self.path):
+            os.replace(self.path, old)
+        os.replace(tmp, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def open_bars(root: str, contract_id: str, unit: int = 2, unit_number: int = 15) -> BarColumns:
+    """Abre (memmap, sólo lectura) el histórico cacheado por BarStore para análisis offline."""
+    from app.data.bar_store import series_path
+    return ColumnarBarFile(series_path(root, (contract_id, unit, unit_number)) + ".bars").open(mmap=True)
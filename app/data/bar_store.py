@@ -0,0 +1,229 @@
+# app/data/bar_store.py
+from __future__ import annotations
+
+import os
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.data.bar_file import BarColumns, ColumnarBarFile, COLUMNS
+
+# Segundos por unidad de retrieveBars (1=Second, 2=Minute, 3=Hour, 4=Day).
+# Semana/Mes no tienen duración fija: esas consultas no pasan por el cache.
+UNIT_SECONDS: Dict[int, int] = {1: 1, 2: 60, 3: 3600, 4: 86400}
+
+# Máximo de velas pedidas al gateway en un solo request de backfill
+MAX_FETCH_BARS: int = int(os.getenv("BAR_CACHE_MAX_FETCH", "20000"))
+
+Key = Tuple[str, int, int]                       # (contractId, unit, unitNumber)
+Fetch = Callable[[datetime, datetime, int], List[Dict[str, Any]]]
+
+
+def _epoch(dt: datetime) -> int:
+    return int(dt.astimezone(timezone.utc).timestamp())
+
+
+def _bar_epoch(bar: Dict[str, Any]) -> int:
+    return _epoch(datetime.fromisoformat(str(bar["t"]).replace("Z", "+00:00")))
+
+
+NS = 1_000_000_000
+
+
+def series_path(root: str, key: Key) -> str:
+    contract, unit, unit_number = key
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", contract)
+    return os.path.join(root, f"{safe}_{int(unit)}_{int(unit_number)}")
+
+
+def _from_epoch(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def _merge(intervals: List[List[int]]) -> List[List[int]]:
+    out: List[List[int]] = []
+    for s, e in sorted(intervals):
+        if out and s <= out[-1][1] + 1:   # contiguos (epoch enteros) también se unen
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+class _Series:
+    """Velas de una key (columnas en memoria + archivo) y cobertura (intervalos ya consultados)."""
+
+    def __init__(self, file: ColumnarBarFile) -> None:
+        self.file = file
+        self.cols: BarColumns = BarColumns.empty()
+        self.coverage: List[List[int]] = []
+
+
+class BarStore:
+    """
+    Cache persistente y append-only de velas cerradas por (contractId, unit, unitNumber).
+    - <root>/<contrato>_<unit>_<unitNumber>.bars/ : formato columnar de ancho fijo
+      (ver ColumnarBarFile); velas nuevas se agregan al final, backfills hacia atrás o
+      correcciones del gateway reescriben la serie.
+    - <root>/<...>.cov.json : intervalos [start, end] (epoch s) ya consultados al gateway,
+      para distinguir "no hay velas" (fin de semana, halt) de "nunca se pidió".
+    - retrieve() lee del disco y sólo pide al gateway los rangos que faltan.
+    La última vela cerrada nunca se marca como cubierta: el gateway puede publicarla con
+    retraso y se vuelve a pedir en la siguiente consulta.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._series: Dict[Key, _Series] = {}
+        self._lock = threading.Lock()                    # protege el dict de locks
+        self._key_locks: Dict[Key, threading.RLock] = {}  # un lock por serie: símbolos en paralelo
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["BarStore"]:
+        if os.getenv("BAR_CACHE", "true").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(os.getenv("BAR_CACHE_DIR", "bar_cache"))
+
+    # ------------- Archivos -------------
+
+    def _key_lock(self, key: Key) -> threading.RLock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.RLock()
+            return lock
+
+    def _path(self, key: Key) -> str:
+        return series_path(self.root, key)
+
+    def _load(self, key: Key) -> _Series:
+        ser = self._series.get(key)
+        if ser is not None:
+            return ser
+        base = self._path(key)
+        ser = _Series(ColumnarBarFile(base + ".bars"))
+        # lectura en bloque (sin mmap: la serie se reescribe en backfills y Windows no
+        # permite reemplazar archivos mapeados)
+        ser.cols = ser.file.open(mmap=False)
+        if not ser.file.exists() and os.path.isfile(base + ".jsonl"):
+            ser.cols = self._migrate_jsonl(base + ".jsonl", ser.file)
+        try:
+            with open(base + ".cov.json", "r", encoding="utf-8") as f:
+                ser.coverage = _merge([[int(s), int(e)] for s, e in json.load(f)])
+        except Exception:
+            ser.coverage = []
+        self._series[key] = ser
+        return ser
+
+    @staticmethod
+    def _migrate_jsonl(path: str, file: ColumnarBarFile) -> BarColumns:
+        # formato anterior (una vela JSON por línea) -> columnar, una sola vez
+        bars: List[Dict[str, Any]] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    bars.append(json.loads(line))
+                except Exception:
+                    continue
+        cols = BarColumns.from_dicts(bars)
+        file.write(cols)
+        os.remove(path)
+        return cols
+
+    def _append(self, key: Key, ser: _Series, bars: List[Dict[str, Any]]) -> None:
+        new = BarColumns.from_dicts(bars)
+        if len(new) == 0:
+            return
+        # sólo velas nuevas o corregidas: el tramo no cubierto se re-pide en cada consulta
+        cur = ser.cols
+        if len(cur):
+            pos = np.searchsorted(cur.t, new.t).clip(max=len(cur) - 1)
+            same = cur.t[pos] == new.t
+            for k in COLUMNS[1:]:
+                same &= getattr(cur, k)[pos] == getattr(new, k)
+            if same.any():
+                new = BarColumns(*(getattr(new, k)[~same] for k in COLUMNS))
+        if len(new) == 0:
+            return
+        if len(cur) == 0 or int(new.t[0]) > int(cur.t[-1]):
+            ser.file.append(new)
+            ser.cols = BarColumns(*(np.concatenate([getattr(cur, k), getattr(new, k)]) for k in COLUMNS))
+        else:
+            ser.cols = cur.merge(new)
+            ser.file.write(ser.cols)
+
+    def _cover(self, key: Key, ser: _Series, start: int, end: int) -> None:
+        if end < start:
+            return
+        ser.coverage = _merge(ser.coverage + [[start, end]])
+        tmp = self._path(key) + ".cov.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(ser.coverage, f)
+        os.replace(tmp, self._path(key) + ".cov.json")
+
+    # ------------- Consultas -------------
+
+    def missing_ranges(self, key: Key, start: int, end: int) -> List[Tuple[int, int]]:
+        with self._key_lock(key):
+            ser = self._load(key)
+            out: List[Tuple[int, int]] = []
+            cur = start
+            for s, e in ser.coverage:
+                if e < cur:
+                    continue
+                if s > end:
+                    break
+                if s > cur:
+                    out.append((cur, s - 1))
+                cur = max(cur, e + 1)
+                if cur > end:
+                    break
+            if cur <= end:
+                out.append((cur, end))
+            return out
+
+    def columns(self, key: Key, start: int, end: int, limit: Optional[int] = None) -> BarColumns:
+        """Velas con start <= t <= end (epoch s) en columnas, ascendente (las `limit` más recientes)."""
+        with self._key_lock(key):
+            return self._load(key).cols.between(start * NS, end * NS, limit)
+
+    def query(self, key: Key, start: int, end: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Igual que columns() pero en el formato de dicts del gateway."""
+        return self.columns(key, start, end, limit).to_dicts()
+
+    def retrieve(self, key: Key, start_time: datetime, end_time: datetime, limit: int,
+                 fetch: Fetch, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Devuelve hasta `limit` velas cerradas en [start_time, end_time], completando desde
+        `fetch(start, end, limit)` (el gateway) sólo los huecos de cobertura.
+        """
+        return self.retrieve_columns(key, start_time, end_time, limit, fetch, now).to_dicts()
+
+    def retrieve_columns(self, key: Key, start_time: datetime, end_time: datetime, limit: int,
+                         fetch: Fetch, now: Optional[float] = None) -> BarColumns:
+        """Como retrieve() pero en columnas (sin armar dicts)."""
+        _, unit, unit_number = key
+        bar_s = UNIT_SECONDS[int(unit)] * int(unit_number)
+        start, end = _epoch(start_time), _epoch(end_time)
+
+        # Cobertura hasta antes de la última vela cerrada (puede publicarse con retraso)
+        now_s = int(time.time() if now is None else now)
+        settled = (now_s // bar_s) * bar_s - bar_s - 1
+
+        with self._key_lock(key):
+            ser = self._load(key)
+            for s, e in self.missing_ranges(key, start, end):
+                want = min(MAX_FETCH_BARS, (e - s) // bar_s + 2)
+                bars = fetch(_from_epoch(s), _from_epoch(e), want)
+                closed = [b for b in bars if _bar_epoch(b) + bar_s <= now_s]
+                self._append(key, ser, closed)
+                # respuesta truncada: sólo se cubre desde la vela más vieja recibida
+                cov_start = s if len(bars) < want else min(_bar_epoch(b) for b in bars)
+                self._cover(key, ser, cov_start, min(e, settled))
+            return self.columns(key, start, end, limit)
@@ -1,8 +1,10 @@
 from __future__ import annotations
-from typing import Sequence, Optional, Iterable
+from typing import Sequence, Optional, Iterable, Union
 import pandas as pd
 import numpy as np
 
+from .streaming import EMA
+
 try:
     import talib as ta
     HAVE_TALIB = True
@@ -19,11 +21,90 @@ def ema(series: Sequence[float], period: int) -> pd.Series:
     if HAVE_TALIB:
         out = ta.EMA(s.to_numpy(dtype="float64"), timeperiod=period)
         return pd.Series(out, index=s.index, dtype="float64")
-    # fallback TA-style
-    return s.ewm(span=period, adjust=False, min_periods=period).mean()
+    # fallback TA-style: mismo kernel NumPy que ema_batch (semilla SMA, igual que TA-Lib)
+    out = ema_batch(s.to_numpy(dtype="float64"), [period], use_talib=False)[0]
+    return pd.Series(out, index=s.index, dtype="float64")
 
 def exponential_moving_average(data: Sequence[float], period: int) -> Optional[float]:
-    s = ema(_to_series(data), period)
-    if s.empty or pd.isna(s.iloc[-1]):
+    # sólo el último valor: EMA incremental (misma aritmética que TA-Lib), sin armar la serie
+    e = EMA(period)
+    for x in data:
+        e.update(x)
+    v = e.value
+    if v is None or np.isnan(v):
         return None
-    return float(s.iloc[-1])
+    return float(v)
+
+
+def ema_batch(closes: Union[np.ndarray, Sequence[float]], periods: Sequence[int],
+              out: Optional[np.ndarray] = None, use_talib: Optional[bool] = None) -> np.ndarray:
+    """
+    EMAs de varios periodos sobre una matriz de cierres (símbolos × velas) en una pasada.
+    - closes: 1-D (una serie) o 2-D (S, B); NaN iniciales = historial más corto (padding).
+    - devuelve (P, S, B) —o (P, B) si closes es 1-D— en `out` si se pasa preasignado.
+    - Semántica TA-Lib: NaN hasta la semilla (SMA de los primeros `period` valores válidos),
+      luego ((x - prev) * k) + prev. Sin TA-Lib (o use_talib=False) el kernel NumPy
+      vectoriza la recursión sobre todos los (periodo, símbolo) y da los mismos bits.
+    """
+    x = np.asarray(closes, dtype="float64")
+    squeeze = x.ndim == 1
+    if squeeze:
+        x = x[None, :]
+    if x.ndim != 2:
+        raise ValueError(f"ema_batch espera 1-D o 2-D, recibió {x.ndim}-D")
+    S, B = x.shape
+    per = np.asarray([int(p) for p in periods], dtype="int64")
+    if per.size and per.min() < 1:
+        raise ValueError(f"ema_batch periodos inválidos: {list(periods)}")
+    P = per.size
+
+    shape = (P, S, B)
+    if out is None:
+        out = np.empty((P, B) if squeeze else shape, dtype="float64")
+    elif out.shape != shape and not (squeeze and out.shape == (P, B)):
+        raise ValueError(f"ema_batch out con shape {out.shape}, se esperaba {shape}")
+    res = out.reshape(shape)
+    res.fill(np.nan)
+
+    if HAVE_TALIB and use_talib is not False:
+        for i, p in enumerate(per):
+            for j in range(S):
+                if not np.isnan(x[j]).all():
+                    res[i, j] = ta.EMA(x[j], timeperiod=int(p))
+        return out
+    _ema_batch_numpy(x, per, res)
+    return out
+
+
+def _ema_batch_numpy(x: np.ndarray, per: np.ndarray, res: np.ndarray) -> None:
+    S, B = x.shape
+    if per.size == 0 or B == 0:
+        return
+    valid = ~np.isnan(x)
+    first = np.where(valid.any(axis=1), valid.argmax(axis=1), B)               # (S,)
+
+    # semilla: suma secuencial (cumsum, como el loop de TA-Lib) de los primeros `period` valores
+    lead = np.arange(B)[None, :] < first[:, None]
+    csum = np.cumsum(np.where(lead, 0.0, x), axis=1)
+    seed_idx = first[None, :] + per[:, None] - 1                              # (P, S)
+    has_seed = seed_idx < B
+    k = (2.0 / (per + 1.0))[:, None]                                          # (P, 1)
+
+    rows = np.broadcast_to(np.arange(S)[None, :], seed_idx.shape)
+    prev = np.full(seed_idx.shape, np.nan)
+    si, sj = np.nonzero(has_seed)
+    prev[si, sj] = csum[sj, seed_idx[si, sj]] / per[si]
+    res[si, sj, seed_idx[si, sj]] = prev[si, sj]
+    if not has_seed.any():
+        return
+
+    # recursión vectorizada sobre todos los carriles (periodo, símbolo), buffers reutilizados
+    nxt = np.empty_like(prev)
+    act = np.empty(prev.shape, dtype=bool)
+    for b in range(int(seed_idx[has_seed].min()) + 1, B):
+        np.less(seed_idx, b, out=act)
+        np.subtract(x[rows, b], prev, out=nxt)
+        np.multiply(nxt, k, out=nxt)
+        np.add(nxt, prev, out=nxt)
+        np.copyto(prev, nxt, where=act)
+        np.copyto(res[:, :, b], prev, where=act)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+from collections import deque
+from typing import Iterable, List, Optional
+
+# Indicadores incrementales: update(x) O(1) por vela, sin armar pd.Series.
+# La aritmética replica la de TA-Lib (mismo orden de operaciones), así que
+# alimentando la misma serie se obtienen los mismos valores bit a bit que ta.EMA / ta.SMA.
+
+
+class EMA:
+    """
+    EMA estilo TA-Lib: semilla = SMA de las primeras `period` entradas,
+    luego ((x - prev) * k) + prev con k = 2 / (period + 1).
+    `value` es None hasta completar la semilla.
+    """
+    __slots__ = ("period", "k", "count", "_seed_sum", "_value")
+
+    def __init__(self, period: int) -> None:
+        if period < 1:
+            raise ValueError(f"EMA period inválido: {period}")
+        self.period = int(period)
+        self.k = 2.0 / (self.period + 1.0)
+        self.count = 0
+        self._seed_sum = 0.0
+        self._value: Optional[float] = None
+
+    @classmethod
+    def resume(cls, period: int, value: float, count: int) -> "EMA":
+        """Retoma desde un estado ya sembrado (p.ej. el último valor de ta.EMA sobre `count` velas)."""
+        e = cls(period)
+        e._value = float(value)
+        e.count = max(int(count), e.period)
+        return e
+
+    def update(self, x: float) -> Optional[float]:
+        x = float(x)
+        self.count += 1
+        if self._value is None:
+            self._seed_sum += x
+            if self.count == self.period:
+                self._value = self._seed_sum / self.period
+            return self._value
+        self._value = ((x - self._value) * self.k) + self._value
+        return self._value
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not None
+
+
+class SMA:
+    """
+    Media móvil simple estilo TA-Lib (suma corrida: += entrante, / period, -= saliente).
+    También sirve como rolling mean para suavizar la EMA200 mostrada.
+    `window` devuelve las últimas `period` entradas.
+    """
+    __slots__ = ("period", "_win", "_total", "_value")
+
+    def __init__(self, period: int) -> None:
+        if period < 1:
+            raise ValueError(f"SMA period inválido: {period}")
+        self.period = int(period)
+        self._win: deque = deque(maxlen=self.period)
+        self._total = 0.0          # suma de las últimas period-1 entradas
+        self._value: Optional[float] = None
+
+    @classmethod
+    def resume(cls, period: int, window: Iterable[float]) -> "SMA":
+        """Retoma desde las últimas entradas conocidas (sólo usa las últimas `period`)."""
+        s = cls(period)
+        vals = list(window)[-s.period:]
+        for x in vals:
+            s.update(x)
+        return s
+
+    def update(self, x: float) -> Optional[float]:
+        x = float(x)
+        total = self._total + x
+        self._win.append(x)
+        if len(self._win) == self.period:
+            self._value = total / self.period
+            total -= self._win[0]
+        self._total = total
+        return self._value
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not None
+
+    @property
+    def window(self) -> List[float]:
+        return list(self._win)
+
+
+# Alias: el suavizado de la EMA200 es una media móvil simple sobre la EMA base
+RollingMean = SMA
@@ -0,0 +1,199 @@
+# app/services/contract_directory.py
+from __future__ import annotations
+
+import os
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from zoneinfo import ZoneInfo
+
+NY = ZoneInfo("America/New_York")
+
+# Códigos de mes de futuros (F=ene ... Z=dic)
+MONTH_CODES = "FGHJKMNQUVXZ"
+
+ROLL_DAYS_BEFORE: int = int(os.getenv("CONTRACT_ROLL_DAYS_BEFORE", "8"))     # roll CME equity: jueves 8 días antes
+REFRESH_AHEAD_SEC: float = float(os.getenv("CONTRACT_REFRESH_AHEAD_SEC", str(2 * 86400)))
+VALIDATE_EVERY_SEC: float = float(os.getenv("CONTRACT_VALIDATE_SEC", str(6 * 3600)))
+FALLBACK_TTL_SEC: float = float(os.getenv("CONTRACT_CACHE_TTL_SEC", str(86400)))
+RETRY_SEC: float = 3600.0                                                    # gateway aún no rolleó
+
+
+def parse_contract_id(contract_id: str) -> Optional[Tuple[str, int, int]]:
+    """"CON.F.US.MNQ.Z25" -> ("MNQ", 12, 2025); None si no sigue ese formato."""
+    parts = contract_id.split(".")
+    if len(parts) < 2 or len(parts[-1]) < 2:
+        return None
+    code = parts[-1]
+    month = MONTH_CODES.find(code[0].upper()) + 1
+    if month == 0 or not code[1:].isdigit():
+        return None
+    yy = int(code[1:])
+    year = 2000 + yy if yy < 100 else yy
+    return parts[-2], month, year
+
+
+def _third_friday(year: int, month: int) -> date:
+    d = date(year, month, 1)
+    d += timedelta(days=(4 - d.weekday()) % 7)
+    return d + timedelta(weeks=2)
+
+
+def roll_epoch(contract_id: str) -> Optional[float]:
+    """Epoch del roll (apertura del día de roll, NY): vencimiento (3er viernes) - ROLL_DAYS_BEFORE."""
+    parsed = parse_contract_id(contract_id)
+    if parsed is None:
+        return None
+    _, month, year = parsed
+    d = _third_friday(year, month) - timedelta(days=ROLL_DAYS_BEFORE)
+    return datetime(d.year, d.month, d.day, tzinfo=NY).astimezone(timezone.utc).timestamp()
+
+
+Resolver = Callable[[str], Optional[str]]          # símbolo -> contractId (búsqueda en el gateway)
+Validator = Callable[[str], bool]                  # contractId -> ¿sigue activo?
+
+
+class ContractDirectory:
+    """
+    Directorio símbolo -> contractId, en memoria y en disco (JSON).
+    - Cada entrada vence en el roll del contrato (3er viernes - ROLL_DAYS_BEFORE);
+      ids sin código de mes vencen tras CONTRACT_CACHE_TTL_SEC.
+    - lookup() es una lectura en memoria: el camino de arranque no consulta al gateway.
+    - refresh_if_due() revalida en segundo plano: searchById cada VALIDATE_EVERY_SEC
+      (barato) y nueva búsqueda por texto cerca del roll o si el contrato dejó de estar activo.
+    Una instancia por archivo (from_env() la comparte) para no pisar entradas entre monitores.
+    """
+
+    _shared: Dict[str, "ContractDirectory"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, object]] = {}
+        self._refreshing: set = set()
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> Optional["ContractDirectory"]:
+        if os.getenv("CONTRACT_CACHE", "true").lower() not in ("1", "true", "yes", "on"):
+            return None
+        path = os.getenv("CONTRACT_CACHE_FILE", "contract_cache.json")
+        with cls._shared_lock:
+            inst = cls._shared.get(path)
+            if inst is None:
+                inst = cls._shared[path] = cls(path)
+            return inst
+
+    # ------------- Disco -------------
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._entries = {str(k).upper(): dict(v) for k, v in data.items() if v.get("id")}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("[Contracts][WARN]", e)
+
+    def _save_locked(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    # ------------- API -------------
+
+    def lookup(self, symbol: str, now: Optional[float] = None) -> Optional[str]:
+        """contractId vigente del cache (sin red) o None si no hay o ya venció."""
+        now = time.time() if now is None else now
+        ent = self._entries.get(symbol.strip().upper())
+        if not ent or now >= float(ent.get("expires_at") or 0.0):
+            return None
+        return str(ent["id"])
+
+    def put(self, symbol: str, contract_id: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        roll = roll_epoch(contract_id)
+        if roll is None:
+            expires = now + FALLBACK_TTL_SEC
+        elif roll <= now:
+            expires = now + RETRY_SEC        # el gateway sigue dando el contrato viejo
+        else:
+            expires = roll
+        with self._lock:
+            self._entries[symbol.strip().upper()] = {
+                "id": contract_id, "expires_at": expires, "checked_at": now,
+            }
+            try:
+                self._save_locked()
+            except Exception as e:
+                print("[Contracts][WARN]", e)
+
+    def resolve(self, symbol: str, resolver: Resolver, now: Optional[float] = None) -> Optional[str]:
+        cid = self.lookup(symbol, now)
+        if cid:
+            return cid
+        cid = resolver(symbol)
+        if cid:
+            self.put(symbol, cid, now)
+        return cid
+
+    def _due(self, symbol: str, now: float) -> bool:
+        ent = self._entries.get(symbol)
+        if not ent:
+            return False
+        expires = float(ent.get("expires_at") or 0.0)
+        checked = float(ent.get("checked_at") or 0.0)
+        # cerca del roll: buscar a lo sumo cada RETRY_SEC hasta que el gateway cambie de contrato
+        near_roll = (expires - now) <= REFRESH_AHEAD_SEC and (now - checked) >= RETRY_SEC
+        return near_roll or (now - checked) >= VALIDATE_EVERY_SEC
+
+    def refresh(self, symbol: str, resolver: Resolver, validator: Optional[Validator] = None,
+                now: Optional[float] = None) -> Optional[str]:
+        """Revalida una entrada (bloqueante). Devuelve el contractId vigente."""
+        key = symbol.strip().upper()
+        now = time.time() if now is None else now
+        ent = self._entries.get(key)
+        near_roll = ent is not None and (float(ent.get("expires_at") or 0.0) - now) <= REFRESH_AHEAD_SEC
+        if ent and validator is not None and not near_roll:
+            if validator(str(ent["id"])):
+                with self._lock:
+                    ent["checked_at"] = now
+                    try:
+                        self._save_locked()
+                    except Exception as e:
+                        print("[Contracts][WARN]", e)
+                return str(ent["id"])
+        cid = resolver(key)
+        if cid:
+            if ent and cid != ent.get("id"):
+                print(f"[Contracts] {key}: {ent.get('id')} -> {cid}")
+            self.put(key, cid, now)
+        return cid or self.lookup(key, now)
+
+    def refresh_if_due(self, symbol: str, resolver: Resolver, validator: Optional[Validator] = None,
+                       now: Optional[float] = None) -> bool:
+        """Lanza refresh() en un hilo daemon si la entrada está por vencer o sin validar. No bloquea."""
+        key = symbol.strip().upper()
+        now = time.time() if now is None else now
+        with self._lock:
+            if key in self._refreshing or not self._due(key, now):
+                return False
+            self._refreshing.add(key)
+
+        def run() -> None:
+            try:
+                self.refresh(key, resolver, validator)
+            except Exception as e:
+                print("[Contracts][WARN]", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"contracts-{key}", daemon=True).start()
+        return True
@@ -3,14 +3,25 @@ from __future__ import annotations
 
 import os
 import math
+import queue
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from zoneinfo import ZoneInfo
 
+from app.brokers.market_stream import MarketStream, Tick
 from app.brokers.projectx_api import ProjectXClient
+from app.data.bar_builder import BarBuilder, BuiltBar
+from app.data.bar_file import BarColumns
+from app.indicators.streaming import EMA, SMA
+from app.services.contract_directory import ContractDirectory
+from app.services.monitor_checkpoint import MonitorCheckpoint
+from app.services.session_calendar import SessionCalendar
+from app.trading.scheduler import SYSTEM_CLOCK, Clock
 
 # ==============================
 # Config por ENV (con defaults)
@@ -26,12 +37,24 @@ CHART_SESSION: str = os.getenv("CHART_SESSION", "ETH").upper()
 RTH_START: str = os.getenv("RTH_START", "09:30")
 RTH_END: str   = os.getenv("RTH_END", "16:15")  # CME equity index suele cerrar 16:15
 NY = ZoneInfo("America/New_York")
+SESSION_CAL = SessionCalendar(rth_start=RTH_START, rth_end=RTH_END, tz=NY)
 
 # Vela parcial para la semilla (histórico)
 INCLUDE_PARTIAL_SEED: bool = os.getenv("INCLUDE_PARTIAL_BARS", "false").lower() in ("1", "true", "yes")
 
-# Recalcular en cada cierre para “pixel match”
+# Auditoría de drift del estado incremental contra el recálculo completo (“pixel match”):
+# EXACT_MATCH_ON_CLOSE habilita la auditoría periódica (cada EMA_AUDIT_EVERY_BARS velas);
+# en cada cierre sólo se avanza el estado incremental, sin recálculo
 EXACT_MATCH_ON_CLOSE: bool = os.getenv("EXACT_MATCH_ON_CLOSE", "true").lower() in ("1", "true", "yes")
+EMA_AUDIT_EVERY_BARS: int = int(os.getenv("EMA_AUDIT_EVERY_BARS", "96"))   # 96 velas de 15m = 1 día; 0 = nunca
+EMA_AUDIT_MAX_BARS: int = int(os.getenv("EMA_AUDIT_MAX_BARS", "20000"))
+
+# Huecos (fin de semana, halt diario, corte de red): se rellenan con las velas faltantes
+# en vez de resembrar; más velas que esto -> semilla completa
+GAP_BACKFILL_MAX_BARS: int = int(os.getenv("GAP_BACKFILL_MAX_BARS", "5000"))
+
+# Modo streaming (MARKET_STREAM_URL): margen tras el fin del intervalo para ticks rezagados
+STREAM_CLOSE_GRACE_MS: int = int(os.getenv("STREAM_CLOSE_GRACE_MS", "250"))
 
 # Suavizado de EMA200 para mostrar (no para bias/señal)
 EMA200_SMOOTH_TYPE: str = os.getenv("EMA200_SMOOTH_TYPE", "").lower()   # "sma" o vacío
@@ -75,9 +98,6 @@ class Snapshot:
 # ==============================
 # Utils
 # ==============================
-def _utcnow_iso() -> str:
-    return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
-
 def _needed_days(required_bars: int = REQUIRED_BARS,
                  bar_minutes: int = BAR_MINUTES,
                  buffer_days: int = 4) -> int:
@@ -87,38 +107,36 @@ def _needed_days(required_bars: int = REQUIRED_BARS,
 def _in_rth(ts_utc: pd.Timestamp) -> bool:
     if CHART_SESSION != "RTH":
         return True
-    ts_ny = ts_utc.tz_convert(NY)
-    hm = f"{ts_ny.hour:02d}:{ts_ny.minute:02d}"
-    return (RTH_START <= hm <= RTH_END)
-
-def _bars_to_df(bars: List[Dict]) -> pd.DataFrame:
-    if not bars:
-        return pd.DataFrame()
-    df = pd.DataFrame(bars).rename(columns={
-        "t": "datetime", "o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"
-    })
-    df["datetime"] = pd.to_datetime(df["datetime"], utc=True)
-    return df.sort_values("datetime").reset_index(drop=True)
-
-# EMA util: intentar usar tu indicador unificado si existe (respeta tu configuración)
-try:
-    from ..indicators.ema import ema as ema_ind  # type: ignore
-except Exception:
-    def ema_ind(series: pd.Series, n: int, mode: str | None = None) -> pd.Series:
-        # fallback a pandas ewm (ajustado, min_periods=n)
-        return pd.Series(series, dtype="float64").ewm(span=n, adjust=False, min_periods=n).mean()
+    return SESSION_CAL.contains(pd.Timestamp(ts_utc).value, "RTH")
+
+def _checkpoint_config() -> Dict[str, object]:
+    # huella de la config: un checkpoint de otra config no se restaura
+    return {
+        "bar_minutes": BAR_MINUTES,
+        "session": CHART_SESSION,
+        "rth": [RTH_START, RTH_END] if CHART_SESSION == "RTH" else None,
+        "smooth": [EMA200_SMOOTH_TYPE, EMA200_SMOOTH_LENGTH],
+        "live": FORCE_LIVE,
+        "partial_seed": INCLUDE_PARTIAL_SEED,
+    }
+
+def _ns_to_dt(ns: int) -> datetime:
+    return pd.Timestamp(int(ns), tz="UTC").to_pydatetime()
+
+
+# Reglas de la estrategia: una sola definición compartida con el backtest (app/backtest)
+from . import strategy
+
+EMA_PERIODS: Tuple[int, int] = strategy.EMA_PERIODS
+
+def _ema_equal(a: float, b: float) -> bool:
+    # TA-Lib, el kernel NumPy y la recursión incremental dan los mismos bits
+    return a == b
 
 def _color_from_zone(prev_close: float, prev_e50: float, prev_e200: float,
                      curr_close: float, curr_e50: float, curr_e200: float) -> str:
-    low_prev, high_prev = (min(prev_e50, prev_e200), max(prev_e50, prev_e200))
-    low_curr, high_curr = (min(curr_e50, curr_e200), max(curr_e50, curr_e200))
-    prev_in = (low_prev <= prev_close <= high_prev)
-    curr_in = (low_curr <= curr_close <= high_curr)
-    if prev_in:
-        return "green"
-    if (not prev_in) and curr_in:
-        return "yellow"
-    return "red"
+    return strategy.COLOR_NAMES[int(strategy.zone_color(prev_close, prev_e50, prev_e200,
+                                                        curr_close, curr_e50, curr_e200))]
 
 def _signal_cross50_with_bias(prev_close: float, prev_e50: float,
                               curr_close: float, curr_e50: float,
@@ -129,15 +147,10 @@ def _signal_cross50_with_bias(prev_close: float, prev_e50: float,
       Señal LONG si prev_close < EMA50 (prev) y curr_close > EMA50 (curr).
     - Bias SHORT si EMA50 < EMA200 (base).
       Señal SHORT si prev_close > EMA50 (prev) y curr_close < EMA50 (curr).
-    Tolerancia EPS opcional en el cruce.
+    Tolerancia EPS opcional en el cruce. Regla en strategy.cross50_with_bias.
     """
-    if (curr_e50 - curr_e200_base) > EPS:
-        if (prev_close < (prev_e50 - EPS)) and (curr_close > (curr_e50 + EPS)):
-            return "LONG"
-    elif (curr_e200_base - curr_e50) > EPS:
-        if (prev_close > (prev_e50 + EPS)) and (curr_close < (curr_e50 - EPS)):
-            return "SHORT"
-    return None
+    return strategy.SIGNAL_NAMES[int(strategy.cross50_with_bias(
+        prev_close, prev_e50, curr_close, curr_e50, curr_e200_base, EPS))]
 
 # ==============================
 # Monitor de mercado
@@ -145,24 +158,43 @@ def _signal_cross50_with_bias(prev_close: float, prev_e50: float,
 class MarketMonitor:
     """
     - Seed con histórico (>=205 velas) -> fija EMA50/EMA200 y prev/curr.
-    - Luego consulta SOLO la última vela cerrada; si hay nueva, avanza EMA con α=2/(n+1).
-    - En el cierre de cada vela (si EXACT_MATCH_ON_CLOSE=True) recalcula el tail
-      de histórico reciente para “pixel match” con la plataforma.
+    - Luego consulta SOLO la última vela cerrada; si hay nueva, avanza EMA con α=2/(n+1)
+      con la misma aritmética que TA-Lib (O(1) por vela, sin refetch).
+    - El estado guarda ancla de la semilla + cantidad de velas + EMAs en precisión completa;
+      cada EMA_AUDIT_EVERY_BARS velas (si EXACT_MATCH_ON_CLOSE=True) o con audit() se
+      recalcula desde el ancla y sólo ante discrepancia se reemplaza el estado.
     - Si EMA200_SMOOTH_TYPE="sma" y EMA200_SMOOTH_LENGTH>1, el valor mostrado de EMA200
       es SMA(k) sobre la EMA200 base. Señales/bias usan las EMAs BASE.
+    - Arranque en caliente: el estado y el contractId se guardan en `checkpoint` en cada
+      vela nueva; al reiniciar se restauran y se validan con un fetch corto de la cola
+      (prev/curr deben coincidir con el gateway) antes del primer snapshot.
+    - contractId desde ContractDirectory (cache con vencimiento en el roll); al rollear
+      el directorio, el monitor cambia de contrato y resiembra.
+    - Streaming (attach_stream): arma la vela localmente con los ticks y avanza el estado
+      apenas termina el intervalo; get_snapshot() deja de consultar el gateway mientras el
+      stream esté al día. La auditoría periódica reconcilia contra las velas del gateway.
     """
 
-    def __init__(self, symbol_or_contract: str, px: Optional[ProjectXClient] = None) -> None:
+    def __init__(self, symbol_or_contract: str, px: Optional[ProjectXClient] = None,
+                 checkpoint: Optional[MonitorCheckpoint] = None,
+                 contracts: Optional[ContractDirectory] = None,
+                 clock: Clock = SYSTEM_CLOCK, offline: bool = False,
+                 contract_id: Optional[str] = None) -> None:
         self.sym_raw = symbol_or_contract.strip().upper()
         self.px = px or ProjectXClient()
         if not getattr(self.px, "_token", None):
             self.px.login_with_key()
-
-        self.contract_id: Optional[str] = self._resolve_contract_id(self.sym_raw)
+        # offline (replay/tests): nada persistido desde el entorno (checkpoint, cache de contratos)
+        self.clock = clock
+        self._fixed_contract = contract_id.strip() if contract_id else None
+        self.checkpoint = checkpoint or (None if offline else MonitorCheckpoint.from_env())
+        self.contracts = contracts or (None if offline else ContractDirectory.from_env())
 
         self.state = {
             "seeded": False,
             "bars": 0,
+            "anchor_ts": None,     # primera vela de la serie sembrada
+            "since_audit": 0,      # velas incrementales desde la última auditoría
             "prev_ts": None,
             "prev_close": None,
             "prev_e50": None,
@@ -176,16 +208,51 @@ class MarketMonitor:
             "ema200_buf": [],
         }
 
-        self.alpha50  = 2.0 / (50.0 + 1.0)
-        self.alpha200 = 2.0 / (200.0 + 1.0)
-
-    def _resolve_contract_id(self, sym: str) -> Optional[str]:
+        # Motor incremental: se (re)sincroniza desde `state` tras semilla/recalc/audit
+        self._ema50: Optional[EMA] = None
+        self._ema200: Optional[EMA] = None
+        self._ema200_smooth: Optional[SMA] = None
+
+        # get_snapshot() y el worker del stream comparten `state` (_lock puede tomarse durante
+        # HTTP); el hilo del stream sólo toca el armado de velas (_builder_lock, sin I/O) y
+        # encola las velas cerradas para el worker
+        self._lock = threading.RLock()
+        self._builder_lock = threading.Lock()
+        self._stream: Optional[MarketStream] = None
+        self._stream_cid: Optional[str] = None
+        self._builder: Optional[BarBuilder] = None
+        self._bar_queue: "queue.Queue[Tuple[str, BuiltBar]]" = queue.Queue()
+        self._bar_worker: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[Snapshot], None]] = []
+        self.stream_bars = 0
+
+        # Checkpoint: contractId + estado de la corrida anterior (pendiente de validar)
+        self._needs_validation = False
+        self._saved_ts = None
+        restored = self._restore_checkpoint()
+        self.contract_id: Optional[str] = restored or self._resolve_contract_id(self.sym_raw)
+
+    def _static_contract_id(self, sym: str) -> Optional[str]:
+        # contractId explícito (parámetro, símbolo CON.* o .env): no requiere consultar al gateway
+        if self._fixed_contract:
+            return self._fixed_contract
         if sym.startswith("CON."):
             return sym
         if sym in ("MNQ", "NQ") and ENV_CONTRACT_MNQ:
             return ENV_CONTRACT_MNQ
         if sym in ("ES", "SP", "SP500") and ENV_CONTRACT_ES:
             return ENV_CONTRACT_ES
+        return None
+
+    def _resolve_contract_id(self, sym: str) -> Optional[str]:
+        static = self._static_contract_id(sym)
+        if static:
+            return static
+        if self.contracts is not None:
+            return self.contracts.resolve(sym, self._search_contract_id)
+        return self._search_contract_id(sym)
+
+    def _search_contract_id(self, sym: str) -> Optional[str]:
         texts = SYNONYMS.get(sym, [sym])
         live_flag = True if FORCE_LIVE else False
         for t in texts:
@@ -201,163 +268,271 @@ class MarketMonitor:
                 continue
         return None
 
-    def _seed_from_history(self, contract_id: str) -> Tuple[bool, str]:
-        lookback_days = int(os.getenv("BARS_LOOKBACK_DAYS", str(DEFAULT_LOOKBACK_DAYS)) or DEFAULT_LOOKBACK_DAYS)
-        limit = max(WARMUP_BARS, REQUIRED_BARS + 200)
+    def _validate_contract(self, contract_id: str) -> bool:
+        # searchById: más barato que repetir la búsqueda por texto
+        contracts = self.px.search_contracts_by_id(contract_id)
+        return any(c.get("id") == contract_id and c.get("activeContract", True) for c in contracts)
+
+    def _check_roll(self) -> None:
+        """Revalida el contrato en segundo plano; si el directorio ya rolleó, cambia y resiembra."""
+        if self.contracts is None or self._static_contract_id(self.sym_raw):
+            return
+        self.contracts.refresh_if_due(self.sym_raw, self._search_contract_id, self._validate_contract)
+        cid = self.contracts.lookup(self.sym_raw)
+        if cid and cid != self.contract_id:
+            print(f"[MarketMonitor] {self.sym_raw}: contrato {self.contract_id} -> {cid}, resembrando")
+            self.contract_id = cid
+            self.state["seeded"] = False
+            self._needs_validation = False
+            self._ensure_subscribed()
+
+    # ------------- Checkpoint -------------
+
+    def _restore_checkpoint(self) -> Optional[str]:
+        """Carga estado + contractId del checkpoint; devuelve el contractId o None."""
+        if self.checkpoint is None:
+            return None
+        rec = self.checkpoint.load(self.sym_raw, _checkpoint_config())
+        if not rec or not rec.get("contract_id"):
+            return None
+        static = self._static_contract_id(self.sym_raw)
+        if static and static != rec["contract_id"]:
+            return None        # cambió el contrato configurado en .env
+        cached = self.contracts.lookup(self.sym_raw) if (self.contracts and not static) else None
+        if cached and cached != rec["contract_id"]:
+            return None        # el contrato ya rolleó
+        self.state.update(rec["state"])
+        self._saved_ts = self.state["curr_ts"]
+        self._needs_validation = True
+        self._sync_indicators()
+        return rec["contract_id"]
+
+    def _validate_restored(self, contract_id: str) -> Tuple[bool, str]:
+        """Fetch corto desde prev_ts: el checkpoint vale si prev/curr coinciden con el gateway."""
+        st = self.state
+        prev_ts, curr_ts = pd.Timestamp(st["prev_ts"]), pd.Timestamp(st["curr_ts"])
         live_flag = True if FORCE_LIVE else False
-
-        bars = self.px.retrieve_bars(
+        cols = self.px.retrieve_bar_columns(
             contract_id=contract_id,
             live=live_flag,
             unit=2,
             unit_number=BAR_MINUTES,
-            include_partial=INCLUDE_PARTIAL_SEED,
-            limit=limit,
-            lookback_days=max(lookback_days, _needed_days()),
+            limit=4,
+            start_time=prev_ts.to_pydatetime(),
+            end_time=(curr_ts + pd.Timedelta(minutes=BAR_MINUTES)).to_pydatetime(),
         )
-        df = _bars_to_df(bars)
-
-        if CHART_SESSION == "RTH" and not df.empty:
-            local = df["datetime"].dt.tz_convert(NY)
-            hm = local.dt.strftime("%H:%M")
-            mask = (hm >= RTH_START) & (hm <= RTH_END)
-            df = df[mask].reset_index(drop=True)
-
-        n = len(df)
-        if n < REQUIRED_BARS:
-            return False, f"Datos insuficientes {n}/{REQUIRED_BARS} velas {BAR_MINUTES}m"
+        cols = self._session_filter(cols)
+        closes = {int(t): float(c) for t, c in zip(cols.t, cols.c)}
+        if closes.get(prev_ts.value) != st["prev_close"] or closes.get(curr_ts.value) != st["curr_close"]:
+            return False, "checkpoint no coincide con el gateway"
+        return True, "ok"
 
-        df["ema50"]        = ema_ind(df["close"], 50)
-        df["ema200_base"]  = ema_ind(df["close"], 200)
+    def _save_checkpoint(self) -> None:
+        st = self.state
+        if self.checkpoint is None or not st.get("seeded") or st.get("curr_ts") == self._saved_ts:
+            return
+        try:
+            self.checkpoint.save(self.sym_raw, self.contract_id, st, _checkpoint_config())
+            self._saved_ts = st["curr_ts"]
+        except Exception as e:
+            print("[MarketMonitor][WARN] checkpoint:", e)
 
-        if EMA200_SMOOTH_TYPE == "sma" and EMA200_SMOOTH_LENGTH > 1:
-            df["ema200"] = df["ema200_base"].rolling(EMA200_SMOOTH_LENGTH).mean()
-        else:
-            df["ema200"] = df["ema200_base"]
+    def _session_filter(self, cols: BarColumns) -> BarColumns:
+        return strategy.session_filter(cols, CHART_SESSION, SESSION_CAL)
 
-        if pd.isna(df["ema200"].iloc[-1]) or pd.isna(df["ema50"].iloc[-1]):
-            return False, "EMAs aún NaN tras semilla (aumentar lookback)"
+    def _compute_emas(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        # EMA50 y EMA200 en una sola pasada del kernel
+        return strategy.compute_emas(cols.c, EMA200_SMOOTH_TYPE, EMA200_SMOOTH_LENGTH, EMA_PERIODS)
 
-        prev, curr = df.iloc[-2], df.iloc[-1]
+    def _load_state_from_arrays(self, cols: BarColumns, emas: Dict[str, np.ndarray]) -> None:
+        """Fija prev/curr y el ancla (primera vela de la serie) a partir de columnas ya calculadas."""
         buf_len = max(1, EMA200_SMOOTH_LENGTH if (EMA200_SMOOTH_TYPE == "sma") else 1)
-        ema200_buf = df["ema200_base"].tail(buf_len).tolist()
+        ema200_buf = emas["ema200_base"][-buf_len:].tolist()
+        e50, e200b, e200 = emas["ema50"], emas["ema200_base"], emas["ema200"]
 
         self.state.update({
             "seeded": True,
-            "bars": n,
-            "prev_ts": prev["datetime"].to_pydatetime(),
-            "prev_close": float(prev["close"]),
-            "prev_e50": float(prev["ema50"]),
-            "prev_e200_base": float(prev["ema200_base"]),
-            "prev_e200": float(prev["ema200"]),
-            "curr_ts": curr["datetime"].to_pydatetime(),
-            "curr_close": float(curr["close"]),
-            "curr_e50": float(curr["ema50"]),
-            "curr_e200_base": float(curr["ema200_base"]),
-            "curr_e200": float(curr["ema200"]),
+            "bars": len(cols),
+            "anchor_ts": _ns_to_dt(cols.t[0]),
+            "since_audit": 0,
+            "prev_ts":   _ns_to_dt(cols.t[-2]),
+            "prev_close": float(cols.c[-2]),
+            "prev_e50":   float(e50[-2]),
+            "prev_e200_base":  float(e200b[-2]),
+            "prev_e200":       float(e200[-2]),
+            "curr_ts":    _ns_to_dt(cols.t[-1]),
+            "curr_close": float(cols.c[-1]),
+            "curr_e50":   float(e50[-1]),
+            "curr_e200_base":  float(e200b[-1]),
+            "curr_e200":       float(e200[-1]),
             "ema200_buf": ema200_buf,
         })
-        return True, "ok"
+        self._sync_indicators()
+
+    def _sync_indicators(self) -> None:
+        st = self.state
+        if st.get("curr_e50") is None or st.get("curr_e200_base") is None:
+            self._ema50 = self._ema200 = self._ema200_smooth = None
+            return
+        n = int(st.get("bars") or 0)
+        self._ema50 = EMA.resume(50, st["curr_e50"], n)
+        self._ema200 = EMA.resume(200, st["curr_e200_base"], n)
+        self._ema200_smooth = None
+        if EMA200_SMOOTH_TYPE == "sma" and EMA200_SMOOTH_LENGTH > 1:
+            self._ema200_smooth = SMA.resume(EMA200_SMOOTH_LENGTH, st.get("ema200_buf") or [])
 
-    def _recalc_tail(self, contract_id: str, tail_bars: int = 1200) -> Tuple[bool, str]:
+    def _seed_from_history(self, contract_id: str) -> Tuple[bool, str]:
+        lookback_days = int(os.getenv("BARS_LOOKBACK_DAYS", str(DEFAULT_LOOKBACK_DAYS)) or DEFAULT_LOOKBACK_DAYS)
+        limit = max(WARMUP_BARS, REQUIRED_BARS + 200)
         live_flag = True if FORCE_LIVE else False
-        bars = self.px.retrieve_bars(
-            contract_id=contract_id,
-            live=live_flag,
-            unit=2,
-            unit_number=BAR_MINUTES,
-            include_partial=False,
-            limit=tail_bars,
-            lookback_days=max(DEFAULT_LOOKBACK_DAYS, 30),
-        )
-        df = _bars_to_df(bars)
-        if df.empty:
-            return False, "Sin barras para recalcular"
 
-        if CHART_SESSION == "RTH":
-            local = df["datetime"].dt.tz_convert(NY)
-            hm = local.dt.strftime("%H:%M")
-            mask = (hm >= RTH_START) & (hm <= RTH_END)
-            df = df[mask].reset_index(drop=True)
+        if INCLUDE_PARTIAL_SEED:
+            bars = self.px.retrieve_bars(
+                contract_id=contract_id,
+                live=live_flag,
+                unit=2,
+                unit_number=BAR_MINUTES,
+                include_partial=True,
+                limit=limit,
+                lookback_days=max(lookback_days, _needed_days()),
+            )
+            cols = BarColumns.from_dicts(bars)
+        else:
+            cols = self.px.retrieve_bar_columns(
+                contract_id=contract_id,
+                live=live_flag,
+                unit=2,
+                unit_number=BAR_MINUTES,
+                limit=limit,
+                lookback_days=max(lookback_days, _needed_days()),
+            )
+        cols = self._session_filter(cols)
 
-        n = len(df)
+        n = len(cols)
         if n < REQUIRED_BARS:
-            return False, f"Datos insuficientes {n}/{REQUIRED_BARS} tras recalcular"
-
-        df["ema50"]        = ema_ind(df["close"], 50)
-        df["ema200_base"]  = ema_ind(df["close"], 200)
-        if EMA200_SMOOTH_TYPE == "sma" and EMA200_SMOOTH_LENGTH > 1:
-            df["ema200"] = df["ema200_base"].rolling(EMA200_SMOOTH_LENGTH).mean()
-        else:
-            df["ema200"] = df["ema200_base"]
+            return False, f"Datos insuficientes {n}/{REQUIRED_BARS} velas {BAR_MINUTES}m"
 
-        prev, curr = df.iloc[-2], df.iloc[-1]
-        buf_len = max(1, EMA200_SMOOTH_LENGTH if (EMA200_SMOOTH_TYPE == "sma") else 1)
-        ema200_buf = df["ema200_base"].tail(buf_len).tolist()
+        emas = self._compute_emas(cols)
+        if np.isnan(emas["ema200"][-1]) or np.isnan(emas["ema50"][-1]):
+            return False, "EMAs aún NaN tras semilla (aumentar lookback)"
 
-        self.state.update({
-            "seeded": True,
-            "bars": n,
-            "prev_ts":   prev["datetime"].to_pydatetime(),
-            "prev_close": float(prev["close"]),
-            "prev_e50":   float(prev["ema50"]),
-            "prev_e200_base":  float(prev["ema200_base"]),
-            "prev_e200":       float(prev["ema200"]),
-            "curr_ts":    curr["datetime"].to_pydatetime(),
-            "curr_close": float(curr["close"]),
-            "curr_e50":   float(curr["ema50"]),
-            "curr_e200_base":  float(curr["ema200_base"]),
-            "curr_e200":       float(curr["ema200"]),
-            "ema200_buf": ema200_buf,
-        })
+        self._load_state_from_arrays(cols, emas)
         return True, "ok"
 
+    def audit(self) -> Tuple[bool, str]:
+        """
+        Auditoría de drift (periódica u on-demand).
+        Recalcula las EMAs desde el ancla de la semilla hasta curr_ts y compara con el
+        estado incremental (bit a bit con TA-Lib). Si difiere —o el gateway corrigió/agregó
+        velas— adopta el recálculo. Devuelve (coincidía, mensaje).
+        """
+        st = self.state
+        if not self.contract_id or not st.get("seeded") or st.get("anchor_ts") is None:
+            return False, "audit: monitor sin semilla"
+
+        live_flag = True if FORCE_LIVE else False
+        curr_ts = pd.Timestamp(st["curr_ts"])
+        anchor_ts = pd.Timestamp(st["anchor_ts"])
+        cols = self.px.retrieve_bar_columns(
+            contract_id=self.contract_id,
+            live=live_flag,
+            unit=2,
+            unit_number=BAR_MINUTES,
+            limit=EMA_AUDIT_MAX_BARS,
+            start_time=anchor_ts.to_pydatetime(),
+            end_time=(curr_ts + pd.Timedelta(minutes=BAR_MINUTES)).to_pydatetime(),
+        )
+        cols = self._session_filter(cols)
+        if len(cols) == 0:
+            return False, "audit: sin barras"
+        cols = cols.between(int(cols.t[0]), curr_ts.value)
+        if len(cols) < REQUIRED_BARS or int(cols.t[-1]) != curr_ts.value:
+            return False, "audit: histórico incompleto, se mantiene el estado incremental"
+
+        emas = self._compute_emas(cols)
+        e50, e200b = float(emas["ema50"][-1]), float(emas["ema200_base"][-1])
+        same_series = (int(cols.t[0]) == anchor_ts.value) and (len(cols) == st["bars"])
+        if same_series and _ema_equal(e50, st["curr_e50"]) and _ema_equal(e200b, st["curr_e200_base"]):
+            st["since_audit"] = 0
+            return True, "ok"
+
+        drift50 = e50 - float(st["curr_e50"])
+        drift200 = e200b - float(st["curr_e200_base"])
+        self._load_state_from_arrays(cols, emas)
+        reason = "serie distinta" if not same_series else "drift"
+        return False, f"audit: {reason} (Δema50={drift50:.3e} Δema200={drift200:.3e}); estado recalculado"
+
     def _get_last_closed_bar(self, contract_id: str) -> Optional[Tuple[pd.Timestamp, float]]:
         live_flag = True if FORCE_LIVE else False
-        bars = self.px.retrieve_bars(
+        cols = self.px.retrieve_bar_columns(
             contract_id=contract_id,
             live=live_flag,
             unit=2,
             unit_number=BAR_MINUTES,
-            include_partial=False,
             limit=2,
             lookback_days=2,
         )
-        df = _bars_to_df(bars)
-        if df.empty:
+        if len(cols) == 0:
             return None
-        last = df.iloc[-1]
-        ts = pd.to_datetime(last["datetime"], utc=True)
+        ts = pd.Timestamp(int(cols.t[-1]), tz="UTC")
         if not _in_rth(ts):
             return None
-        return ts, float(last["close"])
+        return ts, float(cols.c[-1])
+
+    def _backfill_gap(self, contract_id: str, ts: pd.Timestamp) -> Tuple[bool, str]:
+        """
+        Trae sólo las velas entre curr_ts y `ts` y las reproduce con _advance_incremental.
+        No se puede puentear (-> False) si el gateway ya no tiene curr_ts con el mismo close
+        (serie corregida), si falta `ts` o si el hueco supera GAP_BACKFILL_MAX_BARS.
+        """
+        st = self.state
+        curr_ts = pd.Timestamp(st["curr_ts"])
+        live_flag = True if FORCE_LIVE else False
+        cols = self.px.retrieve_bar_columns(
+            contract_id=contract_id,
+            live=live_flag,
+            unit=2,
+            unit_number=BAR_MINUTES,
+            limit=GAP_BACKFILL_MAX_BARS + 1,
+            start_time=curr_ts.to_pydatetime(),
+            end_time=(ts + pd.Timedelta(minutes=BAR_MINUTES)).to_pydatetime(),
+        )
+        cols = self._session_filter(cols).between(curr_ts.value, ts.value)
+        if len(cols) == 0 or int(cols.t[0]) != curr_ts.value or float(cols.c[0]) != st["curr_close"]:
+            return False, "gap: la serie del gateway no continúa el estado"
+        if int(cols.t[-1]) != ts.value:
+            return False, "gap: falta la vela nueva en el histórico"
+        if len(cols) - 1 > GAP_BACKFILL_MAX_BARS:
+            return False, f"gap: {len(cols) - 1} velas (> {GAP_BACKFILL_MAX_BARS})"
+
+        for t_ns, c in zip(cols.t[1:], cols.c[1:]):
+            self._advance_incremental(pd.Timestamp(int(t_ns), tz="UTC"), float(c))
+        return True, f"gap: {len(cols) - 1} velas"
 
     def _advance_incremental(self, ts: pd.Timestamp, close: float) -> None:
         st = self.state
         if st["curr_ts"] is None or ts > st["curr_ts"]:
+            if self._ema50 is None or self._ema200 is None:
+                self._sync_indicators()
+            if self._ema50 is None or self._ema200 is None:
+                return
+
             st["prev_ts"]         = st["curr_ts"]
             st["prev_close"]      = st["curr_close"]
             st["prev_e50"]        = st["curr_e50"]
             st["prev_e200_base"]  = st["curr_e200_base"]
             st["prev_e200"]       = st["curr_e200"]
 
-            prev_e50  = st["prev_e50"]
-            prev_e200_base = st["prev_e200_base"]
-            if prev_e50 is None or prev_e200_base is None:
-                return
-
-            new_e50_base  = prev_e50  + self.alpha50  * (close - prev_e50)
-            new_e200_base = prev_e200_base + self.alpha200 * (close - prev_e200_base)
+            # O(1) por vela, misma aritmética que TA-Lib: ((x - prev) * k) + prev
+            new_e50_base  = self._ema50.update(close)
+            new_e200_base = self._ema200.update(close)
 
-            if EMA200_SMOOTH_TYPE == "sma" and EMA200_SMOOTH_LENGTH > 1:
-                buf = st.get("ema200_buf", [])
-                buf.append(float(new_e200_base))
-                if len(buf) > EMA200_SMOOTH_LENGTH:
-                    buf.pop(0)
-                st["ema200_buf"] = buf
-                new_e200_shown = sum(buf) / len(buf)
-            else:
-                new_e200_shown = float(new_e200_base)
+            new_e200_shown = float(new_e200_base)
+            if self._ema200_smooth is not None:
+                smooth = self._ema200_smooth.update(new_e200_base)
+                st["ema200_buf"] = self._ema200_smooth.window
+                if smooth is not None:
+                    new_e200_shown = float(smooth)
 
             st["curr_ts"]        = ts
             st["curr_close"]     = close
@@ -365,40 +540,177 @@ class MarketMonitor:
             st["curr_e200_base"] = float(new_e200_base)
             st["curr_e200"]      = float(new_e200_shown)
             st["bars"]           = int(st.get("bars", 0)) + 1
+            st["since_audit"]    = int(st.get("since_audit", 0)) + 1
+
+    # ------------- Streaming -------------
+
+    def attach_stream(self, stream: MarketStream) -> None:
+        """Suscribe el contrato al feed en tiempo real (las velas se arman localmente)."""
+        with self._lock:
+            self._stream = stream
+            if self._bar_worker is None:
+                self._bar_worker = threading.Thread(target=self._bar_worker_loop, daemon=True,
+                                                    name=f"monitor-bars-{self.sym_raw}")
+                self._bar_worker.start()
+            self._ensure_subscribed()
+
+    def add_listener(self, cb: Callable[[Snapshot], None]) -> None:
+        """cb(snapshot) en cada vela cerrada por el stream (corre en el worker de velas del monitor)."""
+        self._listeners.append(cb)
+
+    def _ensure_subscribed(self) -> None:
+        if self._stream is None or not self.contract_id or self._stream_cid == self.contract_id:
+            return
+        if self._stream_cid:
+            self._stream.unsubscribe(self._stream_cid, self)
+        with self._builder_lock:
+            self._builder = BarBuilder(BAR_MINUTES * 60)
+            self._stream_cid = self.contract_id
+        self._stream.subscribe(self.contract_id, self)
+
+    # Callbacks del stream: corren en su event loop (compartido por todos los contratos),
+    # así que no toman _lock ni hacen I/O; sólo arman velas y las encolan.
+
+    def deadline_ns(self) -> Optional[int]:
+        with self._builder_lock:
+            b = self._builder
+            d = b.deadline_ns() if b is not None else None
+        return None if d is None else d + STREAM_CLOSE_GRACE_MS * 1_000_000
+
+    def on_tick(self, tick: Tick) -> None:
+        with self._builder_lock:
+            if self._builder is None or tick.contract_id != self._stream_cid:
+                return
+            bars = self._builder.on_tick(tick.t, tick.price, tick.size)
+            cid = self._stream_cid
+        for bar in bars:
+            self._bar_queue.put((cid, bar))
+
+    def on_time(self, now_ns: int) -> None:
+        with self._builder_lock:
+            if self._builder is None:
+                return
+            bars = self._builder.on_time(now_ns - STREAM_CLOSE_GRACE_MS * 1_000_000)
+            cid = self._stream_cid
+        for bar in bars:
+            self._bar_queue.put((cid, bar))
+
+    def _bar_worker_loop(self) -> None:
+        while True:
+            cid, bar = self._bar_queue.get()
+            try:
+                self._on_stream_bar(cid, bar)
+            except Exception as e:
+                print("[MarketMonitor][WARN] vela del stream:", self.sym_raw, e)
+
+    def _on_stream_bar(self, cid: str, bar: BuiltBar) -> None:
+        with self._lock:
+            st = self.state
+            if cid != self.contract_id:
+                return                # vela del contrato anterior (rolleó mientras estaba encolada)
+            if not st["seeded"] or st["curr_ts"] is None or self._needs_validation:
+                return                # la semilla/validación la hace get_snapshot()
+            ts = pd.Timestamp(bar.t, tz="UTC")
+            if not _in_rth(ts) or ts <= st["curr_ts"]:
+                return
+            if (ts - st["curr_ts"]).total_seconds() > 20 * 60:
+                ok, msg = self._backfill_gap(self.contract_id, ts)
+                if not ok:
+                    return            # el gateway aún no tiene el hueco: queda para el polling
+            else:
+                self._advance_incremental(ts, bar.c)
+            self.stream_bars += 1
+            snap = self._build_snapshot()
+        if snap is not None:
+            for cb in list(self._listeners):
+                try:
+                    cb(snap)
+                except Exception as e:
+                    print("[MarketMonitor][WARN] listener:", e)
+
+    def _stream_fresh(self) -> bool:
+        # el stream ya entregó la última vela cerrada según el reloj: no hace falta polling
+        st = self.state
+        if self._stream is None or not self._stream.connected or st["curr_ts"] is None:
+            return False
+        bar_s = BAR_MINUTES * 60
+        expected = (int(self.clock.time()) // bar_s) * bar_s - bar_s
+        return pd.Timestamp(st["curr_ts"]).value // 1_000_000_000 >= expected
 
     def get_snapshot(self) -> Tuple[Optional[Snapshot], str]:
+        with self._lock:
+            return self._get_snapshot_locked()
+
+    def _get_snapshot_locked(self) -> Tuple[Optional[Snapshot], str]:
+        if not self.contract_id:
+            # monitores de larga vida: reintentar la resolución en vez de quedar sin contrato
+            self.contract_id = self._resolve_contract_id(self.sym_raw)
+            self._ensure_subscribed()
+        else:
+            self._check_roll()
         if not self.contract_id:
             return None, "Sin contractId (revisá .env o permisos de datos)"
 
+        if self._needs_validation:
+            self._needs_validation = False
+            try:
+                ok, msg = self._validate_restored(self.contract_id)
+            except Exception as e:
+                ok, msg = False, f"validación de checkpoint: {e}"
+            if not ok:
+                print("[MarketMonitor][WARN]", self.sym_raw, msg, "-> resembrando")
+                self.state["seeded"] = False
+
         if not self.state["seeded"]:
             ok, msg = self._seed_from_history(self.contract_id)
             if not ok:
                 return None, msg
 
-        last = self._get_last_closed_bar(self.contract_id)
+        last = None if self._stream_fresh() else self._get_last_closed_bar(self.contract_id)
         if last is not None:
             ts, close = last
             st = self.state
             if st["curr_ts"] is not None:
                 gap_s = (ts - st["curr_ts"]).total_seconds()
-                if gap_s > 20 * 60:
-                    ok, msg = self._seed_from_history(self.contract_id)
-                    if not ok:
-                        return None, msg
-                elif ts > st["curr_ts"]:
-                    self._advance_incremental(ts, close)
-                    if EXACT_MATCH_ON_CLOSE:
-                        ok2, msg2 = self._recalc_tail(self.contract_id, tail_bars=1200)
-                        if not ok2:
-                            print("[MarketMonitor][WARN] Recalc tail falló:", msg2)
+                if ts > st["curr_ts"]:
+                    if gap_s > 20 * 60:
+                        ok, msg = self._backfill_gap(self.contract_id, ts)
+                        if not ok:
+                            print("[MarketMonitor][WARN]", self.sym_raw, msg, "-> resembrando")
+                            ok, msg = self._seed_from_history(self.contract_id)
+                            if not ok:
+                                return None, msg
+                    else:
+                        self._advance_incremental(ts, close)
             else:
                 ok, msg = self._seed_from_history(self.contract_id)
                 if not ok:
                     return None, msg
 
+        # auditoría periódica (también reconcilia las velas armadas por el stream).
+        # Nunca bloquea el cierre: el estado incremental ya es válido, y ante una falla
+        # (sin barras, histórico incompleto, error HTTP) se reintenta recién en
+        # EMA_AUDIT_EVERY_BARS velas en vez de repetir el fetch grande en cada snapshot
+        if EXACT_MATCH_ON_CLOSE and EMA_AUDIT_EVERY_BARS > 0 \
+                and self.state.get("since_audit", 0) >= EMA_AUDIT_EVERY_BARS:
+            try:
+                ok2, msg2 = self.audit()
+            except Exception as e:
+                ok2, msg2 = False, f"audit: {e}"
+            self.state["since_audit"] = 0
+            if not ok2:
+                print("[MarketMonitor][WARN]", self.sym_raw, msg2)
+
+        snap = self._build_snapshot()
+        if snap is None:
+            return None, "Aún sin snapshot actual"
+        return snap, "ok"
+
+    def _build_snapshot(self) -> Optional[Snapshot]:
         st = self.state
         if st["curr_ts"] is None or st["curr_e50"] is None or st["curr_e200"] is None:
-            return None, "Aún sin snapshot actual"
+            return None
+        self._save_checkpoint()
 
         color  = "gray"
         if None not in (st["prev_close"], st["prev_e50"], st["prev_e200_base"],
@@ -428,7 +740,7 @@ class MarketMonitor:
             bars=int(st["bars"]),
             message="ok",
         )
-        return snap, "ok"
+        return snap
 
     def get_debug_state(self) -> dict:
         st = self.state
@@ -0,0 +1,107 @@
+# app/services/monitor_checkpoint.py
+from __future__ import annotations
+
+import os
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+VERSION = 1
+
+# Campos de MarketMonitor.state que son timestamps (se guardan en ISO UTC)
+_TS_FIELDS = ("anchor_ts", "prev_ts", "curr_ts")
+
+
+def _dump_ts(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    return pd.Timestamp(v).tz_convert("UTC").isoformat()
+
+
+def _load_ts(v: Any) -> Optional[datetime]:
+    if v is None:
+        return None
+    return pd.Timestamp(v).tz_convert("UTC").to_pydatetime()
+
+
+class MonitorCheckpoint:
+    """
+    Checkpoint en disco del estado de cada MarketMonitor para arranques en caliente.
+    - <root>/<SYMBOL>.json: contractId + `state` (prev/curr, EMAs en precisión completa,
+      ema200_buf, ancla) + huella de la config que lo produjo.
+    - save() reescribe el archivo del símbolo de forma atómica (tmp + replace); se llama en
+      cada vela nueva. Los floats se guardan con repr, así que vuelven bit a bit.
+    - load() descarta checkpoints de otra config (BAR_MINUTES, sesión, suavizado) o más
+      viejos que `max_age_sec`; la validación contra el gateway la hace el monitor.
+    """
+
+    def __init__(self, root: str, max_age_sec: float = 3 * 86400.0) -> None:
+        self.root = root
+        self.max_age_sec = float(max_age_sec)
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["MonitorCheckpoint"]:
+        if os.getenv("MONITOR_CHECKPOINT", "true").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(os.getenv("MONITOR_CHECKPOINT_DIR", "monitor_state"),
+                   max_age_sec=float(os.getenv("MONITOR_CHECKPOINT_MAX_AGE_SEC", str(3 * 86400))))
+
+    def _path(self, symbol: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", symbol.strip().upper())
+        return os.path.join(self.root, f"{safe}.json")
+
+    def save(self, symbol: str, contract_id: Optional[str], state: Dict[str, Any],
+             fingerprint: Dict[str, Any]) -> None:
+        st = dict(state)
+        for k in _TS_FIELDS:
+            st[k] = _dump_ts(st.get(k))
+        st["ema200_buf"] = [float(x) for x in (st.get("ema200_buf") or [])]
+        rec = {
+            "version": VERSION,
+            "symbol": symbol,
+            "contract_id": contract_id,
+            "saved_at": time.time(),
+            "config": fingerprint,
+            "state": st,
+        }
+        path = self._path(symbol)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rec, f)
+        os.replace(tmp, path)
+
+    def load(self, symbol: str, fingerprint: Dict[str, Any],
+             now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """{"contract_id", "state"} si hay un checkpoint utilizable, si no None."""
+        try:
+            with open(self._path(symbol), "r", encoding="utf-8") as f:
+                rec = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print("[Checkpoint][WARN]", symbol, e)
+            return None
+
+        now = time.time() if now is None else now
+        if rec.get("version") != VERSION or rec.get("config") != fingerprint:
+            return None
+        if now - float(rec.get("saved_at") or 0.0) > self.max_age_sec:
+            return None
+        st = dict(rec.get("state") or {})
+        if not st.get("seeded") or st.get("curr_ts") is None or st.get("prev_ts") is None:
+            return None
+        for k in _TS_FIELDS:
+            st[k] = _load_ts(st.get(k))
+        return {"contract_id": rec.get("contract_id"), "state": st}
+
+    def discard(self, symbol: str) -> None:
+        try:
+            os.remove(self._path(symbol))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,132 @@
+# app/services/monitor_pool.py
+from __future__ import annotations
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.brokers.market_stream import MarketStream
+from app.brokers.projectx_api import ProjectXClient
+from app.services.market_monitor import MarketMonitor, Snapshot
+from app.trading.scheduler import SYSTEM_CLOCK, Clock
+
+
+class MonitorPool:
+    """
+    Registro de MarketMonitor de larga vida.
+    - Un único ProjectXClient: login una sola vez y la misma sesión HTTP para todos.
+    - Un monitor por símbolo: contractId resuelto y EMAs sembradas una sola vez;
+      las llamadas siguientes sólo consultan la última vela cerrada.
+    - snapshots_parallel(): fan-out de get_snapshot() en un thread pool con deadline;
+      la latencia queda acotada por el símbolo más lento, no por la suma.
+    - Con MARKET_STREAM_URL (o `stream`), todos los monitores comparten un MarketStream.
+    """
+
+    def __init__(self, symbols: Iterable[str] = (), px: Optional[ProjectXClient] = None,
+                 stream: Optional[MarketStream] = None, clock: Clock = SYSTEM_CLOCK,
+                 offline: bool = False, contract_ids: Optional[Dict[str, str]] = None) -> None:
+        self.px = px or ProjectXClient()
+        if not getattr(self.px, "_token", None):
+            self.px.login_with_key()
+        # offline (replay/tests): sin stream, checkpoint ni cache de contratos del entorno
+        self.clock = clock
+        self.offline = offline
+        self.contract_ids = {k.strip().upper(): v for k, v in (contract_ids or {}).items()}
+        self.stream = stream or (None if offline else MarketStream.from_env())
+        if self.stream is not None:
+            self.stream.start()
+
+        self._monitors: Dict[str, MarketMonitor] = {}
+        # a lo sumo un get_snapshot() en vuelo por monitor (el estado no es thread-safe)
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_size: int = 0
+        for sym in symbols:
+            self.get(sym)
+
+    def get(self, symbol: str) -> MarketMonitor:
+        key = symbol.strip().upper()
+        mon = self._monitors.get(key)
+        if mon is None:
+            mon = MarketMonitor(key, px=self.px, clock=self.clock, offline=self.offline,
+                                contract_id=self.contract_ids.get(key))
+            if self.stream is not None:
+                mon.attach_stream(self.stream)
+            self._monitors[key] = mon
+        return mon
+
+    def symbols(self) -> List[str]:
+        return list(self._monitors.keys())
+
+    def items(self) -> List[Tuple[str, MarketMonitor]]:
+        return list(self._monitors.items())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.symbols())
+
+    def __len__(self) -> int:
+        return len(self._monitors)
+
+    def __contains__(self, symbol: object) -> bool:
+        return isinstance(symbol, str) and symbol.strip().upper() in self._monitors
+
+    def snapshots(self) -> Dict[str, Tuple[Optional[Snapshot], str]]:
+        out: Dict[str, Tuple[Optional[Snapshot], str]] = {}
+        for sym, mon in self.items():
+            out[sym] = mon.get_snapshot()
+        return out
+
+    def snapshots_parallel(self, symbols: Optional[Iterable[str]] = None,
+                           timeout: Optional[float] = None) -> Dict[str, Tuple[Optional[Snapshot], str]]:
+        """
+        Ejecuta get_snapshot() de cada símbolo en paralelo y espera hasta `timeout` segundos.
+        Los símbolos que no terminaron a tiempo vuelven como (None, "timeout ...") y su
+        request sigue en vuelo: la próxima llamada reutiliza ese resultado en vez de
+        lanzar otro get_snapshot() concurrente sobre el mismo monitor.
+        """
+        keys = [s.strip().upper() for s in symbols] if symbols is not None else self.symbols()
+        mons = {sym: self.get(sym) for sym in keys}
+        if self._executor is None or self._executor_size < len(self._monitors):
+            # un worker por monitor: ningún símbolo espera a que se libere un hilo.
+            # El executor anterior se cierra sin esperar: lo ya enviado (futuros en
+            # _inflight) termina en sus hilos y éstos se liberan al quedar ociosos
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor_size = max(1, len(self._monitors))
+            self._executor = ThreadPoolExecutor(max_workers=self._executor_size,
+                                                thread_name_prefix="monitor")
+
+        futs: Dict[str, Future] = {}
+        for sym in keys:
+            fut = self._inflight.get(sym)
+            if fut is None:
+                fut = self._executor.submit(mons[sym].get_snapshot)
+                self._inflight[sym] = fut
+            futs[sym] = fut
+
+        t0 = time.monotonic()
+        wait(list(futs.values()), timeout=timeout)
+        elapsed = time.monotonic() - t0
+
+        out: Dict[str, Tuple[Optional[Snapshot], str]] = {}
+        for sym in keys:
+            fut = futs[sym]
+            if not fut.done():
+                out[sym] = (None, f"timeout tras {elapsed:.2f}s (snapshot en curso)")
+                continue
+            self._inflight.pop(sym, None)
+            try:
+                out[sym] = fut.result()
+            except Exception as e:
+                out[sym] = (None, f"error snapshot: {e}")
+        return out
+
+    def close(self) -> None:
+        """Libera los hilos de snapshots y detiene el stream (si lo hay)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._executor_size = 0
+        self._inflight.clear()
+        if self.stream is not None:
+            self.stream.stop()
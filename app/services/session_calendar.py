@@ -0,0 +1,175 @@
+# app/services/session_calendar.py
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from zoneinfo import ZoneInfo
+
+NY = ZoneInfo("America/New_York")
+NS = 1_000_000_000
+
+# Horarios CME equity index (hora NY)
+ETH_OPEN: str = "18:00"          # Globex abre el día anterior
+ETH_CLOSE: str = "17:00"         # halt diario de mantenimiento 17:00-18:00
+HOLIDAY_HALT: str = "13:00"      # feriados US con Globex abierto (12:00 CT)
+EARLY_CLOSE: str = "13:15"       # día después de Thanksgiving, Nochebuena, 3 de julio
+
+
+def _hm(s: str) -> Tuple[int, int]:
+    h, m = s.strip().split(":")
+    return int(h), int(m)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    # n>0: n-ésimo weekday del mes; n=-1: último
+    if n > 0:
+        d = date(year, month, 1)
+        d += timedelta(days=(weekday - d.weekday()) % 7)
+        return d + timedelta(weeks=n - 1)
+    d = date(year + (month == 12), (month % 12) + 1, 1) - timedelta(days=1)
+    return d - timedelta(days=(d.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    # algoritmo anónimo gregoriano
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(d: date) -> date:
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+def _parse_dates(raw: str) -> Dict[date, Optional[str]]:
+    # "2025-12-24=13:15,2026-01-02" -> {fecha: cierre | None (cerrado)}
+    out: Dict[date, Optional[str]] = {}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        d, _, hm = part.partition("=")
+        try:
+            out[date.fromisoformat(d.strip())] = hm.strip() or None
+        except ValueError:
+            continue
+    return out
+
+
+def cme_equity_schedule(year: int) -> Dict[date, Optional[str]]:
+    """
+    Excepciones del calendario CME equity index para un año:
+    {fecha: hora de cierre NY} o None si no hay sesión ese día.
+    Overrides por ENV: SESSION_HOLIDAYS (fechas cerradas) y SESSION_EARLY_CLOSES (fecha=HH:MM).
+    """
+    out: Dict[date, Optional[str]] = {
+        _observed(date(year, 1, 1)): None,                   # Año Nuevo
+        _easter(year) - timedelta(days=2): None,             # Viernes Santo
+        _observed(date(year, 12, 25)): None,                 # Navidad
+        _nth_weekday(year, 1, 0, 3): HOLIDAY_HALT,           # MLK
+        _nth_weekday(year, 2, 0, 3): HOLIDAY_HALT,           # Presidents
+        _nth_weekday(year, 5, 0, -1): HOLIDAY_HALT,          # Memorial
+        _nth_weekday(year, 9, 0, 1): HOLIDAY_HALT,           # Labor Day
+        _nth_weekday(year, 11, 3, 4): HOLIDAY_HALT,          # Thanksgiving
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1): EARLY_CLOSE,
+        _observed(date(year, 7, 4)): HOLIDAY_HALT,           # Independence Day
+    }
+    if year >= 2022:
+        out[_observed(date(year, 6, 19))] = HOLIDAY_HALT     # Juneteenth
+    for d in (date(year, 7, 3), date(year, 12, 24)):
+        if d.weekday() < 5 and d not in out:
+            out[d] = EARLY_CLOSE
+    for d, hm in _parse_dates(os.getenv("SESSION_EARLY_CLOSES", "")).items():
+        if d.year == year:
+            out[d] = hm
+    for d in _parse_dates(os.getenv("SESSION_HOLIDAYS", "")):
+        if d.year == year:
+            out[d] = None
+    return out
+
+
+class SessionCalendar:
+    """
+    Calendario de sesiones precalculado como intervalos [inicio, fin] en epoch-ns UTC,
+    uno por día de trading (DST resuelto por zoneinfo, feriados y cierres tempranos CME).
+    - RTH: apertura de vela entre rth_start y rth_end inclusive (hora NY).
+    - ETH: desde ETH_OPEN del día anterior hasta antes de ETH_CLOSE.
+    mask() marca un array de timestamps con un solo searchsorted; contains() para un ts.
+    """
+
+    def __init__(self, rth_start: str = "09:30", rth_end: str = "16:15", tz: ZoneInfo = NY) -> None:
+        self.rth_start = _hm(rth_start)
+        self.rth_end = _hm(rth_end)
+        self.tz = tz
+        self._years: Dict[Tuple[str, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._spans: Dict[Tuple[str, int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _ns(self, d: date, hm: Tuple[int, int]) -> int:
+        dt = datetime(d.year, d.month, d.day, hm[0], hm[1], tzinfo=self.tz)
+        return int(dt.astimezone(timezone.utc).timestamp()) * NS
+
+    def _year(self, session: str, year: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (session, year)
+        cached = self._years.get(key)
+        if cached is not None:
+            return cached
+        sched = cme_equity_schedule(year)
+        starts: List[int] = []
+        ends: List[int] = []
+        d = date(year, 1, 1)
+        while d.year == year:
+            if d.weekday() < 5 and (d not in sched or sched[d] is not None):
+                close = sched.get(d)
+                if session == "RTH":
+                    end_hm = min(self.rth_end, _hm(close)) if close else self.rth_end
+                    if end_hm >= self.rth_start:
+                        starts.append(self._ns(d, self.rth_start))
+                        ends.append(self._ns(d, end_hm))
+                else:
+                    end_hm = _hm(close) if close else _hm(ETH_CLOSE)
+                    starts.append(self._ns(d - timedelta(days=1), _hm(ETH_OPEN)))
+                    ends.append(self._ns(d, end_hm) - 1)
+            d += timedelta(days=1)
+        out = (np.asarray(starts, dtype="int64"), np.asarray(ends, dtype="int64"))
+        self._years[key] = out
+        return out
+
+    def intervals(self, session: str, y0: int, y1: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(inicios, fines) ordenados para los años y0..y1 inclusive."""
+        session = session.upper()
+        key = (session, y0, y1)
+        cached = self._spans.get(key)
+        if cached is None:
+            parts = [self._year(session, y) for y in range(y0, y1 + 1)]
+            cached = (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+            self._spans[key] = cached
+        return cached
+
+    def mask(self, t_ns: np.ndarray, session: str = "RTH") -> np.ndarray:
+        t = np.asarray(t_ns, dtype="int64")
+        if t.size == 0:
+            return np.zeros(0, dtype=bool)
+        # un día de margen: ETH abre la tarde anterior
+        y0 = datetime.fromtimestamp(int(t.min()) // NS, tz=timezone.utc).year
+        y1 = (datetime.fromtimestamp(int(t.max()) // NS, tz=timezone.utc) + timedelta(days=1)).year
+        starts, ends = self.intervals(session, y0, y1)
+        i = np.searchsorted(starts, t, side="right") - 1
+        return (i >= 0) & (t <= ends[np.maximum(i, 0)])
+
+    def contains(self, ts_ns: int, session: str = "RTH") -> bool:
+        return bool(self.mask(np.asarray([ts_ns], dtype="int64"), session)[0])
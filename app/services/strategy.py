@@ -0,0 +1,99 @@
+# app/services/strategy.py
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from app.data.bar_file import COLUMNS, BarColumns
+from app.indicators.ema import ema_batch
+from app.services.session_calendar import SessionCalendar
+
+# Reglas de la estrategia cross-50-with-bias en una sola definición: el monitor en vivo
+# las evalúa sobre escalares (una vela) y el backtest sobre arrays (toda la historia).
+# Misma aritmética en ambos casos -> mismas señales bit a bit. El filtro de sesión
+# (qué velas entran en la serie) también vive acá.
+
+ArrayLike = Union[float, np.ndarray]
+
+# Códigos de señal / color (int8 en los arrays del backtest)
+NO_SIGNAL, LONG, SHORT = 0, 1, -1
+SIGNAL_NAMES = {NO_SIGNAL: None, LONG: "LONG", SHORT: "SHORT"}
+
+GRAY, RED, YELLOW, GREEN = 0, 1, 2, 3
+COLOR_NAMES = {GRAY: "gray", RED: "red", YELLOW: "yellow", GREEN: "green"}
+
+EMA_PERIODS = (50, 200)
+
+
+def session_mask(t: np.ndarray, session: str, calendar: SessionCalendar) -> Optional[np.ndarray]:
+    """Máscara de las velas (t epoch-ns de apertura) que entran en la serie; None = todas (ETH)."""
+    if session.upper() == "RTH" and t.shape[0]:
+        return calendar.mask(t, "RTH")
+    return None
+
+
+def session_filter(cols: BarColumns, session: str, calendar: SessionCalendar) -> BarColumns:
+    """Con sesión RTH sólo quedan las velas dentro del horario (en ETH, `cols` tal cual)."""
+    mask = session_mask(cols.t, session, calendar)
+    if mask is None:
+        return cols
+    return BarColumns(*(getattr(cols, k)[mask] for k in COLUMNS))
+
+
+def session_index(t: np.ndarray, session: str, calendar: SessionCalendar) -> np.ndarray:
+    """Como session_mask pero en índices (int64) sobre la serie completa."""
+    mask = session_mask(t, session, calendar)
+    return np.arange(t.shape[0], dtype="int64") if mask is None else np.flatnonzero(mask).astype("int64")
+
+
+def cross50_with_bias(prev_close: ArrayLike, prev_e50: ArrayLike,
+                      curr_close: ArrayLike, curr_e50: ArrayLike,
+                      curr_e200_base: ArrayLike, eps: float = 0.0) -> np.ndarray:
+    """
+    Señal por vela (LONG=1, SHORT=-1, nada=0); escalares o arrays alineados.
+    - Bias LONG si EMA50 > EMA200 (base) + eps; señal si el cierre cruza EMA50 hacia arriba
+      (prev_close < prev_e50 - eps y curr_close > curr_e50 + eps).
+    - Bias SHORT si EMA50 < EMA200 (base) - eps; señal si cruza hacia abajo.
+    NaN (EMAs en warm-up) nunca da señal.
+    """
+    prev_close, prev_e50, curr_close, curr_e50, curr_e200_base = (
+        np.asarray(x, dtype="float64") for x in (prev_close, prev_e50, curr_close, curr_e50, curr_e200_base))
+    long_ = ((curr_e50 - curr_e200_base) > eps) \
+        & (prev_close < (prev_e50 - eps)) & (curr_close > (curr_e50 + eps))
+    short = ((curr_e200_base - curr_e50) > eps) \
+        & (prev_close > (prev_e50 + eps)) & (curr_close < (curr_e50 - eps))
+    return np.where(long_, LONG, np.where(short, SHORT, NO_SIGNAL)).astype("int8")
+
+
+def zone_color(prev_close: ArrayLike, prev_e50: ArrayLike, prev_e200: ArrayLike,
+               curr_close: ArrayLike, curr_e50: ArrayLike, curr_e200: ArrayLike) -> np.ndarray:
+    """
+    Color por vela según la zona entre EMA50 y EMA200:
+    green si el cierre previo estaba dentro, yellow si recién entra, red si está afuera.
+    gray si falta algún valor (NaN).
+    """
+    prev_close, prev_e50, prev_e200, curr_close, curr_e50, curr_e200 = (
+        np.asarray(x, dtype="float64") for x in (prev_close, prev_e50, prev_e200, curr_close, curr_e50, curr_e200))
+    prev_in = (np.minimum(prev_e50, prev_e200) <= prev_close) & (prev_close <= np.maximum(prev_e50, prev_e200))
+    curr_in = (np.minimum(curr_e50, curr_e200) <= curr_close) & (curr_close <= np.maximum(curr_e50, curr_e200))
+    color = np.where(prev_in, GREEN, np.where(curr_in, YELLOW, RED))
+    missing = np.isnan(prev_close) | np.isnan(prev_e50) | np.isnan(prev_e200) \
+        | np.isnan(curr_close) | np.isnan(curr_e50) | np.isnan(curr_e200)
+    return np.where(missing, GRAY, color).astype("int8")
+
+
+def smooth_ema200(ema200_base: np.ndarray, smooth_type: str, length: int) -> np.ndarray:
+    """EMA200 mostrada: SMA(length) sobre la base si smooth_type="sma" (sólo display)."""
+    if smooth_type == "sma" and length > 1:
+        return pd.Series(ema200_base).rolling(length).mean().to_numpy(dtype="float64")
+    return ema200_base
+
+
+def compute_emas(closes: np.ndarray, smooth_type: str = "", smooth_length: int = 1,
+                 periods: Sequence[int] = EMA_PERIODS) -> Dict[str, np.ndarray]:
+    """EMA50 / EMA200 base (kernel batch, una pasada) y EMA200 mostrada."""
+    ema50, ema200_base = ema_batch(closes, periods)
+    return {"ema50": ema50, "ema200_base": ema200_base,
+            "ema200": smooth_ema200(ema200_base, smooth_type, smooth_length)}
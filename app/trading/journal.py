@@ -0,0 +1,160 @@
+# app/trading/journal.py
+from __future__ import annotations
+
+import os
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, IO, Optional
+
+
+def _id_epoch(ev_id: str) -> Optional[float]:
+    # ids "SYM|as_of|signal": el as_of sirve de timestamp para la retención
+    parts = ev_id.split("|")
+    if len(parts) < 2:
+        return None
+    try:
+        return datetime.fromisoformat(parts[1].replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class IdempotencyJournal:
+    """
+    Journal append-only de ids ya procesados (p.ej. "MNQ|2025-09-12T15:45:00Z|LONG").
+    - Índice en memoria (dict id -> epoch): add()/contains O(1) sin importar la antigüedad.
+    - Disco: una línea JSON por id, {"id": ..., "ts": epoch}; nunca se reescribe en add().
+    - fsync por lotes: cada `fsync_batch` ids o `fsync_interval` segundos, o con flush(sync=True).
+    - Compactación por tiempo: cada `compact_every` segundos se reescribe (tmp + replace)
+      sólo con los ids dentro de `retention_days`.
+    - Una línea truncada por un corte se ignora al cargar.
+    """
+
+    def __init__(self, path: str, retention_days: float = 30.0, fsync_batch: int = 16,
+                 fsync_interval: float = 5.0, compact_every: float = 6 * 3600.0,
+                 legacy_path: Optional[str] = None) -> None:
+        self.path = path
+        self.retention_sec = float(retention_days) * 86400.0
+        self.fsync_batch = max(1, int(fsync_batch))
+        self.fsync_interval = float(fsync_interval)
+        self.compact_every = float(compact_every)
+
+        self._index: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._fh: Optional[IO[str]] = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._last_compact = time.monotonic()
+        self._lines = 0
+
+        existed = os.path.exists(path)
+        self._load()
+        if not existed and legacy_path:
+            self._import_legacy(legacy_path)
+        self.compact()
+
+    # ------------- carga -------------
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        self._index[str(rec["id"])] = float(rec.get("ts") or 0.0)
+                        self._lines += 1
+                    except Exception:
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        # formato anterior: lista JSON completa (seen_signals.json)
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                ids = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        for ev_id in ids:
+            ev_id = str(ev_id)
+            self._index.setdefault(ev_id, _id_epoch(ev_id) or now)
+
+    # ------------- API -------------
+
+    def __contains__(self, ev_id: object) -> bool:
+        return ev_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, ev_id: str, ts: Optional[float] = None) -> bool:
+        """Marca el id; False si ya estaba. O(1): una línea al final del archivo."""
+        with self._lock:
+            if ev_id in self._index:
+                return False
+            ts = float(ts if ts is not None else (_id_epoch(ev_id) or time.time()))
+            self._index[ev_id] = ts
+            if self._fh is None:
+                self._fh = open(self.path, "a", encoding="utf-8")
+            self._fh.write(json.dumps({"id": ev_id, "ts": ts}, ensure_ascii=False) + "\n")
+            self._lines += 1
+            self._pending += 1
+            if self._pending >= self.fsync_batch or \
+                    (time.monotonic() - self._last_sync) >= self.fsync_interval:
+                self._sync_locked()
+        if (time.monotonic() - self._last_compact) >= self.compact_every:
+            self.compact()
+        return True
+
+    def flush(self, sync: bool = True) -> None:
+        with self._lock:
+            # sin líneas nuevas desde el último fsync: nada que hacer (flush por intento es gratis)
+            if self._fh is None or self._pending == 0:
+                return
+            if sync:
+                self._sync_locked()
+            else:
+                self._fh.flush()
+
+    def _sync_locked(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Descarta ids fuera de la retención y reescribe el journal. Devuelve cuántos quedaron."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cutoff = now - self.retention_sec
+            live = {k: v for k, v in self._index.items() if v >= cutoff}
+            if len(live) == len(self._index) and self._lines == len(live) and os.path.exists(self.path):
+                self._last_compact = time.monotonic()
+                return len(live)
+
+            self._sync_locked()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for ev_id, ts in live.items():
+                    f.write(json.dumps({"id": ev_id, "ts": ts}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._index = live
+            self._lines = len(live)
+            self._last_compact = time.monotonic()
+            return len(live)
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync_locked()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
@@ -0,0 +1,232 @@
+# app/trading/notifier.py
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    v = os.getenv(name, "")
+    if v == "":
+        return default
+    return v.lower() in ("1", "true", "yes", "on")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)).strip())
+    except Exception:
+        return default
+
+
+NOTIFY_QUEUE_SIZE: int = int(_env_float("NOTIFY_QUEUE_SIZE", 64))
+NOTIFY_COALESCE_SEC: float = _env_float("NOTIFY_COALESCE_SEC", 0.5)     # ventana para juntar alertas de un cierre
+NOTIFY_SMTP_IDLE_SEC: float = _env_float("NOTIFY_SMTP_IDLE_SEC", 120.0)  # cerrar la conexión SMTP ociosa
+
+_CLOSE = object()     # centinela de cierre: lo procesa el worker después de lo ya encolado
+
+
+class _Channel:
+    """
+    Cola acotada + hilo worker para un canal (Telegram o Email).
+    - put() nunca bloquea: con la cola llena se descarta la alerta más vieja (se cuenta).
+    - El worker junta lo encolado dentro de NOTIFY_COALESCE_SEC en un solo mensaje.
+    - on_idle (p.ej. cerrar SMTP) corre siempre en el worker: por inactividad y al cerrar.
+    """
+
+    def __init__(self, name: str, deliver: Callable[[str], None],
+                 maxsize: int = NOTIFY_QUEUE_SIZE, coalesce_sec: float = NOTIFY_COALESCE_SEC,
+                 on_idle: Optional[Callable[[], None]] = None) -> None:
+        self.name = name
+        self.deliver = deliver
+        self.coalesce_sec = max(coalesce_sec, 0.0)
+        self.on_idle = on_idle
+        self.q: "queue.Queue[object]" = queue.Queue(maxsize=max(1, maxsize))
+        self.dropped = 0
+        self.sent = 0
+        self._thread = threading.Thread(target=self._run, name=f"notify-{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, text: str) -> None:
+        while True:
+            try:
+                self.q.put_nowait(text)
+                return
+            except queue.Full:
+                try:
+                    self.q.get_nowait()          # degradar: se pierde la más vieja
+                    self.q.task_done()
+                    self.dropped += 1
+                    print(f"[NOTIFY][{self.name}][WARN] cola llena, alerta descartada (total={self.dropped})")
+                except queue.Empty:
+                    pass
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            try:
+                first = self.q.get(timeout=NOTIFY_SMTP_IDLE_SEC)
+            except queue.Empty:
+                if self.on_idle:
+                    self.on_idle()
+                continue
+            if first is _CLOSE:
+                self.q.task_done()
+                break
+            batch: List[str] = [first]
+            deadline = time.monotonic() + self.coalesce_sec
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _CLOSE:
+                    self.q.task_done()
+                    closing = True       # entregar este lote y terminar
+                    break
+                batch.append(item)
+            try:
+                self.deliver("\n\n".join(batch))
+                self.sent += 1
+            except Exception as e:
+                print(f"[NOTIFY][{self.name}][WARN]", e)
+            finally:
+                for _ in batch:
+                    self.q.task_done()
+        if self.on_idle:
+            self.on_idle()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # mismo Condition que usa Queue.join(), pero con timeout
+        with self.q.all_tasks_done:
+            return self.q.all_tasks_done.wait_for(lambda: self.q.unfinished_tasks == 0, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Cierre ordenado: el worker entrega lo pendiente, corre on_idle y termina."""
+        try:
+            self.q.put(_CLOSE, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class Notifier:
+    """
+    Notificaciones Telegram / Email (SMTP) fuera del camino crítico del trader.
+    send() sólo encola; cada canal tiene su propio worker, así un SMTP lento no
+    demora Telegram ni el procesamiento de los demás símbolos.
+    - Alertas del mismo cierre (dentro de NOTIFY_COALESCE_SEC) salen en un solo mensaje.
+    - Conexión SMTP persistente (STARTTLS/login una vez); se reabre si el servidor la cerró
+      y se cierra tras NOTIFY_SMTP_IDLE_SEC sin alertas.
+    - Telegram reutiliza una sesión HTTP keep-alive.
+    """
+
+    def __init__(self) -> None:
+        # Telegram
+        self.tg_enabled = _env_bool("NOTIFY_TELEGRAM", False) and \
+                          bool(os.getenv("TELEGRAM_BOT_TOKEN")) and \
+                          bool(os.getenv("TELEGRAM_CHAT_ID"))
+        # Email
+        self.mail_enabled = _env_bool("NOTIFY_EMAIL", False) and \
+                            bool(os.getenv("SMTP_HOST")) and \
+                            bool(os.getenv("SMTP_TO"))
+
+        self._tg_session = None
+        self._smtp = None
+        self._tg = _Channel("TG", self.telegram) if self.tg_enabled else None
+        self._mail = _Channel("EMAIL", self.email, on_idle=self._smtp_close) if self.mail_enabled else None
+
+    def send(self, text: str) -> None:
+        if self._tg is not None:
+            self._tg.put(text)
+        if self._mail is not None:
+            self._mail.put(text)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Espera (hasta timeout) a que se entregue lo encolado; p.ej. antes de salir."""
+        for ch in (self._tg, self._mail):
+            if ch is not None:
+                ch.flush(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Intenta vaciar las colas y detiene los workers. La conexión SMTP la cierra el
+        propio worker de EMAIL (nunca este hilo: podría estar a mitad de un sendmail).
+        """
+        deadline = time.monotonic() + timeout
+        self.flush(timeout)
+        for ch in (self._tg, self._mail):
+            if ch is not None:
+                ch.close(max(deadline - time.monotonic(), 0.0))
+
+    @property
+    def dropped(self) -> int:
+        return sum(ch.dropped for ch in (self._tg, self._mail) if ch is not None)
+
+    # ------------- Entrega (corre en los workers) -------------
+
+    def telegram(self, text: str) -> None:
+        if not self.tg_enabled:
+            return
+        import requests
+        if self._tg_session is None:
+            self._tg_session = requests.Session()
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        chat_id = os.getenv("TELEGRAM_CHAT_ID")
+        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
+        self._tg_session.post(url, json=payload, timeout=8)
+
+    def _smtp_connect(self):
+        import smtplib, ssl
+        host = os.getenv("SMTP_HOST")
+        port = int(os.getenv("SMTP_PORT", "587"))
+        user = os.getenv("SMTP_USER", "")
+        pwd  = os.getenv("SMTP_PASS", "")
+        srv = smtplib.SMTP(host, port, timeout=10)
+        srv.starttls(context=ssl.create_default_context())
+        if user:
+            srv.login(user, pwd)
+        return srv
+
+    def _smtp_close(self) -> None:
+        # sólo desde el worker de EMAIL (on_idle / reconexión): única dueña de self._smtp
+        srv, self._smtp = self._smtp, None
+        if srv is not None:
+            try:
+                srv.quit()
+            except Exception:
+                pass
+
+    def email(self, text: str) -> None:
+        if not self.mail_enabled:
+            return
+        import smtplib
+        host = os.getenv("SMTP_HOST")
+        user = os.getenv("SMTP_USER", "")
+        to   = os.getenv("SMTP_TO")
+        sender = os.getenv("SMTP_FROM", user or f"bot@{host}")
+        msg = (
+            f"From: {sender}\r\n"
+            f"To: {to}\r\n"
+            f"Subject: TraderDesk alert\r\n"
+            f"\r\n{text}"
+        )
+        rcpts = [addr.strip() for addr in to.split(",")]
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self._smtp_connect()
+            try:
+                self._smtp.sendmail(sender, rcpts, msg.encode("utf-8"))
+                return
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # el servidor cerró la conexión persistente: reconectar una vez
+                self._smtp_close()
+                if attempt == 1:
+                    raise
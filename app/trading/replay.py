@@ -0,0 +1,226 @@
+# app/trading/replay.py
+from __future__ import annotations
+
+import os
+import argparse
+import contextlib
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, TextIO, Tuple
+
+from app.backtest.bracket import load_trades
+from app.brokers.replay_client import ReplayClient
+from app.services.market_monitor import BAR_MINUTES, Snapshot
+from app.services.monitor_pool import MonitorPool
+from app.trading.scheduler import BarCloseScheduler, SimulatedClock
+from app.trading.signal_trader import CHECK_MINUTES, CLOSE_LAG_SEC, TRADE_SYMBOLS, SignalTrader
+
+# Replay determinístico: MarketMonitor.get_snapshot y el manejo de cierres de signal_trader
+# (SignalTrader) reales, con un reloj simulado (los sleeps avanzan el tiempo al instante) y
+# un ReplayClient que sirve las velas grabadas. Sin red, sin checkpoint ni journal: una
+# semana de cierres corre en segundos y sus señales se comparan con el trades.log de esa semana.
+
+Key = Tuple[str, str, str]     # (symbol, as_of, signal)
+
+
+@dataclass
+class ReplayEvent:
+    """Una vela nueva procesada por el trader (una por símbolo y cierre)."""
+    woke_at: str               # hora simulada del procesamiento
+    symbol: str
+    contract_id: str
+    as_of: str
+    close: float
+    ema50: float
+    ema200: float
+    color: str
+    signal: Optional[str]
+
+
+@dataclass
+class ReplayResult:
+    events: List[ReplayEvent]
+    closes: int                # cierres despertados por el scheduler
+    calls: int                 # retrieveBars servidos por el ReplayClient
+    elapsed_sec: float         # tiempo real
+
+    @property
+    def signals(self) -> List[ReplayEvent]:
+        return [e for e in self.events if e.signal]
+
+    @property
+    def bars_per_sec(self) -> float:
+        return len(self.events) / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+
+@dataclass
+class TradeComparison:
+    """Señales del replay vs ORDER_SENT del log, por (símbolo, as_of, señal)."""
+    matched: List[Key] = field(default_factory=list)
+    missing: List[Key] = field(default_factory=list)   # en trades.log, no en el replay
+    extra: List[Key] = field(default_factory=list)     # en el replay, no en trades.log
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing
+
+    def summary(self) -> str:
+        return f"coinciden={len(self.matched)} faltan={len(self.missing)} extra={len(self.extra)}"
+
+
+def _iso_z(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def _parse_dt(s: str) -> datetime:
+    dt = datetime.fromisoformat(str(s).strip().replace("Z", "+00:00"))
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def replay(px: ReplayClient, start: datetime, end: datetime, symbols: Sequence[str] = (),
+           contract_ids: Optional[Dict[str, str]] = None, log: Optional[TextIO] = None) -> ReplayResult:
+    """
+    Reproduce los cierres de (start, end] con la lógica del trader en vivo.
+    - px.clock debe ser un SimulatedClock; arranca en `start` (la semilla usa lo visible ahí).
+    - contract_ids: símbolo -> contractId fijo (el de la semana grabada, no el de .env).
+    - log: destino de la salida del trader (None = descartar).
+    """
+    clock = px.clock
+    if not isinstance(clock, SimulatedClock):
+        raise TypeError("replay requiere un ReplayClient con SimulatedClock")
+    clock.advance_to(start.timestamp())
+    symbols = [s.strip().upper() for s in (symbols or TRADE_SYMBOLS)]
+
+    events: List[ReplayEvent] = []
+
+    def on_bar(sym: str, snap: Snapshot) -> None:
+        events.append(ReplayEvent(
+            woke_at=_iso_z(datetime.fromtimestamp(clock.time(), tz=timezone.utc)),
+            symbol=sym, contract_id=snap.contract_id, as_of=snap.as_of, close=snap.close,
+            ema50=snap.ema50, ema200=snap.ema200, color=snap.color, signal=snap.signal,
+        ))
+
+    t0 = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(log or devnull):
+        pool = MonitorPool(symbols, px=px, clock=clock, offline=True, contract_ids=contract_ids)
+        try:
+            trader = SignalTrader(pool, px, notifier=None, seen=None, clock=clock, beep=False, on_bar=on_bar)
+            trader.init_snapshots()
+            scheduler = BarCloseScheduler(BAR_MINUTES, CHECK_MINUTES, max(CLOSE_LAG_SEC, 0.1), clock)
+            end_epoch = end.timestamp()
+            while scheduler.next_close() + scheduler.lag_sec <= end_epoch:
+                trader.on_wakeup(scheduler.wait_next(), scheduler)
+        finally:
+            pool.close()
+    return ReplayResult(events=events, closes=scheduler.wakeups, calls=px.calls,
+                        elapsed_sec=time.perf_counter() - t0)
+
+
+def compare_trades(events: Sequence[ReplayEvent], trades: Sequence[Dict[str, Any]],
+                   start: Optional[datetime] = None, end: Optional[datetime] = None) -> TradeComparison:
+    """
+    Cruza las señales del replay con los ORDER_SENT (load_trades) de la misma ventana/símbolos.
+    Un extra no es necesariamente un error: el log sólo tiene las órdenes efectivamente enviadas.
+    """
+    syms = {e.symbol for e in events}
+    got = {(e.symbol, e.as_of, e.signal) for e in events if e.signal}
+    want = set()
+    for tr in trades:
+        sym = str(tr.get("symbol", "")).upper()
+        as_of = _parse_dt(tr["as_of"])
+        if syms and sym not in syms:
+            continue
+        if (start and as_of < start) or (end and as_of >= end):
+            continue
+        want.add((sym, _iso_z(as_of), str(tr.get("signal"))))
+    return TradeComparison(matched=sorted(got & want), missing=sorted(want - got), extra=sorted(got - want))
+
+
+def contracts_from_trades(trades: Sequence[Dict[str, Any]]) -> Dict[str, str]:
+    """Último contractId operado por símbolo (el contrato vigente esa semana)."""
+    out: Dict[str, str] = {}
+    for tr in trades:
+        if tr.get("symbol") and tr.get("contract_id"):
+            out[str(tr["symbol"]).upper()] = str(tr["contract_id"])
+    return out
+
+
+def main() -> None:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except Exception:
+        pass
+
+    ap = argparse.ArgumentParser(description="Replay determinístico del trader contra velas grabadas")
+    ap.add_argument("--recording", default=os.getenv("PROJECTX_RECORD_BARS") or None,
+                    help="JSONL de retrieveBars grabado (PROJECTX_RECORD_BARS)")
+    ap.add_argument("--bar-cache", default=None, help="usar el cache de BarStore (directorio) como fuente")
+    ap.add_argument("--trades", default="trades.log", help="trades.log a comparar")
+    ap.add_argument("--symbols", default=None, help="CSV (default TRADE_SYMBOLS)")
+    ap.add_argument("--contract", action="append", default=[], help="SYM=contractId (repetible)")
+    ap.add_argument("--start", default=None, help="ISO UTC (default: inicio del día del primer trade)")
+    ap.add_argument("--end", default=None, help="ISO UTC (default: fin del día del último trade)")
+    ap.add_argument("--log", default=None, help="guardar la salida del trader en este archivo")
+    args = ap.parse_args()
+
+    trades = load_trades(args.trades) if os.path.exists(args.trades) else []
+    contract_ids = contracts_from_trades(trades)
+    contract_ids.update(dict(c.split("=", 1) for c in args.contract if "=" in c))
+    contract_ids = {k.strip().upper(): v.strip() for k, v in contract_ids.items()}
+    symbols = [s.strip().upper() for s in args.symbols.split(",")] if args.symbols else TRADE_SYMBOLS
+
+    if args.start:
+        start = _parse_dt(args.start)
+    elif trades:
+        first = min(_parse_dt(tr["as_of"]) for tr in trades)
+        start = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        raise SystemExit("[Replay] falta --start (sin trades.log para inferirlo)")
+    if args.end:
+        end = _parse_dt(args.end)
+    elif trades:
+        last = max(_parse_dt(tr["as_of"]) for tr in trades)
+        end = last.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    else:
+        end = start + timedelta(days=7)
+
+    clock = SimulatedClock(start.timestamp())
+    px = ReplayClient(clock=clock, contracts=contract_ids)
+    # primero el cache y encima lo grabado (respuestas reales de esa semana: gana ante el mismo t)
+    if args.bar_cache:
+        cache = ReplayClient.from_bar_cache(args.bar_cache, sorted(set(contract_ids.values())),
+                                            unit_number=BAR_MINUTES)
+        for key, cols in cache.series.items():
+            px.add(key, cols)
+    if args.recording:
+        for key, cols in ReplayClient.from_recording(args.recording).series.items():
+            px.add(key, cols)
+    if not px.series:
+        raise SystemExit("[Replay] sin velas: pasar --recording y/o --bar-cache")
+
+    log = open(args.log, "w", encoding="utf-8") if args.log else None
+    try:
+        res = replay(px, start, end, symbols, contract_ids, log)
+    finally:
+        if log is not None:
+            log.close()
+
+    print(f"[Replay] {_iso_z(start)} -> {_iso_z(end)} {symbols}: {res.closes} cierres, "
+          f"{len(res.events)} velas, {len(res.signals)} señales, {res.calls} retrieveBars "
+          f"en {res.elapsed_sec:.2f}s ({res.bars_per_sec:.0f} velas/s)")
+    for e in res.signals:
+        print(f"  {e.as_of} {e.symbol:<4} {e.signal:<5} close={e.close:.2f} ema50={e.ema50:.2f} "
+              f"ema200={e.ema200:.2f}")
+    if trades:
+        cmp = compare_trades(res.events, trades, start, end)
+        print(f"[Replay] vs {args.trades}: {cmp.summary()}")
+        for k in cmp.missing:
+            print(f"  FALTA {k}")
+        for k in cmp.extra:
+            print(f"  EXTRA {k}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# app/trading/scheduler.py
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+
+class Clock:
+    """Reloj del sistema (inyectable: replay/tests pueden usar uno simulado)."""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class SimulatedClock(Clock):
+    """Reloj de replay: sleep() avanza el tiempo al instante (determinístico, sin esperas reales)."""
+
+    def __init__(self, start: float) -> None:
+        self._now = float(start)
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+    def advance_to(self, t: float) -> None:
+        with self._lock:
+            self._now = max(self._now, float(t))
+
+
+@dataclass
+class Wakeup:
+    close: datetime        # cierre de vela objetivo (UTC)
+    target: float          # epoch en que se pidió despertar (close + lag)
+    woke_at: float         # epoch real al despertar
+    late_sec: float        # atraso medido con el reloj monotónico
+    missed: int = 0        # cierres salteados desde el despertar anterior
+
+
+class BarCloseScheduler:
+    """
+    Duerme hasta el próximo cierre de vela + lag en vez de hacer polling por segundo.
+    - Cierres = múltiplos de bar_minutes desde epoch (UTC), como las velas del gateway.
+    - check_minutes (opcional): filtra por minuto de la hora (p.ej. {0, 30}); vacío = todos.
+    - La espera se mide con el reloj monotónico (saltos de NTP/ajustes no la afectan) y
+      cada despertar informa cuánto llegó tarde.
+    """
+
+    def __init__(self, bar_minutes: int, check_minutes: Optional[Iterable[int]] = None,
+                 lag_sec: float = 0.0, clock: Clock = SYSTEM_CLOCK) -> None:
+        if bar_minutes < 1:
+            raise ValueError(f"bar_minutes inválido: {bar_minutes}")
+        self.bar_sec = int(bar_minutes) * 60
+        self.lag_sec = max(float(lag_sec), 0.0)
+        self.clock = clock
+
+        # minutos de la hora en que cierra alguna vela; si el filtro no coincide con
+        # ningún cierre (config inconsistente) se ignora en vez de no despertar nunca
+        allowed = {int(m) % 60 for m in (check_minutes or ())}
+        closes = {(k * self.bar_sec // 60) % 60 for k in range(max(1, 3600 // self.bar_sec) * 24)}
+        self.check_minutes = (allowed & closes) or None
+
+        self._last_close: Optional[float] = None
+        self.wakeups = 0
+        self.max_late_sec = 0.0
+        self.total_late_sec = 0.0
+
+    def _is_check(self, close_epoch: float) -> bool:
+        if not self.check_minutes:
+            return True
+        minute = int(close_epoch // 60) % 60
+        return minute in self.check_minutes
+
+    def next_close(self, now: Optional[float] = None) -> float:
+        """Epoch del próximo cierre habilitado cuyo close + lag sea posterior a `now`."""
+        now = self.clock.time() if now is None else now
+        close = ((now - self.lag_sec) // self.bar_sec + 1) * self.bar_sec
+        while not self._is_check(close):
+            close += self.bar_sec
+        return float(close)
+
+    def wait_next(self) -> Wakeup:
+        wall = self.clock.time()
+        mono = self.clock.monotonic()
+        close = self.next_close(wall)
+        target = close + self.lag_sec
+        deadline = mono + (target - wall)
+
+        # dormir en tramos: si el sleep vuelve antes (señales, granularidad), seguir
+        while True:
+            remaining = deadline - self.clock.monotonic()
+            if remaining <= 0:
+                break
+            self.clock.sleep(remaining)
+
+        late = self.clock.monotonic() - deadline
+        missed = 0
+        if self._last_close is not None:
+            c = self._last_close + self.bar_sec
+            while c < close:
+                missed += self._is_check(c)
+                c += self.bar_sec
+        self._last_close = close
+
+        self.wakeups += 1
+        self.total_late_sec += late
+        self.max_late_sec = max(self.max_late_sec, late)
+        return Wakeup(
+            close=datetime.fromtimestamp(close, tz=timezone.utc),
+            target=target,
+            woke_at=self.clock.time(),
+            late_sec=late,
+            missed=missed,
+        )
+
+    @property
+    def avg_late_sec(self) -> float:
+        return self.total_late_sec / self.wakeups if self.wakeups else 0.0
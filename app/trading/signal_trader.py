@@ -1,9 +1,8 @@
 # app/trading/signal_trader.py
 import os
-import json
-import time
-from datetime import datetime, timezone, timedelta
-from typing import Dict, Optional
+import atexit
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
 
 # Cargar .env si está disponible
 try:
@@ -13,7 +12,11 @@ except Exception:
     pass
 
 from app.brokers.projectx_api import ProjectXClient
-from app.services.market_monitor import MarketMonitor, Snapshot
+from app.services.market_monitor import MarketMonitor, Snapshot, BAR_MINUTES
+from app.services.monitor_pool import MonitorPool
+from app.trading.journal import IdempotencyJournal
+from app.trading.notifier import Notifier
+from app.trading.scheduler import SYSTEM_CLOCK, BarCloseScheduler, Clock, Wakeup
 
 # ---------- Helpers de ENV ----------
 def env_bool(name: str, default: bool = False) -> bool:
@@ -59,99 +62,192 @@ def _beep():
         # Bell ASCII como fallback multiplataforma
         print("\a", end="", flush=True)
 
-# ---------- Notificador (Telegram / Email vía SMTP) ----------
-class Notifier:
-    def __init__(self) -> None:
-        # Telegram
-        self.tg_enabled = env_bool("NOTIFY_TELEGRAM", False) and \
-                          bool(os.getenv("TELEGRAM_BOT_TOKEN")) and \
-                          bool(os.getenv("TELEGRAM_CHAT_ID"))
-        # Email
-        self.mail_enabled = env_bool("NOTIFY_EMAIL", False) and \
-                            bool(os.getenv("SMTP_HOST")) and \
-                            bool(os.getenv("SMTP_TO"))
-
-    def send(self, text: str) -> None:
-        self.telegram(text)
-        self.email(text)
-
-    def telegram(self, text: str) -> None:
-        if not self.tg_enabled:
-            return
-        try:
-            import requests
-            token = os.getenv("TELEGRAM_BOT_TOKEN")
-            chat_id = os.getenv("TELEGRAM_CHAT_ID")
-            url = f"https://api.telegram.org/bot{token}/sendMessage"
-            payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
-            requests.post(url, json=payload, timeout=8)
-        except Exception as e:
-            print("[NOTIFY][TG][WARN]", e)
-
-    def email(self, text: str) -> None:
-        if not self.mail_enabled:
-            return
-        try:
-            import smtplib, ssl
-            host = os.getenv("SMTP_HOST")
-            port = int(os.getenv("SMTP_PORT", "587"))
-            user = os.getenv("SMTP_USER", "")
-            pwd  = os.getenv("SMTP_PASS", "")
-            to   = os.getenv("SMTP_TO")
-            sender = os.getenv("SMTP_FROM", user or f"bot@{host}")
-            msg = (
-                f"From: {sender}\r\n"
-                f"To: {to}\r\n"
-                f"Subject: TraderDesk alert\r\n"
-                f"\r\n{text}"
-            )
-            ctx = ssl.create_default_context()
-            with smtplib.SMTP(host, port, timeout=10) as srv:
-                srv.starttls(context=ctx)
-                if user:
-                    srv.login(user, pwd)
-                srv.sendmail(sender, [addr.strip() for addr in to.split(",")], msg.encode("utf-8"))
-        except Exception as e:
-            print("[NOTIFY][EMAIL][WARN]", e)
-
 # ---------- Config desde tu .env ----------
-CHECK_MINUTES        = env_csv_ints("CHECK_MINUTES", "0,15,30,45")
+CHECK_MINUTES        = env_csv_ints("CHECK_MINUTES", "")         # minutos de la hora; vacío = cada cierre de BAR_MINUTES
 CLOSE_LAG_SEC        = env_float("CLOSE_LAG_SEC", 1.0)           # margen post-cierre
+SCHED_LATE_WARN_SEC  = env_float("SCHED_LATE_WARN_SEC", 0.5)     # avisar si el despertar llega tarde
 CLOSE_RETRY_COUNT    = env_int("CLOSE_RETRY_COUNT", 10)          # reintentos si no llegó la vela
 CLOSE_RETRY_INTERVAL = env_float("CLOSE_RETRY_INTERVAL", 0.5)
+CLOSE_DEADLINE_SEC   = env_float("CLOSE_DEADLINE_SEC", 20.0)     # tope total por cierre (todos los símbolos)
+METRICS_EVERY_CLOSES = env_int("METRICS_EVERY_CLOSES", 16)       # log de métricas HTTP cada N cierres; 0 = nunca
 
 DRY_RUN       = env_bool("DRY_RUN", True)
 TRADE_SYMBOLS = [s.strip().upper() for s in os.getenv("TRADE_SYMBOLS", "MNQ,ES").split(",") if s.strip()]
 
 # ---------- Idempotencia por vela ----------
-SEEN_FILE = os.getenv("SEEN_SIGNALS_FILE", "seen_signals.json")
-
-def _load_seen() -> set[str]:
-    try:
-        with open(SEEN_FILE, "r", encoding="utf-8") as f:
-            return set(json.load(f))
-    except Exception:
-        return set()
+SEEN_FILE      = os.getenv("SEEN_SIGNALS_FILE", "seen_signals.json")       # formato anterior (se importa)
+SEEN_JOURNAL   = os.getenv("SEEN_SIGNALS_JOURNAL", "seen_signals.jsonl")   # journal append-only
+SEEN_RETENTION_DAYS = env_float("SEEN_RETENTION_DAYS", 30.0)
 
-def _save_seen(seen: set[str]) -> None:
-    try:
-        with open(SEEN_FILE, "w", encoding="utf-8") as f:
-            json.dump(sorted(list(seen)), f, ensure_ascii=False)
-    except Exception as e:
-        print("[SEEN][WARN]", e)
+def _open_seen() -> IdempotencyJournal:
+    return IdempotencyJournal(SEEN_JOURNAL, retention_days=SEEN_RETENTION_DAYS, legacy_path=SEEN_FILE)
 
 def _event_id(sym: str, as_of: str, signal: Optional[str]) -> str:
     return f"{sym}|{as_of}|{signal}"
 
-# ---------- Timing: siguiente :00/:15/:30/:45 ----------
-def _next_quarter(dt: datetime) -> datetime:
-    m = dt.minute
-    q = (m // 15) * 15
-    base = dt.replace(second=0, microsecond=0)
-    target = base.replace(minute=q)
-    if base >= target:
-        target = target + timedelta(minutes=15)
-    return target
+# ---------- Lógica de cierre (independiente del reloj) ----------
+class SignalTrader:
+    """
+    Procesamiento de cada cierre de vela: snapshots de todos los símbolos, log una vez por
+    vela nueva, pullbacks (beep + notify), cambios de bias/señal e idempotencia.
+    - El reloj es inyectable: main() usa el del sistema; el replay (app/trading/replay.py)
+      usa uno simulado y un ProjectXClient que sirve velas grabadas.
+    - on_bar(sym, snap): callback opcional por cada vela nueva procesada.
+    """
+
+    def __init__(self, pool: MonitorPool, px, notifier: Optional[Notifier] = None,
+                 seen: Optional[IdempotencyJournal] = None, clock: Clock = SYSTEM_CLOCK,
+                 beep: bool = True, on_bar: Optional[Callable[[str, Snapshot], None]] = None) -> None:
+        self.pool = pool
+        self.px = px
+        self.notifier = notifier
+        self.seen = seen
+        self.clock = clock
+        self.beep = beep
+        self.on_bar = on_bar
+        self.monitors: Dict[str, MarketMonitor] = dict(pool.items())
+        # Para rastrear cambios (bias, señal y relación cierre vs EMA50) entre velas
+        # guardamos: {"as_of": str, "bias": str, "signal": str, "above50": bool}
+        self.last_info: Dict[str, Dict[str, Optional[str] | bool]] = {}
+
+    def _now(self) -> str:
+        return _iso_z(datetime.fromtimestamp(self.clock.time(), tz=timezone.utc))
+
+    def _alert(self, txt: str) -> None:
+        if self.beep:
+            _beep()
+        if self.notifier is not None:
+            self.notifier.send(txt)
+
+    def init_snapshots(self) -> None:
+        """Snapshot inmediato al iniciar (fija la vela de referencia de cada símbolo)."""
+        for sym, (snap, msg) in self.pool.snapshots_parallel(timeout=CLOSE_DEADLINE_SEC).items():
+            if not snap:
+                print(f"[{self._now()}] [{sym}] INIT WARN: {msg}")
+                continue
+            bias = "BUY" if snap.ema50 > snap.ema200 else "SELL"
+            print(f"[{self._now()}] [INIT {sym}] as_of={snap.as_of} "
+                  f"close={snap.close:.2f} ema50={snap.ema50:.2f} ema200={snap.ema200:.2f} "
+                  f"bias={bias} signal={snap.signal}")
+            self.last_info[sym] = {
+                "as_of": snap.as_of,
+                "bias": bias,
+                "signal": snap.signal or "None",
+                "above50": bool(snap.close > snap.ema50),
+            }
+
+    def on_wakeup(self, wake: Wakeup, scheduler: BarCloseScheduler) -> None:
+        if wake.late_sec > SCHED_LATE_WARN_SEC or wake.missed:
+            print(f"[{self._now()}] [SCHED][WARN] cierre {_iso_z(wake.close)} "
+                  f"despertó {wake.late_sec * 1000:.0f}ms tarde (salteados={wake.missed}, "
+                  f"max={scheduler.max_late_sec * 1000:.0f}ms)")
+        if METRICS_EVERY_CLOSES > 0 and scheduler.wakeups % METRICS_EVERY_CLOSES == 0:
+            m = self.px.metrics()
+            print(f"[{self._now()}] [METRICS] breaker={m['breaker']} "
+                  f"opens={m['breaker_opens']} {self.px.http_metrics.summary()}")
+            print(f"[{self._now()}] [BUDGET] {self.px.budget_summary()}")
+        self.handle_close()
+
+    def handle_close(self) -> None:
+        clock = self.clock
+        # Control de “impreso una sola vez por símbolo”
+        printed: set[str] = set()
+        deadline = clock.monotonic() + max(CLOSE_DEADLINE_SEC, 0.1)
+
+        for attempt in range(CLOSE_RETRY_COUNT):
+            # Fan-out: todos los símbolos pendientes en paralelo, acotado al deadline del cierre
+            pending = [sym for sym in self.monitors if sym not in printed]
+            remaining = max(deadline - clock.monotonic(), 0.0)
+            results = self.pool.snapshots_parallel(pending, timeout=remaining)
+            last_attempt = (attempt == CLOSE_RETRY_COUNT - 1) or (clock.monotonic() >= deadline)
+
+            for sym in pending:
+                snap, msg = results[sym]
+                if not snap:
+                    # solo informamos si es el último intento
+                    if last_attempt:
+                        print(f"[{self._now()}] [{sym}] WARN snapshot: {msg}")
+                    continue
+
+                bias = "BUY" if snap.ema50 > snap.ema200 else "SELL"
+                curr_above50 = bool(snap.close > snap.ema50)
+
+                prev = self.last_info.get(sym)
+                is_new_bar = (prev is None) or (prev.get("as_of") != snap.as_of)
+
+                if not is_new_bar:
+                    # todavía no cerró la vela nueva; reintentaremos
+                    continue
+
+                # --------- LOG detallado UNA sola vez ---------
+                print(f"[{self._now()}] [{sym}] as_of={snap.as_of} "
+                      f"close={snap.close:.2f} ema50={snap.ema50:.2f} ema200={snap.ema200:.2f} "
+                      f"bias={bias} signal={snap.signal}")
+
+                # --------- DETECCIÓN DE PULLBACK + BEEP + NOTIFY (solo una vez) ----------
+                prev_above50 = None if prev is None else bool(prev.get("above50"))
+                if prev_above50 is not None:
+                    # BUY bias: cruce de ARRIBA->ABAJO (cerró debajo de EMA50)
+                    if bias == "BUY" and prev_above50 and (not curr_above50):
+                        txt = (f"📉 <b>Pullback BUY</b> {sym}\n"
+                               f"as_of: {snap.as_of}\n"
+                               f"close: {snap.close:.2f}\n"
+                               f"EMA50: {snap.ema50:.2f}\n"
+                               f"EMA200:{snap.ema200:.2f}\n"
+                               f"Evento: cierre pasó de >EMA50 a <EMA50")
+                        self._alert(txt)
+                        print(f"[BEEP][NOTIFY] {sym} pullback BUY")
+
+                    # SELL bias: cruce de ABAJO->ARRIBA (cerró encima de EMA50)
+                    if bias == "SELL" and (not prev_above50) and curr_above50:
+                        txt = (f"📈 <b>Pullback SELL</b> {sym}\n"
+                               f"as_of: {snap.as_of}\n"
+                               f"close: {snap.close:.2f}\n"
+                               f"EMA50: {snap.ema50:.2f}\n"
+                               f"EMA200:{snap.ema200:.2f}\n"
+                               f"Evento: cierre pasó de <EMA50 a >EMA50")
+                        self._alert(txt)
+                        print(f"[BEEP][NOTIFY] {sym} pullback SELL")
+
+                # Cambios de bias / señal (informativos, también una vez)
+                if prev:
+                    if prev.get("bias") != bias:
+                        print(f"[{self._now()}] [{sym}] BIAS CHANGE: {prev.get('bias')} -> {bias}")
+                    if prev.get("signal") != (snap.signal or "None"):
+                        print(f"[{self._now()}] [{sym}] SIGNAL CHANGE: {prev.get('signal')} -> {snap.signal}")
+
+                # actualizar estado de última vela y marcar como impreso
+                self.last_info[sym] = {
+                    "as_of": snap.as_of,
+                    "bias": bias,
+                    "signal": snap.signal or "None",
+                    "above50": curr_above50,
+                }
+                printed.add(sym)
+                if self.on_bar is not None:
+                    self.on_bar(sym, snap)
+
+                # Idempotencia (marcar vista esta vela-señal)
+                if self.seen is not None:
+                    # (ya no existe duplicidad porque imprimimos una vez por símbolo)
+                    try:
+                        self.seen.add(_event_id(sym, snap.as_of, snap.signal))   # O(1): no-op si ya estaba
+                    except Exception as e:
+                        print("[SEEN][WARN]", e)
+
+            # un solo fsync por intento (lote de todos los símbolos del cierre)
+            if self.seen is not None:
+                try:
+                    self.seen.flush()
+                except Exception as e:
+                    print("[SEEN][WARN]", e)
+
+            # ¿ya imprimimos todos (o se agotó el deadline)? cortar reintentos
+            if len(printed) == len(self.monitors) or last_attempt:
+                break
+            # si faltan, esperamos y reintentamos
+            clock.sleep(CLOSE_RETRY_INTERVAL)
+
 
 # ---------- Main ----------
 def main():
@@ -159,134 +255,22 @@ def main():
     if not px._token:
         px.login_with_key()
 
-    notifier = Notifier()
+    notifier = Notifier()               # envía en segundo plano; send() no bloquea
+    atexit.register(notifier.close)
 
     # Un MarketMonitor por símbolo (comparte el ProjectXClient ya logueado)
-    monitors: Dict[str, MarketMonitor] = {}
-    for sym in TRADE_SYMBOLS:
-        monitors[sym] = MarketMonitor(sym, px=px)
-
-    # Para rastrear cambios (bias, señal y relación cierre vs EMA50) entre velas
-    # guardamos: {"as_of": str, "bias": str, "signal": str, "above50": bool}
-    last_info: Dict[str, Dict[str, Optional[str] | bool]] = {}
-
-    seen = _load_seen()
+    pool = MonitorPool(TRADE_SYMBOLS, px=px)
+    trader = SignalTrader(pool, px, notifier, _open_seen())
     print(f"[INIT] DRY_RUN={DRY_RUN} symbols={TRADE_SYMBOLS}")
 
     # --------- Snapshot inmediato al iniciar ---------
-    for sym, mon in monitors.items():
-        snap, msg = mon.get_snapshot()
-        if not snap:
-            print(f"[{_iso_z(datetime.now(timezone.utc))}] [{sym}] INIT WARN: {msg}")
-            continue
-        bias = "BUY" if snap.ema50 > snap.ema200 else "SELL"
-        print(f"[{_iso_z(datetime.now(timezone.utc))}] [INIT {sym}] as_of={snap.as_of} "
-              f"close={snap.close:.2f} ema50={snap.ema50:.2f} ema200={snap.ema200:.2f} "
-              f"bias={bias} signal={snap.signal}")
-        last_info[sym] = {
-            "as_of": snap.as_of,
-            "bias": bias,
-            "signal": snap.signal or "None",
-            "above50": bool(snap.close > snap.ema50),
-        }
-
-    # Loop de chequeo en cierres exactos
+    trader.init_snapshots()
+
+    # Loop de chequeo en cierres exactos: dormir hasta el próximo cierre + lag
+    # (el lag da tiempo a que cierre y aparezca la vela)
+    scheduler = BarCloseScheduler(BAR_MINUTES, CHECK_MINUTES, max(CLOSE_LAG_SEC, 0.1))
     while True:
-        now = datetime.now(timezone.utc)
-
-        # Chequeamos únicamente en los minutos de interés
-        if (now.minute % 15) in CHECK_MINUTES and now.second == 0:
-            # pequeño lag para permitir que cierre y aparezca la vela
-            time.sleep(max(CLOSE_LAG_SEC, 0.1))
-
-            # Control de “impreso una sola vez por símbolo”
-            printed: set[str] = set()
-
-            for attempt in range(CLOSE_RETRY_COUNT):
-                for sym, mon in monitors.items():
-                    if sym in printed:
-                        continue  # ya mostramos/sonamos/notify para este símbolo en este cierre
-
-                    snap, msg = mon.get_snapshot()
-                    if not snap:
-                        # solo informamos si es el último intento
-                        if attempt == CLOSE_RETRY_COUNT - 1:
-                            print(f"[{_iso_z(datetime.now(timezone.utc))}] [{sym}] WARN snapshot: {msg}")
-                        continue
-
-                    bias = "BUY" if snap.ema50 > snap.ema200 else "SELL"
-                    curr_above50 = bool(snap.close > snap.ema50)
-
-                    prev = last_info.get(sym)
-                    is_new_bar = (prev is None) or (prev.get("as_of") != snap.as_of)
-
-                    if not is_new_bar:
-                        # todavía no cerró la vela nueva; reintentaremos
-                        continue
-
-                    # --------- LOG detallado UNA sola vez ---------
-                    print(f"[{_iso_z(datetime.now(timezone.utc))}] [{sym}] as_of={snap.as_of} "
-                          f"close={snap.close:.2f} ema50={snap.ema50:.2f} ema200={snap.ema200:.2f} "
-                          f"bias={bias} signal={snap.signal}")
-
-                    # --------- DETECCIÓN DE PULLBACK + BEEP + NOTIFY (solo una vez) ----------
-                    prev_above50 = None if prev is None else bool(prev.get("above50"))
-                    if prev_above50 is not None:
-                        # BUY bias: cruce de ARRIBA->ABAJO (cerró debajo de EMA50)
-                        if bias == "BUY" and prev_above50 and (not curr_above50):
-                            _beep()
-                            txt = (f"📉 <b>Pullback BUY</b> {sym}\n"
-                                   f"as_of: {snap.as_of}\n"
-                                   f"close: {snap.close:.2f}\n"
-                                   f"EMA50: {snap.ema50:.2f}\n"
-                                   f"EMA200:{snap.ema200:.2f}\n"
-                                   f"Evento: cierre pasó de >EMA50 a <EMA50")
-                            notifier.send(txt)
-                            print(f"[BEEP][NOTIFY] {sym} pullback BUY")
-
-                        # SELL bias: cruce de ABAJO->ARRIBA (cerró encima de EMA50)
-                        if bias == "SELL" and (not prev_above50) and curr_above50:
-                            _beep()
-                            txt = (f"📈 <b>Pullback SELL</b> {sym}\n"
-                                   f"as_of: {snap.as_of}\n"
-                                   f"close: {snap.close:.2f}\n"
-                                   f"EMA50: {snap.ema50:.2f}\n"
-                                   f"EMA200:{snap.ema200:.2f}\n"
-                                   f"Evento: cierre pasó de <EMA50 a >EMA50")
-                            notifier.send(txt)
-                            print(f"[BEEP][NOTIFY] {sym} pullback SELL")
-
-                    # Cambios de bias / señal (informativos, también una vez)
-                    if prev:
-                        if prev.get("bias") != bias:
-                            print(f"[{_iso_z(datetime.now(timezone.utc))}] [{sym}] BIAS CHANGE: {prev.get('bias')} -> {bias}")
-                        if prev.get("signal") != (snap.signal or "None"):
-                            print(f"[{_iso_z(datetime.now(timezone.utc))}] [{sym}] SIGNAL CHANGE: {prev.get('signal')} -> {snap.signal}")
-
-                    # actualizar estado de última vela y marcar como impreso
-                    last_info[sym] = {
-                        "as_of": snap.as_of,
-                        "bias": bias,
-                        "signal": snap.signal or "None",
-                        "above50": curr_above50,
-                    }
-                    printed.add(sym)
-
-                    # Idempotencia (marcar vista esta vela-señal)
-                    ev_id = _event_id(sym, snap.as_of, snap.signal)
-                    # (ya no existe duplicidad porque imprimimos una vez por símbolo)
-                    if ev_id not in seen:
-                        seen.add(ev_id)
-                        _save_seen(seen)
-
-                # ¿ya imprimimos todos? cortar reintentos
-                if len(printed) == len(monitors):
-                    break
-                # si faltan, esperamos y reintentamos
-                time.sleep(CLOSE_RETRY_INTERVAL)
-
-        # dormir hasta el siguiente segundo (liviano)
-        time.sleep(1)
+        trader.on_wakeup(scheduler.wait_next(), scheduler)
 
 if __name__ == "__main__":
     main()
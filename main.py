@@ -1,20 +1,22 @@
 from __future__ import annotations
 import time
-from app.services.market_monitor import MarketMonitor
+from app.services.monitor_pool import MonitorPool
 
-def run_once():
-    for sym in ("MNQ", "ES"):
-        mon = MarketMonitor(sym)
-        snap, msg = mon.get_snapshot()
+SYMBOLS = ("MNQ", "ES")
+
+def run_once(pool: MonitorPool):
+    for sym, (snap, msg) in pool.snapshots().items():
         if not snap:
             print(f"[{sym}] WARN:", msg); continue
         print(f"[{sym}] {snap.as_of} close={snap.close:.2f} "
               f"ema50={snap.ema50:.2f} ema200={snap.ema200:.2f} color={snap.color}")
 
 if __name__ == "__main__":
+    # Login, contratos y semilla una sola vez; el loop sólo avanza el estado
+    pool = MonitorPool(SYMBOLS)
     while True:
         try:
-            run_once()
+            run_once(pool)
             time.sleep(5)
         except KeyboardInterrupt:
             break